@@ -0,0 +1,83 @@
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import BaseModel
+from models import User, storage
+from passwords import ALGORITHM, HasherBusy, hasher
+from serializers import encode_user, json_response, user_to_dict
+from sessions import SessionCache
+
+router = APIRouter(prefix="/api/auth", tags=["auth"])
+
+# BLOG_SESSION_TTL - сколько секунд действует вход
+sessions = SessionCache(ttl=float(os.environ.get("BLOG_SESSION_TTL", "3600")))
+SESSION_COOKIE = "session"
+# для несуществующего логина пароль все равно проверяется (с этим хешем),
+# чтобы время ответа не выдавало, есть ли такой пользователь
+MISSING_USER_HASH = f"{ALGORITHM}${hasher.iterations}${'A' * 24}${'A' * 44}"
+
+class LoginRequest(BaseModel):
+    login: str
+    password: str
+
+# токен из Authorization: Bearer ... или из cookie после входа с сайта
+def session_token(request: Request) -> Optional[str]:
+    header = request.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        return header[7:].strip()
+    return request.cookies.get(SESSION_COOKIE)
+
+# пользователь действующей сессии или None
+def session_user(request: Request) -> Optional[User]:
+    token = session_token(request)
+    session = sessions.get(token) if token else None
+    user = storage.get_user_by_id(session.user_id) if session is not None else None
+    if user is None or user.password != session.password:
+        if session is not None:
+            # пользователь удален или сменил пароль
+            sessions.drop(token)
+        return None
+    return user
+
+# текущий пользователь - зависимость для маршрутов, где нужен вход
+def current_user(request: Request) -> User:
+    user = session_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Требуется вход", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+# Вход: пароль проверяется в пуле потоков (passwords.hasher), после
+# этого запросы идут с токеном. Хеш старого вида (открытый текст, меньше
+# итераций) тут же пересчитывается. Очередь пула полна - 503 (см. main.py).
+@router.post("/login")
+async def login(data: LoginRequest, response: Response):
+    user = storage.get_user_by_login(data.login)
+    stored = user.password if user is not None else MISSING_USER_HASH
+    valid = await hasher.verify(data.password, stored)
+    if user is None or not valid:
+        raise HTTPException(status_code=401, detail="Неверный логин или пароль")
+    if hasher.needs_rehash(stored):
+        try:
+            new = await hasher.hash(data.password)
+        except HasherBusy:
+            # пересчитаем при следующем входе
+            new = None
+        if new is not None and storage.replace_password(user.id, stored, new):
+            stored = new
+    session = sessions.create(user.id, stored)
+    response.set_cookie(SESSION_COOKIE, session.token, max_age=int(sessions.ttl),
+                        httponly=True, samesite="lax")
+    return {"token": session.token, "expiresIn": int(sessions.ttl), "user": user_to_dict(user)}
+
+@router.post("/logout")
+async def logout(request: Request, response: Response):
+    token = session_token(request)
+    if token:
+        sessions.drop(token)
+    response.delete_cookie(SESSION_COOKIE)
+    return {"message": "Выход выполнен"}
+
+# пользователь текущей сессии
+@router.get("/me")
+async def get_me(user: User = Depends(current_user)):
+    return json_response(encode_user(user))
@@ -0,0 +1,186 @@
+# Нагрузочный тест приложения целиком (middleware, роутеры, сериализация,
+# шаблоны), без сети: запросы идут в main:app через ASGI-транспорт httpx.
+# Нужен httpx (pip install "httpx<0.28"), в зависимости приложения он не входит.
+#
+#   python benchmarks/bench_http.py --requests 20000 --concurrency 32
+#   python benchmarks/bench_http.py --record trace.ndjson --requests 5000
+#   python benchmarks/bench_http.py --trace benchmarks/traces/mixed.ndjson
+#   python benchmarks/bench_http.py --accept-encoding identity
+#   python benchmarks/bench_http.py --votes form   # голос формой: 303 и страница поста
+#
+# Нагрузка задается трассой: NDJSON-файлом, где первая строка описывает
+# наполнение ({"trace": {"users": ..., "posts": ..., "seed": ...}}), а
+# остальные - запросы ({"name", "method", "path", "json"}). Данные
+# наполняются детерминированно, поэтому id в трассе совпадают при
+# каждом воспроизведении. Без --trace трасса генерируется на лету.
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from common import WORDS, environment, seed, summarize, text, workdir, write_results
+
+# доля запросов каждого вида в сгенерированной трассе
+MIX = (
+    ('GET /api/posts/{post_id}', 40),
+    ('GET /api/posts/', 15),
+    ('GET /', 10),
+    ('GET /posts/{post_id}', 10),
+    ('GET /api/posts/author/{author_id}', 5),
+    ('GET /api/posts/search', 5),
+    ('POST /posts/{post_id}/like', 10),
+    ('POST /api/posts/', 5),
+)
+
+
+def make_request(name: str, rng: random.Random, users: int, posts: int) -> dict:
+    post_id = rng.randint(1, posts)
+    author_id = rng.randint(1, users)
+    request = {'name': name, 'method': name.split()[0]}
+    if name == 'GET /api/posts/{post_id}':
+        request['path'] = f'/api/posts/{post_id}'
+    elif name == 'GET /api/posts/':
+        request['path'] = f'/api/posts/?limit=20&after={rng.randint(0, posts)}'
+    elif name == 'GET /':
+        request['path'] = '/'
+    elif name == 'GET /posts/{post_id}':
+        request['path'] = f'/posts/{post_id}'
+    elif name == 'GET /api/posts/author/{author_id}':
+        request['path'] = f'/api/posts/author/{author_id}'
+    elif name == 'GET /api/posts/search':
+        request['path'] = f'/api/posts/search?q={rng.choice(WORDS)}'
+    elif name == 'POST /posts/{post_id}/like':
+        request['path'] = f'/posts/{post_id}/like'
+    elif name == 'POST /api/posts/':
+        request['path'] = '/api/posts/'
+        request['json'] = {'authorId': author_id, 'title': f'Пост {text(rng, 3)}', 'content': text(rng, 50)}
+    return request
+
+
+def generate_trace(count: int, users: int, posts: int, seed_value: int) -> list:
+    rng = random.Random(seed_value)
+    names = [name for name, weight in MIX]
+    weights = [weight for name, weight in MIX]
+    header = {'trace': {'users': users, 'posts': posts, 'seed': seed_value}}
+    return [header] + [
+        make_request(rng.choices(names, weights)[0], rng, users, posts) for _ in range(count)
+    ]
+
+
+def read_trace(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Как голосует браузер: json - скрипт страницы (Accept: application/json,
+# ответ - счетчики), form - форма без скриптов (303 и переход на страницу
+# поста, она считается в тот же запрос), redirect - только сам POST.
+VOTES = ('json', 'form', 'redirect')
+
+
+async def replay(app, requests: list, concurrency: int, accept_encoding: str, votes: str = 'redirect') -> dict:
+    import httpx
+
+    latencies = {}
+    # байты тел ответов в том виде, в каком они идут по сети (сжатые)
+    transferred = {}
+    statuses = {}
+    queue = iter(requests)
+
+    async def worker(client):
+        for request in queue:
+            headers = {'Accept-Encoding': accept_encoding}
+            vote = request['name'] == 'POST /posts/{post_id}/like'
+            if vote and votes == 'json':
+                headers['Accept'] = 'application/json'
+            started = time.perf_counter()
+            response = await client.request(
+                request['method'], request['path'], json=request.get('json'), headers=headers,
+                follow_redirects=vote and votes == 'form'
+            )
+            elapsed = time.perf_counter() - started
+            downloaded = response.num_bytes_downloaded
+            for previous in response.history:
+                downloaded += previous.num_bytes_downloaded
+            latencies.setdefault(request['name'], []).append(elapsed)
+            transferred[request['name']] = transferred.get(request['name'], 0) + downloaded
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = {'all': summarize([value for values in latencies.values() for value in values], elapsed)}
+    results['all']['bytes'] = sum(transferred.values())
+    for name, values in sorted(latencies.items()):
+        results[name] = summarize(values, elapsed)
+        results[name]['bytes'] = transferred[name]
+        results[name]['bytes_per_request'] = round(transferred[name] / len(values), 1)
+    return {'results': results, 'statuses': statuses}
+
+
+async def run(args, trace: list) -> dict:
+    header = trace[0]['trace']
+    # хранилище и уровень логов выбираются до импорта приложения
+    os.environ['BLOG_STORAGE'] = args.backend
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import main
+
+    # ASGI-транспорт httpx не отправляет lifespan-события, запускаем сами
+    await main.app.router.startup()
+    try:
+        started = time.perf_counter()
+        seed(main.storage, header['users'], header['posts'], random.Random(header['seed']))
+        seed_seconds = time.perf_counter() - started
+        result = await replay(main.app, trace[1:], args.concurrency, args.accept_encoding, args.votes)
+        result['seed_seconds'] = round(seed_seconds, 3)
+        return result
+    finally:
+        await main.app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--trace', help='воспроизвести трассу из NDJSON-файла')
+    parser.add_argument('--record', help='только сгенерировать трассу в файл')
+    parser.add_argument('--accept-encoding', default='gzip, br',
+                        help='Accept-Encoding запросов (identity - без сжатия)')
+    parser.add_argument('--votes', choices=VOTES, default='redirect',
+                        help='как отправляются голоса (см. VOTES)')
+    parser.add_argument('--output', help='куда дополнительно записать JSON с результатами')
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = read_trace(args.trace)
+    else:
+        trace = generate_trace(args.requests, args.users, args.posts, args.seed)
+    if args.record:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            for line in trace:
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+        return
+    output = os.path.abspath(args.output) if args.output else None
+
+    with workdir():
+        result = asyncio.run(run(args, trace))
+
+    write_results({
+        'benchmark': 'http',
+        'environment': environment(**vars(args)),
+        'trace': trace[0]['trace'],
+        **result,
+    }, output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# Сравнение памяти и времени холодного старта: старый загрузчик
+# (json.load всего файла, классы с __dict__, лишние datetime.now())
+# против текущего (потоковый разбор, классы со __slots__).
+#
+#   python benchmarks/bench_load.py --posts 200000
+#   python benchmarks/bench_load.py --posts 1000000 --modes json convert binary
+#
+# Каждый вариант запускается в отдельном процессе, чтобы пиковая память
+# (ru_maxrss) не смешивалась. Текущий загрузчик заодно строит индексы
+# хранилища, которых у старого не было; поисковый индекс строится в фоне,
+# время до его готовности выводится отдельно (search_ready_seconds).
+#
+# Варианты по порядку:
+#   legacy   старый загрузчик
+#   json     текущий загрузчик, JSON-снапшот
+#   convert  первый старт в двоичном формате: чтение JSON и запись .bin
+#   binary   старт с двоичного снапшота
+#   migrate  первый старт в ленивом режиме (BLOG_LAZY_CONTENT=1):
+#            тексты переносятся в файл текстов
+#   lazy     старт в ленивом режиме: в памяти только метаданные и превью
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('legacy', 'json', 'convert', 'binary', 'migrate', 'lazy')
+
+
+def generate(directory: str, count: int, content_size: int):
+    now = datetime.now().isoformat()
+    body = 'Съешь же ещё этих мягких французских булок. ' * (content_size // 45 + 1)
+    posts = {
+        str(i): {
+            'id': i,
+            'authorId': i % 100 + 1,
+            'title': f'Пост номер {i}',
+            'content': body[:content_size],
+            'createdAt': now,
+            'updatedAt': now,
+            'likes': i % 7,
+            'dislikes': i % 3
+        } for i in range(1, count + 1)
+    }
+    with open(os.path.join(directory, 'posts_data.json'), 'w', encoding='utf-8') as f:
+        json.dump({'posts': posts, 'next_post_id': count + 1}, f, indent=2, ensure_ascii=False)
+
+
+# загрузчик в том виде, в каком он был до __slots__ и потокового чтения
+def load_legacy():
+    class Post:
+        def __init__(self, id, authorId, title, content):
+            self.id = id
+            self.authorId = authorId
+            self.title = title
+            self.content = content
+            self.createdAt = datetime.now()
+            self.updatedAt = datetime.now()
+            self.likes = 0
+            self.dislikes = 0
+
+    posts = {}
+    with open('posts_data.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+        for pid, post_data in data['posts'].items():
+            post = Post(post_data['id'], post_data['authorId'], post_data['title'], post_data['content'])
+            post.createdAt = datetime.fromisoformat(post_data['createdAt'])
+            post.updatedAt = datetime.fromisoformat(post_data['updatedAt'])
+            post.likes = post_data.get('likes', 0)
+            post.dislikes = post_data.get('dislikes', 0)
+            posts[post_data['id']] = post
+    return posts
+
+
+def load_current(lazy: bool = False, snapshot_format: str = 'binary'):
+    sys.path.insert(0, ROOT)
+    from content import ContentStore
+    from models import Storage
+    storage = Storage(contents=ContentStore() if lazy else None, snapshot_format=snapshot_format)
+    storage.load_posts_from_file()
+    return storage
+
+
+def run_child(mode: str):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    result = {'mode': mode}
+    if mode == 'legacy':
+        posts = load_legacy()
+        result['seconds'] = round(time.perf_counter() - started, 3)
+    elif mode in ('convert', 'migrate'):
+        # первый запуск в новом формате переписывает снапшот
+        storage = load_current(lazy=mode == 'migrate')
+        storage.close()
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        posts = storage.posts
+    else:
+        storage = load_current(lazy=mode == 'lazy', snapshot_format='json' if mode == 'json' else 'binary')
+        posts = storage.posts
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        # память сразу после загрузки, до того как вырастет поисковый индекс
+        loaded = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['loaded_rss_mb'] = round((loaded - baseline) / 1024, 1)
+        storage.search_index.ready.wait()
+        result['search_ready_seconds'] = round(time.perf_counter() - started, 3)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['posts'] = len(posts)
+    result['peak_rss_mb'] = round(peak / 1024, 1)
+    result['load_rss_mb'] = round((peak - baseline) / 1024, 1)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--content-size', type=int, default=300)
+    parser.add_argument('--modes', nargs='*', choices=MODES, default=MODES,
+                        help='какие варианты запускать (convert нужен перед binary, migrate - перед lazy)')
+    parser.add_argument('--child', choices=('generate',) + MODES)
+    args = parser.parse_args()
+
+    if args.child == 'generate':
+        generate('.', args.posts, args.content_size)
+        return
+    if args.child:
+        run_child(args.child)
+        return
+
+    # на Linux ru_maxrss наследуется при fork, поэтому даже данные
+    # генерируются в отдельном процессе
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', 'generate',
+             '--posts', str(args.posts), '--content-size', str(args.content_size)],
+            cwd=directory, check=True
+        )
+        size_mb = os.path.getsize(os.path.join(directory, 'posts_data.json')) / 2 ** 20
+        print(json.dumps({'file_mb': round(size_mb, 1), 'posts': args.posts}))
+        for mode in MODES:
+            if mode not in args.modes:
+                continue
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode],
+                cwd=directory, check=True
+            )
+            if mode == 'convert':
+                size_mb = os.path.getsize(os.path.join(directory, 'posts_data.bin')) / 2 ** 20
+                print(json.dumps({'bin_file_mb': round(size_mb, 1)}))
+
+
+if __name__ == '__main__':
+    main()
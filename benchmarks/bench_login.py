@@ -0,0 +1,146 @@
+# Бенчмарк входа: пропускная способность POST /api/auth/login при
+# одновременных запросах (PBKDF2 считается в пуле потоков) и задержка
+# обычных запросов в это же время - цикл событий не должен стоять, пока
+# считаются хеши. Для сравнения - запросы с токеном (/api/auth/me): они
+# проверяются кэшем сессий, без хеширования.
+# Нужен httpx (pip install "httpx<0.28"), как и для bench_http.py.
+#
+#   python benchmarks/bench_login.py --logins 200 --concurrency 16
+#   python benchmarks/bench_login.py --workers 4 --iterations 100000
+#
+# В ответах 503 - вход отклонен, потому что очередь пула полна; такие
+# запросы в задержку входа не попадают и считаются отдельно.
+import argparse
+import asyncio
+import os
+import time
+
+from common import environment, summarize, workdir, write_results
+
+# запросов-проб в фоне: задержка GET /api/posts/ без нагрузки и во время входов
+PROBE_PATH = '/api/posts/?limit=20'
+
+
+async def probe(client, latencies: list, stop: asyncio.Event, count: int = None):
+    while not stop.is_set() and (count is None or len(latencies) < count):
+        started = time.perf_counter()
+        await client.get(PROBE_PATH)
+        latencies.append(time.perf_counter() - started)
+        # пробы не должны сами занимать цикл целиком
+        await asyncio.sleep(0.005)
+
+
+async def logins(client, users: int, total: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = {}
+    tokens = []
+    queue = iter(range(total))
+
+    async def worker():
+        for number in queue:
+            login = f'user{number % users}'
+            started = time.perf_counter()
+            response = await client.post('/api/auth/login', json={'login': login, 'password': 'password'})
+            elapsed = time.perf_counter() - started
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code == 200:
+                latencies.append(elapsed)
+                tokens.append(response.json()['token'])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {'latencies': latencies, 'elapsed': time.perf_counter() - started,
+            'statuses': statuses, 'tokens': tokens}
+
+
+async def authenticated(client, tokens: list, total: int, concurrency: int) -> dict:
+    latencies = []
+    queue = iter(range(total))
+
+    async def worker():
+        for number in queue:
+            headers = {'Authorization': f'Bearer {tokens[number % len(tokens)]}'}
+            started = time.perf_counter()
+            response = await client.get('/api/auth/me', headers=headers)
+            assert response.status_code == 200, response.status_code
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run(args) -> dict:
+    # настройки хранилища и пула читаются при импорте приложения
+    os.environ['BLOG_STORAGE'] = args.backend
+    os.environ['BLOG_PBKDF2_ITERATIONS'] = str(args.iterations)
+    if args.workers:
+        os.environ['BLOG_HASH_WORKERS'] = str(args.workers)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import httpx
+    import main
+    from passwords import hash_password, hasher
+
+    await main.app.router.startup()
+    try:
+        # один хеш на всех: соль общая, но проверка стоит столько же
+        stored = hash_password('password', args.iterations)
+        with main.storage.batch():
+            for i in range(args.users):
+                main.storage.create_user(f'user{i}@bench.local', f'user{i}', stored)
+        main.storage.flush()
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            # прогрев: потоки пула запускаются при первом хеше
+            await client.post('/api/auth/login', json={'login': 'user0', 'password': 'password'})
+            idle = []
+            await probe(client, idle, asyncio.Event(), count=args.probes)
+
+            busy = []
+            stop = asyncio.Event()
+            prober = asyncio.create_task(probe(client, busy, stop))
+            login_result = await logins(client, args.users, args.logins, args.concurrency)
+            stop.set()
+            await prober
+
+            me = await authenticated(client, login_result['tokens'], args.logins * 10, args.concurrency)
+        return {
+            'results': {
+                'login': summarize(login_result['latencies'], login_result['elapsed']),
+                'me': me,
+                'probe_idle': summarize(idle, sum(idle)),
+                'probe_during_login': summarize(busy, login_result['elapsed']),
+            },
+            'statuses': login_result['statuses'],
+            'hasher': hasher.stats(),
+        }
+    finally:
+        await main.app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=0, help='потоков для хешей (0 - по числу ядер)')
+    parser.add_argument('--iterations', type=int, default=200_000, help='итераций PBKDF2')
+    parser.add_argument('--probes', type=int, default=200, help='проб без нагрузки')
+    parser.add_argument('--output', help='куда дополнительно записать JSON с результатами')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    with workdir():
+        result = asyncio.run(run(args))
+
+    write_results({
+        'benchmark': 'login',
+        'environment': environment(**vars(args)),
+        **result,
+    }, output)
+
+
+if __name__ == '__main__':
+    main()
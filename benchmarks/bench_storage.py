@@ -0,0 +1,125 @@
+# Микробенчмарк хранилища без HTTP: наполняем его N пользователями и
+# M постами, затем гоняем каждую операцию отдельно и считаем пропускную
+# способность и процентили задержек.
+#
+#   python benchmarks/bench_storage.py --users 1000 --posts 100000
+#   python benchmarks/bench_storage.py --backend sqlite --output sqlite.json
+#
+# Результат - JSON на stdout (и в --output); два таких файла сравнивает
+# benchmarks/compare.py.
+import argparse
+import os
+import random
+import time
+
+from common import WORDS, environment, seed, summarize, text, workdir, write_results
+
+
+def make_storage(backend: str):
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage('bench.db')
+    from models import Storage
+    return Storage()
+
+
+# операции: имя -> функция(хранилище, rng, данные о наполнении)
+def create_post(storage, rng, data):
+    storage.create_post(rng.choice(data['users']), f'Новый пост {text(rng, 3)}', text(rng, 50))
+
+
+def get_post(storage, rng, data):
+    storage.get_post_by_id(rng.randint(1, data['posts']))
+
+
+def list_page(storage, rng, data):
+    storage.get_posts_page(20, after=str(rng.randint(0, data['posts'])))
+
+
+def list_page_by_date(storage, rng, data):
+    storage.get_posts_page(20, order='createdAt')
+
+
+def vote(storage, rng, data):
+    post_id = rng.randint(1, data['posts'])
+    if rng.random() < 0.8:
+        storage.like_post(post_id)
+    else:
+        storage.dislike_post(post_id)
+
+
+def author_posts(storage, rng, data):
+    storage.get_posts_by_author(rng.choice(data['users']))
+
+
+def get_user(storage, rng, data):
+    storage.get_user_by_id(rng.choice(data['users']))
+
+
+def search(storage, rng, data):
+    storage.search_posts(rng.choice(WORDS), 10)
+
+
+OPERATIONS = {
+    'create_post': create_post,
+    'get_post': get_post,
+    'list_page': list_page,
+    'list_page_by_date': list_page_by_date,
+    'vote': vote,
+    'author_posts': author_posts,
+    'get_user': get_user,
+    'search': search,
+}
+
+
+def run(storage, operation, iterations: int, rng: random.Random, data: dict) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        op_started = time.perf_counter()
+        operation(storage, rng, data)
+        latencies.append(time.perf_counter() - op_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', choices=sorted(OPERATIONS), help='запустить только эти операции')
+    parser.add_argument('--output', help='куда дополнительно записать JSON с результатами')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    with workdir():
+        storage = make_storage(args.backend)
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        users = seed(storage, args.users, args.posts, rng)
+        seed_seconds = time.perf_counter() - started
+        data = {'users': users, 'posts': args.posts}
+
+        results = {}
+        for name in args.only or OPERATIONS:
+            # у каждой операции свой генератор, чтобы --only не менял нагрузку
+            results[name] = run(storage, OPERATIONS[name], args.iterations,
+                                random.Random(f'{args.seed}-{name}'), data)
+        # сброс на диск того, что накопили операции записи
+        started = time.perf_counter()
+        storage.flush()
+        results['flush'] = {'seconds': round(time.perf_counter() - started, 4)}
+        storage.close()
+
+    write_results({
+        'benchmark': 'storage',
+        'environment': environment(**vars(args)),
+        'seed_seconds': round(seed_seconds, 3),
+        'results': results,
+    }, output)
+
+
+if __name__ == '__main__':
+    main()
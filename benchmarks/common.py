@@ -0,0 +1,108 @@
+# Общие части бенчмарков: рабочий каталог, наполнение хранилища,
+# статистика задержек и вывод результатов в JSON.
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+WORDS = (
+    'блог пост новости python fastapi хранилище индекс журнал запрос ответ кэш '
+    'страница автор заголовок текст поиск голос лайк скорость память диск сеть'
+).split()
+
+
+# Хранилище пишет файлы в текущий каталог, поэтому бенчмарк работает во
+# временном каталоге и не трогает данные репозитория. Шаблоны и статика
+# подключаются ссылками - они нужны HTTP-бенчмарку.
+@contextlib.contextmanager
+def workdir():
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='blog-bench-') as directory:
+        for name in ('templates', 'static'):
+            source = os.path.join(ROOT, name)
+            if os.path.isdir(source):
+                os.symlink(source, os.path.join(directory, name))
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+# N пользователей и M постов с детерминированным содержимым:
+# при одинаковом seed id и тексты совпадают от запуска к запуску
+def seed(storage, users: int, posts: int, rng: random.Random, content_words: int = 50) -> List[int]:
+    user_ids = []
+    with storage.batch():
+        for i in range(users):
+            user_ids.append(storage.create_user(f'user{i}@bench.local', f'user{i}', 'password').id)
+        for i in range(posts):
+            storage.create_post(rng.choice(user_ids), f'Пост {i} {text(rng, 3)}', text(rng, content_words))
+    storage.flush()
+    return user_ids
+
+
+# процентиль методом ближайшего ранга по отсортированному списку
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+# сводка по задержкам в секундах за прогон длительностью elapsed
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        'mean_ms': round(sum(latencies) / count * 1000, 4) if count else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4) if count else 0.0,
+    }
+
+
+# описание окружения, чтобы результаты разных запусков можно было сопоставить
+def environment(**params) -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+    }
+
+
+def write_results(results: dict, output: str = None):
+    data = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(data + '\n')
+    print(data)
+
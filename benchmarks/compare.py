@@ -0,0 +1,43 @@
+# Сравнение двух результатов bench_storage.py / bench_http.py:
+#
+#   python benchmarks/compare.py before.json after.json
+#
+# Для каждой операции печатает пропускную способность и p99 в обоих
+# прогонах и их отношение (>1 у ops/sec и <1 у p99 - стало лучше).
+import argparse
+import json
+
+
+def load(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def ratio(new: float, old: float) -> str:
+    return f'{new / old:.2f}x' if old else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+    before = load(args.before)['results']
+    after = load(args.after)['results']
+
+    header = f'{"операция":40} {"ops/s было":>12} {"стало":>12} {"":>7} {"p99 мс было":>12} {"стало":>10} {"":>7}'
+    print(header)
+    print('-' * len(header))
+    for name in after:
+        old, new = before.get(name), after[name]
+        if old is None or 'ops_per_sec' not in new:
+            continue
+        print(
+            f'{name:40} {old["ops_per_sec"]:>12} {new["ops_per_sec"]:>12} '
+            f'{ratio(new["ops_per_sec"], old["ops_per_sec"]):>7} '
+            f'{old["p99_ms"]:>12} {new["p99_ms"]:>10} {ratio(new["p99_ms"], old["p99_ms"]):>7}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# Стресс-тест хранилища: много потоков одновременно создают, меняют,
+# удаляют посты и голосуют, пока фоновые потоки журналов снимают
+# снапшоты. Потом проверяется согласованность данных в памяти и после
+# перезагрузки с диска.
+#
+#   python benchmarks/stress_storage.py --threads 16 --operations 2000
+#   python benchmarks/stress_storage.py --backend sqlite
+#   python benchmarks/stress_storage.py --lazy-content
+#
+# При нарушениях печатает их и завершается с кодом 1.
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+from common import environment, text, workdir, write_results
+from ranking import top_key, trending_key
+
+
+def make_storage(backend: str, lazy_content: bool = False):
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage('stress.db')
+    from content import ContentStore
+    from models import Storage
+    # файл текстов переписывается при каждом снапшоте с мусором
+    contents = ContentStore(rewrite_min=0) if lazy_content else None
+    storage = Storage(votes_flush_interval=0.05, contents=contents)
+    storage.load_users_from_file()
+    storage.load_posts_from_file()
+    return storage
+
+
+# Что сделал один поток: по этим данным потом сверяется итог
+class Worker(threading.Thread):
+    def __init__(self, storage, number: int, operations: int, users: list, shared: list, seed: int):
+        super().__init__(name=f'stress-{number}')
+        self.storage = storage
+        self.number = number
+        self.operations = operations
+        self.users = users
+        # id постов всех потоков: голосуют и правят чужие посты тоже
+        self.shared = shared
+        self.rng = random.Random(f'{seed}-{number}')
+        self.created = []
+        self.deleted = set()
+        # id поста -> [лайки, дизлайки], засчитанные хранилищем
+        self.votes = {}
+        # голоса с отпечатком: (id поста, голосующий) -> последний голос;
+        # у каждого потока свои голосующие, повторы и смены голоса
+        # засчитываются как один голос
+        self.voted = {}
+        self.duplicate_user = None
+        self.error = None
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            self.error = e
+
+    def _run(self):
+        rng = self.rng
+        # все потоки пытаются создать одного и того же пользователя -
+        # получиться должно ровно у одного
+        try:
+            self.duplicate_user = self.storage.create_user('shared@stress.local', 'shared', 'password').id
+        except ValueError:
+            pass
+        for _ in range(self.operations):
+            action = rng.random()
+            if action < 0.35 or not self.shared:
+                post = self.storage.create_post(rng.choice(self.users), f'{self.number}', text(rng, 10))
+                self.created.append(post.id)
+                self.shared.append(post.id)
+            elif action < 0.75:
+                post_id = rng.choice(self.shared)
+                field = 0 if rng.random() < 0.7 else 1
+                vote = self.storage.like_post if field == 0 else self.storage.dislike_post
+                if rng.random() < 0.5:
+                    voter = f'{self.number}-{rng.randrange(5)}'.encode()
+                    if vote(post_id, voter):
+                        self.voted[(post_id, voter)] = field
+                elif vote(post_id):
+                    self.votes.setdefault(post_id, [0, 0])[field] += 1
+            elif action < 0.9:
+                # заголовок и текст меняются вместе: разъехаться они могут
+                # только при гонке
+                tag = f'{self.number}-{rng.randint(0, 10 ** 6)}'
+                self.storage.update_post(rng.choice(self.shared), tag, f'{tag} {text(rng, 10)}')
+            else:
+                # удаляем только свои посты, чтобы знать, что должно остаться
+                alive = [pid for pid in self.created[-20:] if pid not in self.deleted]
+                if alive:
+                    post_id = rng.choice(alive)
+                    if self.storage.delete_post(post_id):
+                        self.deleted.add(post_id)
+
+
+# снапшоты во время записи - то, ради чего копирование идет под блокировкой
+def compactor(storage, stop: threading.Event, interval: float):
+    while not stop.wait(interval):
+        storage.users_log.compact()
+        storage.posts_log.compact()
+
+
+def snapshot_state(storage) -> dict:
+    return {
+        post.id: (post.authorId, post.title, post.content, post.likes, post.dislikes)
+        for chunk in storage.iter_posts() for post in chunk
+    }
+
+
+def check(storage, workers: list, errors: list) -> dict:
+    for worker in workers:
+        if worker.error is not None:
+            errors.append(f'{worker.name}: {worker.error!r}')
+
+    created = [pid for worker in workers for pid in worker.created]
+    if len(created) != len(set(created)):
+        errors.append(f'повторяющиеся id постов: {len(created) - len(set(created))}')
+    deleted = set().union(*(worker.deleted for worker in workers))
+    expected = set(created) - deleted
+    state = snapshot_state(storage)
+    if set(state) != expected:
+        errors.append(
+            f'посты: лишних {len(set(state) - expected)}, пропавших {len(expected - set(state))}'
+        )
+    if storage.count_posts() != len(state):
+        errors.append(f'count_posts() = {storage.count_posts()}, обходом {len(state)}')
+
+    winners = [worker.duplicate_user for worker in workers if worker.duplicate_user is not None]
+    if len(winners) != 1:
+        errors.append(f'пользователь shared создан {len(winners)} раз')
+
+    votes = {}
+    for worker in workers:
+        for post_id, (likes, dislikes) in worker.votes.items():
+            total = votes.setdefault(post_id, [0, 0])
+            total[0] += likes
+            total[1] += dislikes
+        for (post_id, voter), field in worker.voted.items():
+            votes.setdefault(post_id, [0, 0])[field] += 1
+    for post_id, (author_id, title, content, likes, dislikes) in state.items():
+        if (likes, dislikes) != tuple(votes.get(post_id, (0, 0))):
+            errors.append(f'пост {post_id}: голоса {likes}/{dislikes}, ожидалось {votes.get(post_id)}')
+        if '-' in title and not content.startswith(title + ' '):
+            errors.append(f'пост {post_id}: заголовок {title!r} не от того текста')
+
+    by_author = {}
+    for post_id, (author_id, *_) in state.items():
+        by_author.setdefault(author_id, []).append(post_id)
+    for author_id, post_ids in by_author.items():
+        try:
+            indexed = sorted(post.id for post in storage.get_posts_by_author(author_id))
+        except KeyError as e:
+            errors.append(f'индекс автора {author_id} ссылается на удаленный пост {e}')
+            continue
+        if indexed != sorted(post_ids):
+            errors.append(f'индекс автора {author_id} расходится с данными')
+    check_rankings(storage, errors)
+    return state
+
+
+# рейтинги, обновляемые при каждом голосе, должны совпасть с сортировкой с нуля
+def check_rankings(storage, errors: list, where: str = ''):
+    posts = storage.get_all_posts()
+    for name, key, ranked in (('top', top_key, storage.get_top_posts),
+                              ('trending', trending_key, storage.get_trending_posts)):
+        expected = [post.id for post in sorted(posts, key=key)]
+        if [post.id for post in ranked(len(posts))] != expected:
+            errors.append(f'рейтинг {name}{where} расходится с данными')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=2000, help='операций на поток')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--compact-interval', type=float, default=0.2,
+                        help='как часто принудительно сворачивать журналы (только json)')
+    parser.add_argument('--lazy-content', action='store_true',
+                        help='тексты постов в файле (BLOG_LAZY_CONTENT, только json)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='куда дополнительно записать JSON с результатами')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    # переключения потоков почаще, чтобы гонки проявлялись
+    sys.setswitchinterval(1e-5)
+
+    errors = []
+    with workdir():
+        storage = make_storage(args.backend, args.lazy_content)
+        users = [storage.create_user(f'user{i}@stress.local', f'user{i}', 'password').id
+                 for i in range(args.users)]
+        shared = []
+        workers = [Worker(storage, i, args.operations, users, shared, args.seed)
+                   for i in range(args.threads)]
+        stop = threading.Event()
+        background = []
+        if args.backend == 'json':
+            background.append(threading.Thread(
+                target=compactor, args=(storage, stop, args.compact_interval), daemon=True
+            ))
+
+        started = time.perf_counter()
+        for thread in background + workers:
+            thread.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in background:
+            thread.join()
+
+        state = check(storage, workers, errors)
+        storage.flush()
+        storage.close()
+
+        # все, что было в памяти, должно восстановиться с диска
+        reloaded = make_storage(args.backend, args.lazy_content)
+        if snapshot_state(reloaded) != state:
+            errors.append('после перезагрузки данные отличаются от данных в памяти')
+        check_rankings(reloaded, errors, ' после перезагрузки')
+        if reloaded.count_users() != args.users + 1:
+            errors.append(f'после перезагрузки пользователей {reloaded.count_users()}, ожидалось {args.users + 1}')
+        reloaded.close()
+
+    total = args.threads * args.operations
+    write_results({
+        'benchmark': 'stress',
+        'environment': environment(**vars(args)),
+        'operations': total,
+        'seconds': round(elapsed, 3),
+        'ops_per_sec': round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        'posts': len(state),
+        'errors': errors[:50],
+    }, output)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
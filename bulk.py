@@ -0,0 +1,172 @@
+import json
+import tempfile
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from models import storage
+
+NDJSON = 'application/x-ndjson'
+# столько элементов применяется в одной транзакции / одной пачке журнала
+CHUNK_SIZE = 1000
+# результаты NDJSON-импорта копятся в памяти до этого размера, дальше - на диске
+SPOOL_SIZE = 1 << 20
+
+
+# Строка NDJSON, которую не удалось разобрать
+class InvalidItem:
+    def __init__(self, error: str):
+        self.error = error
+
+
+def is_ndjson(request: Request) -> bool:
+    return request.headers.get('content-type', '').startswith(NDJSON)
+
+
+# Элементы тела пакетного запроса: JSON-массив (или {"items": [...]})
+# либо NDJSON. NDJSON читается из сокета по мере поступления, так что
+# импорт любого размера не держит в памяти больше одной порции.
+async def iter_items(request: Request) -> AsyncIterator[Any]:
+    if is_ndjson(request):
+        tail = b''
+        async for chunk in request.stream():
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        if tail.strip():
+            yield _parse_line(tail)
+        return
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Некорректный JSON')
+    if isinstance(body, dict):
+        body = body.get('items')
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail='Ожидается массив элементов')
+    for item in body:
+        yield item
+
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return InvalidItem('Некорректная строка JSON')
+
+
+# проверить элемент моделью запроса; (модель, None) или (None, ошибка)
+def validate(model, item: Any) -> Tuple[Optional[BaseModel], Optional[str]]:
+    if not isinstance(item, dict):
+        return None, 'Ожидается объект'
+    try:
+        return model(**item), None
+    except ValidationError as error:
+        return None, '; '.join(detail['msg'] for detail in error.errors())
+
+
+# id из элемента пакетного удаления: число или {"id": число}
+def item_id(item: Any) -> Optional[int]:
+    if isinstance(item, dict):
+        item = item.get('id')
+    if isinstance(item, int) and not isinstance(item, bool):
+        return item
+    return None
+
+
+# удалить по id каждого элемента порции
+def delete_items(chunk: List[Tuple[int, Any]], delete: Callable[[int], bool], not_found: str) -> List[dict]:
+    results = []
+    for index, item in chunk:
+        obj_id = item_id(item)
+        if obj_id is None:
+            results.append(item_result(index, 422, error='Ожидается id'))
+        elif delete(obj_id):
+            results.append(item_result(index, 200, obj_id))
+        else:
+            results.append(item_result(index, 404, obj_id, not_found))
+    return results
+
+
+def item_result(index: int, status: int, obj_id: Optional[int] = None,
+                error: Optional[str] = None) -> dict:
+    result = {'index': index, 'status': status}
+    if obj_id is not None:
+        result['id'] = obj_id
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+# Выполнить пакетный запрос.
+# apply получает порцию [(номер, элемент)] и возвращает результаты по
+# каждому элементу. Порция применяется внутри storage.batch(), то есть
+# одной транзакцией SQLite или одной пачкой журнала, после чего ждем,
+# пока она окажется на диске.
+# На JSON-запрос отвечаем JSON-объектом со сводкой и результатами,
+# на NDJSON - потоком результатов по строке на элемент.
+# prepare - асинхронная подготовка порции перед транзакцией (внутри
+# storage.batch() отдавать управление циклу событий нельзя)
+async def run_bulk(request: Request, apply: Callable[[List[Tuple[int, Any]]], List[dict]],
+                   prepare: Optional[Callable[[List[Tuple[int, Any]]], Awaitable[None]]] = None):
+    ndjson = is_ndjson(request)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) if ndjson else None
+    results = []
+    counts = {'succeeded': 0, 'failed': 0}
+
+    def emit(result: dict):
+        counts['succeeded' if result['status'] < 400 else 'failed'] += 1
+        if ndjson:
+            spool.write(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n')
+        else:
+            results.append(result)
+
+    async def apply_chunk(chunk: List[Tuple[int, Any]]):
+        valid = []
+        chunk_results = []
+        for index, item in chunk:
+            if isinstance(item, InvalidItem):
+                chunk_results.append(item_result(index, 400, error=item.error))
+            else:
+                valid.append((index, item))
+        if prepare is not None:
+            await prepare(valid)
+        with storage.batch():
+            chunk_results.extend(apply(valid))
+        await storage.flush_async()
+        chunk_results.sort(key=lambda result: result['index'])
+        for result in chunk_results:
+            emit(result)
+
+    try:
+        chunk = []
+        index = 0
+        async for item in iter_items(request):
+            chunk.append((index, item))
+            index += 1
+            if len(chunk) >= CHUNK_SIZE:
+                await apply_chunk(chunk)
+                chunk = []
+        if chunk:
+            await apply_chunk(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    if not ndjson:
+        return JSONResponse({**counts, 'results': results})
+
+    def stream():
+        with spool:
+            spool.seek(0)
+            while True:
+                data = spool.read(1 << 16)
+                if not data:
+                    break
+                yield data
+
+    headers = {'X-Succeeded': str(counts['succeeded']), 'X-Failed': str(counts['failed'])}
+    return StreamingResponse(stream(), media_type=NDJSON, headers=headers)
@@ -0,0 +1,210 @@
+import gzip
+from collections import OrderedDict
+from typing import Optional
+
+# brotli сжимает HTML и JSON лучше gzip, но необязателен
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжатие ответов (gzip, brotli) по Accept-Encoding.
+# Сжимаются только ответы, тело которых пришло целиком одним сообщением:
+# потоковые ответы (экспорт, NDJSON, text/event-stream) идут как есть,
+# чтобы не копить их в памяти и не задерживать куски, которые клиент ждет
+# сразу. Маленькие тела не сжимаются - выигрыш меньше заголовков.
+#
+# Страницы и JSON чаще всего отдаются из кэшей одними и теми же байтами,
+# поэтому сжатые тела ответов со строгим ETag запоминаются: повторный
+# ответ не сжимается заново.
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'
+)
+
+
+# кодировки из Accept-Encoding с ненулевым q
+def accepted_encodings(header: str) -> set:
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    if not header:
+        return None
+    encodings = accepted_encodings(header)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    # mtime=0: одинаковое тело сжимается в одинаковые байты
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+# LRU сжатых тел: (ETag, кодировка) -> (исходное тело, сжатое).
+# Исходное тело сверяется целиком, поэтому совпадение ETag у разных
+# ответов не приведет к чужому телу. Используется только из цикла событий.
+class CompressedCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, body: bytes) -> Optional[bytes]:
+        item = self._items.get(key)
+        if item is None or item[0] != body:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, body: bytes, compressed: bytes):
+        size = len(body) + len(compressed)
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[0]) + len(old[1])
+        self._items[key] = (body, compressed)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (old_body, old_compressed) = self._items.popitem(last=False)
+            self._bytes -= len(old_body) + len(old_compressed)
+
+    def stats(self) -> dict:
+        return {'size': len(self._items), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def _header(headers: list, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressible(headers: list) -> bool:
+    content_type = _header(headers, b'content-type')
+    if content_type is None:
+        return False
+    content_type = content_type.decode('latin-1').split(';')[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES or content_type.endswith('+json')
+
+
+# Accept-Encoding в Vary, к уже перечисленным там заголовкам
+def _vary_start(start: dict) -> dict:
+    headers = []
+    vary = None
+    for key, value in start['headers']:
+        if key.lower() == b'vary':
+            vary = value
+            continue
+        headers.append((key, value))
+    headers.append((b'vary', vary + b', Accept-Encoding' if vary else b'Accept-Encoding'))
+    return {**start, 'headers': headers}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 512, gzip_level: int = 4, brotli_quality: int = 4,
+                 cache: Optional[CompressedCache] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for key, value in scope['headers']:
+            if key == b'accept-encoding':
+                accept = value.decode('latin-1')
+                break
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                # заголовки придержим до первого куска тела: только по нему
+                # видно, пришел ли ответ целиком
+                start = message
+                return
+            if message['type'] != 'http.response.body' or start is None:
+                await send(message)
+                return
+            pending, start = start, None
+            body = message.get('body', b'')
+            if not message.get('more_body', False) and self._should_compress(pending, body):
+                body = self._compress(pending, body, encoding)
+                pending = self._compressed_start(pending, encoding, len(body))
+                message = {'type': 'http.response.body', 'body': body}
+            elif pending['status'] == 304 or _compressible(pending['headers']):
+                # несжатый ответ (маленький, потоковый, 304) тоже зависит от
+                # Accept-Encoding: полный ответ этому клиенту пришел бы сжатым
+                pending = _vary_start(pending)
+            await send(pending)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compress(self, start: dict, body: bytes, encoding: str) -> bytes:
+        etag = _header(start['headers'], b'etag')
+        if self.cache is None or etag is None or etag.startswith(b'W/'):
+            return compress(body, encoding, self.gzip_level, self.brotli_quality)
+        key = (etag, encoding)
+        compressed = self.cache.get(key, body)
+        if compressed is None:
+            compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            self.cache.put(key, body, compressed)
+        return compressed
+
+    def _should_compress(self, start: dict, body: bytes) -> bool:
+        if len(body) < self.minimum_size:
+            return False
+        headers = start['headers']
+        if _header(headers, b'content-encoding') is not None:
+            return False
+        return _compressible(headers)
+
+    @staticmethod
+    def _compressed_start(start: dict, encoding: str, length: int) -> dict:
+        headers = []
+        for key, value in start['headers']:
+            name = key.lower()
+            if name == b'content-length':
+                continue
+            if name == b'etag' and not value.startswith(b'W/'):
+                # сжатое тело - другие байты, строгий ETag становится слабым;
+                # проверка If-None-Match принимает обе формы
+                value = b'W/' + value
+            headers.append((key, value))
+        headers.append((b'content-encoding', encoding.encode('latin-1')))
+        headers.append((b'content-length', str(length).encode('latin-1')))
+        return _vary_start({**start, 'headers': headers})
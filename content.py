@@ -0,0 +1,184 @@
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+from wal import fsync_dir
+
+
+# Ленивое хранение текстов постов (BLOG_LAZY_CONTENT=1).
+# В памяти остаются только метаданные и превью, а полные тексты лежат
+# подряд в файле posts_content.<поколение>.bin и читаются через mmap по
+# смещению и длине, которые снапшот хранит вместо самого текста. Прочитанные
+# тексты держит LRU-кэш, так что популярные посты не декодируются заново.
+#
+# Файл только дописывается: при снапшоте туда уходят тексты новых и
+# измененных постов (до этого они лежат в памяти и в журнале). Старые
+# версии и удаленные посты остаются мусором; когда его становится больше,
+# чем живых текстов, снапшот переписывает все тексты в файл следующего
+# поколения, а старый удаляется после замены снапшота.
+
+
+# LRU-кэш прочитанных текстов с ограничением по суммарной длине
+class ContentCache:
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: str):
+        if len(value) > self.max_chars:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._chars -= len(old)
+            self._items[key] = value
+            self._chars += len(value)
+            while self._chars > self.max_chars:
+                _, evicted = self._items.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._items), 'chars': self._chars,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# Один файл текстов. Ссылка на текст - кортеж (файл, смещение, длина в байтах)
+class ContentFile:
+    def __init__(self, path: str, cache: Optional[ContentCache] = None):
+        self.path = path
+        self.cache = cache
+        self._lock = threading.Lock()
+        # None после retire: дальше тексты читаются только из отображения
+        self._file = open(path, 'a+b')
+        self._map: Optional[mmap.mmap] = None
+
+    @property
+    def size(self) -> int:
+        if self._file is None:
+            return len(self._map) if self._map is not None else 0
+        return os.fstat(self._file.fileno()).st_size
+
+    def read(self, offset: int, length: int, cache: bool = True) -> str:
+        if not length:
+            return ''
+        key = (self.path, offset)
+        if cache and self.cache is not None:
+            content = self.cache.get(key)
+            if content is not None:
+                return content
+        data = self._map
+        if data is None or offset + length > len(data):
+            data = self._remap()
+        content = data[offset:offset + length].decode('utf-8')
+        if cache and self.cache is not None:
+            self.cache.put(key, content)
+        return content
+
+    # дописать тексты и сбросить их на диск; возвращает ссылки на них
+    def append(self, contents: List[str]) -> List[Tuple['ContentFile', int, int]]:
+        refs = []
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            for content in contents:
+                data = content.encode('utf-8')
+                self._file.write(data)
+                refs.append((self, offset, len(data)))
+                offset += len(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return refs
+
+    # отображение пересоздается, когда файл дорос дальше него
+    def _remap(self) -> mmap.mmap:
+        with self._lock:
+            if self._file is None:
+                # выведенный из оборота файл отображен целиком (см. retire)
+                if self._map is None:
+                    raise ValueError(f'Файл текстов {self.path} уже удален')
+                return self._map
+            size = self.size
+            if self._map is None or len(self._map) < size:
+                self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            return self._map
+
+    # Закрыть файл и удалить его. В выведенный из оборота файл больше не
+    # пишут, поэтому перед закрытием он отображается целиком: другой поток
+    # мог уже взять ссылку на текст из этого файла и прочитает его из
+    # отображения. Отображение не закрывается явно, оно освободится вместе
+    # с последней такой ссылкой.
+    def retire(self):
+        with self._lock:
+            size = self.size
+            if size and (self._map is None or len(self._map) < size):
+                self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            # на Windows отображенный файл не удалить - уберем при запуске
+            pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+# Поколения файлов текстов: posts_content.1.bin, posts_content.2.bin, ...
+class ContentStore:
+    def __init__(self, prefix: str = 'posts_content', cache_chars: int = 32 * 1024 * 1024,
+                 rewrite_min: int = 16 * 1024 * 1024):
+        self.prefix = prefix
+        self.cache = ContentCache(cache_chars)
+        # переписывать файл, только если мусора больше rewrite_min байт
+        self.rewrite_min = rewrite_min
+        self.current: Optional[ContentFile] = None
+        self._pattern = re.compile(re.escape(prefix) + r'\.(\d+)\.bin$')
+
+    # открыть файл, на который ссылается снапшот
+    def open(self, path: str) -> ContentFile:
+        if self.current is None or self.current.path != path:
+            self.current = ContentFile(path, self.cache)
+        return self.current
+
+    # начать новое поколение; прежний файл остается до замены снапшота
+    def new_file(self) -> ContentFile:
+        generations = [int(m.group(1)) for m in map(self._pattern.match, os.listdir('.')) if m]
+        path = f'{self.prefix}.{max(generations, default=0) + 1}.bin'
+        self.current = ContentFile(path, self.cache)
+        fsync_dir(path)
+        return self.current
+
+    # удалить файлы, на которые не ссылается текущий снапшот
+    # (остатки переписывания, прерванного сбоем)
+    def remove_unused(self):
+        for name in os.listdir('.'):
+            if self._pattern.match(name) and (self.current is None or name != self.current.path):
+                os.remove(name)
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
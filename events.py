@@ -0,0 +1,172 @@
+import asyncio
+from collections import OrderedDict
+from typing import AsyncIterator, FrozenSet, Optional
+from serializers import dumps, votes_to_dict
+
+# Живая лента для страниц (/api/events, text/event-stream): новые счетчики
+# голосов и новые посты.
+#
+# Хранилище вызывает подписчиков в том потоке, где прошло изменение (пул
+# обработчиков, фоновые потоки), а SSE-ответы живут в цикле событий.
+# Поэтому событие строится и кодируется один раз в потоке изменения, а в
+# цикл передается через call_soon_threadsafe - там оно раскладывается по
+# очередям клиентов.
+#
+# Очереди ограничены, чтобы медленный клиент не копил события без предела.
+# В событии голосов полные счетчики, поэтому голоса по одному посту
+# схлопываются: в очереди остается только последнее. Если очередь все же
+# переполнилась (много новых постов), она очищается и клиент получает
+# событие reset - страницу надо перечитать.
+
+# событий в очереди одного клиента
+MAX_PENDING = 256
+# одновременных клиентов; сверх этого /api/events отвечает 503
+MAX_SUBSCRIBERS = 1000
+# комментарий-пинг, если событий долго нет: иначе прокси закрывают соединение
+KEEPALIVE = 15.0
+# через сколько миллисекунд браузер переподключается после обрыва
+RETRY = 3000
+
+
+def frame(name: str, data: dict) -> bytes:
+    return b'event: ' + name.encode('ascii') + b'\ndata: ' + dumps(data) + b'\n\n'
+
+
+def new_post_to_dict(post) -> dict:
+    return {
+        "id": post.id,
+        "authorId": post.authorId,
+        "authorLogin": post.authorLogin,
+        "title": post.title,
+        "preview": post.preview,
+        "createdAt": post.createdAt.isoformat()
+    }
+
+
+# Очередь одного клиента: (событие, id поста) -> (версия, закодированное
+# событие). Используется только из цикла событий.
+class Subscription:
+    def __init__(self, post_ids: Optional[FrozenSet[int]], new_posts: bool, max_pending: int):
+        # None - голоса по всем постам
+        self.post_ids = post_ids
+        self.new_posts = new_posts
+        self.max_pending = max_pending
+        self.closed = False
+        self._pending: OrderedDict = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def wants(self, name: str, post_id: int) -> bool:
+        if name == 'post':
+            return self.new_posts
+        return self.post_ids is None or post_id in self.post_ids
+
+    # возвращает 'coalesced', 'dropped' или None
+    def put(self, name: str, post_id: int, version: int, data: bytes) -> Optional[str]:
+        key = (name, post_id)
+        old = self._pending.get(key)
+        result = None
+        if old is not None:
+            # события строятся в разных потоках и могут прийти не по порядку
+            if old[0] >= version:
+                return 'coalesced'
+            result = 'coalesced'
+        elif len(self._pending) >= self.max_pending:
+            self._pending.clear()
+            self._pending[('reset', 0)] = (0, frame('reset', {}))
+            result = 'dropped'
+        self._pending[key] = (version, data)
+        self._ready.set()
+        return result
+
+    # накопленные события одним куском; пустой - если за timeout ничего не было
+    async def get(self, timeout: float) -> bytes:
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        data = b''.join(data for version, data in self._pending.values())
+        self._pending.clear()
+        return data
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class EventBus:
+    def __init__(self, storage, max_pending: int = MAX_PENDING, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.storage = storage
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def is_full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    # подписчик хранилища, вызывается из любого потока
+    def on_change(self, kind: str, action: str, obj_id: int):
+        # пока слушателей нет, пост не читаем
+        loop = self._loop
+        if kind != 'post' or action not in ('vote', 'create') or not self._subscribers or loop is None:
+            return
+        post = self.storage.get_post_by_id(obj_id)
+        if post is None:
+            return
+        if action == 'vote':
+            name, data = 'vote', frame('vote', votes_to_dict(post))
+        else:
+            name, data = 'post', frame('post', new_post_to_dict(post))
+        try:
+            loop.call_soon_threadsafe(self._publish, name, obj_id, post.version, data)
+        except RuntimeError:
+            # цикл событий уже закрыт
+            pass
+
+    def _publish(self, name: str, post_id: int, version: int, data: bytes):
+        self.published += 1
+        for subscription in self._subscribers:
+            if not subscription.wants(name, post_id):
+                continue
+            result = subscription.put(name, post_id, version, data)
+            if result == 'coalesced':
+                self.coalesced += 1
+            elif result == 'dropped':
+                self.dropped += 1
+
+    # Поток событий для StreamingResponse. Подписка оформляется при первом
+    # чтении и снимается, когда клиент отключился (генератор отменяется).
+    async def stream(self, post_ids: Optional[FrozenSet[int]] = None,
+                     new_posts: bool = False) -> AsyncIterator[bytes]:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(post_ids, new_posts, self.max_pending)
+        self._subscribers.add(subscription)
+        try:
+            yield f'retry: {RETRY}\n\n'.encode('ascii')
+            while not subscription.closed:
+                data = await subscription.get(KEEPALIVE)
+                if data:
+                    self.delivered += 1
+                yield data or b': ping\n\n'
+        finally:
+            self._subscribers.discard(subscription)
+
+    # завершает потоки всех клиентов (при остановке сервера)
+    def close(self):
+        for subscription in list(self._subscribers):
+            subscription.close()
+
+    def stats(self) -> dict:
+        return {
+            'subscribers': len(self._subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped
+        }
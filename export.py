@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List
+from fastapi.responses import StreamingResponse
+from serializers import dumps
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+# Потоковая выгрузка: порции записей из хранилища кодируются по одной
+# и сразу уходят клиенту, так что в памяти лежит не больше одной порции.
+# Генератор асинхронный, и следующая порция читается в потоке цикла
+# событий, то есть между запросами, а не параллельно с ними.
+async def _stream(chunks: Iterator[List[Any]], to_dict: Callable[[Any], dict],
+                  fmt: str) -> AsyncIterator[bytes]:
+    first = True
+    if fmt == 'json':
+        yield b'['
+    for chunk in chunks:
+        lines = [dumps(to_dict(item)) for item in chunk]
+        if fmt == 'json':
+            data = b','.join(lines)
+            if not first:
+                data = b',' + data
+        else:
+            data = b'\n'.join(lines) + b'\n'
+        first = False
+        yield data
+        # дать поработать остальным запросам
+        await asyncio.sleep(0)
+    if fmt == 'json':
+        yield b']'
+
+
+def export_response(chunks: Iterable[List[Any]], to_dict: Callable[[Any], dict],
+                    fmt: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        _stream(iter(chunks), to_dict, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{name}.{fmt}"'}
+    )
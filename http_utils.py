@@ -0,0 +1,139 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+from fastapi import Request, Response
+from indexes import Page
+from voter_tokens import voter_tokens
+
+
+# Ссылки на соседние страницы в заголовках Link / X-Next-Cursor,
+# чтобы тело ответа осталось прежним списком
+def set_page_headers(request: Request, response: Response, page: Page):
+    links = []
+    if page.next_cursor is not None:
+        url = request.url.remove_query_params('before').include_query_params(after=page.next_cursor)
+        links.append(f'<{url}>; rel="next"')
+        response.headers['X-Next-Cursor'] = page.next_cursor
+    if page.prev_cursor is not None:
+        url = request.url.remove_query_params('after').include_query_params(before=page.prev_cursor)
+        links.append(f'<{url}>; rel="prev"')
+        response.headers['X-Prev-Cursor'] = page.prev_cursor
+    if links:
+        response.headers['Link'] = ', '.join(links)
+
+
+# ETag по произвольным частям (версии записей, курсоры и т.п.)
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+# ETag одной записи: id и номер версии
+def record_etag(kind: str, record) -> str:
+    return f'"{kind}-{record.id}-{record.version}"'
+
+# ETag списка записей: id и версии всех записей плюс курсоры страницы
+def items_etag(kind: str, items: Iterable, *extra) -> str:
+    return make_etag(kind, tuple((item.id, item.version) for item in items), *extra)
+
+# версия автора поста: от нее зависят ответы и страницы, где показан автор
+def author_version(post) -> Optional[int]:
+    return post.author.version if post.author is not None else None
+
+# ETag поста с автором (?include=author)
+def post_etag(post, with_author: bool = False) -> str:
+    if not with_author:
+        return record_etag('post', post)
+    return f'"post-{post.id}-{post.version}-author-{author_version(post)}"'
+
+# ETag списка постов; с авторами в него входят и их версии
+def posts_etag(kind: str, posts: Iterable, with_author: bool, *extra) -> str:
+    if not with_author:
+        return items_etag(kind, posts, *extra)
+    return make_etag(
+        kind + '+author', tuple((post.id, post.version, author_version(post)) for post in posts), *extra
+    )
+
+# клиент просит JSON вместо страницы или перенаправления (fetch из скриптов)
+def wants_json(request: Request) -> bool:
+    return 'application/json' in request.headers.get('accept', '')
+
+# Кто голосует: голоса одного голосующего считаются по одному на пост.
+# Голосующий - вошедший пользователь (user_id из сессии), иначе подписанная
+# метка из cookie (voter_tokens.py), ставится при просмотре страниц. Без
+# действующей метки (клиенты без cookie, скрипты, метка без подписи)
+# голосующий определяется только по адресу: все, что клиент присылает
+# сам, он может менять от запроса к запросу.
+VOTER_COOKIE = 'voter'
+VOTER_COOKIE_AGE = 365 * 24 * 3600
+
+def client_host(request: Request) -> str:
+    return request.client.host if request.client else ''
+
+def voter_token(request: Request) -> Optional[str]:
+    token = request.cookies.get(VOTER_COOKIE)
+    return voter_tokens.verify(token) if token else None
+
+def voter_fingerprint(request: Request, user_id: Optional[int] = None) -> bytes:
+    if user_id is not None:
+        source = f'user:{user_id}'
+    else:
+        token = voter_token(request)
+        source = 'cookie:' + token if token is not None else 'client:' + client_host(request)
+    return hashlib.blake2b(source.encode('utf-8'), digest_size=16).digest()
+
+def set_voter_cookie(request: Request, response: Response):
+    if voter_token(request) is not None:
+        return
+    token = voter_tokens.issue(client_host(request))
+    if token is not None:
+        response.set_cookie(VOTER_COOKIE, token, max_age=VOTER_COOKIE_AGE,
+                            httponly=True, samesite='lax')
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+# Заголовки-валидаторы ответа
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+# Условный GET: если у клиента актуальная версия, возвращает ответ 304,
+# иначе проставляет валидаторы в response и возвращает None.
+# Тело ответа при этом не строится. 304 несет и заголовки, уже
+# проставленные обработчиком в response (Link, X-Next-Cursor и т.п.),
+# кроме описывающих тело.
+def check_conditional(request: Request, response: Response, etag: str,
+                      last_modified: Optional[datetime] = None) -> Optional[Response]:
+    headers = validator_headers(etag, last_modified)
+    # ответы с валидаторами перепроверяются перед каждым использованием
+    if 'cache-control' not in response.headers:
+        headers['Cache-Control'] = 'no-cache'
+    if is_not_modified(request, etag, last_modified):
+        not_modified = Response(status_code=304, headers=headers)
+        not_modified.raw_headers.extend(
+            (name, value) for name, value in response.raw_headers
+            if name not in (b'content-length', b'content-type')
+        )
+        return not_modified
+    response.headers.update(headers)
+    return None
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-None-Match важнее If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
@@ -0,0 +1,127 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Iterator, List, Optional
+
+
+# Отсортированный индекс ключей.
+# Ключи хранятся кусками по ~load штук, поэтому вставка и удаление стоят
+# O(log n + load), а выборка страницы после/до ключа - O(log n + limit).
+class SortedIndex:
+    def __init__(self, load: int = 512):
+        self.load = load
+        self._lists: List[list] = []
+        self._maxes: list = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Any]:
+        for sub in self._lists:
+            yield from sub
+
+    def __contains__(self, key) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        sub = self._lists[i]
+        j = bisect_left(sub, key)
+        return j < len(sub) and sub[j] == key
+
+    # заменить содержимое индекса отсортированными ключами (при загрузке)
+    def rebuild(self, keys):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + self.load] for i in range(0, len(keys), self.load)]
+        self._maxes = [sub[-1] for sub in self._lists]
+        self._len = len(keys)
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._maxes):
+                # самый частый случай - новый ключ больше всех
+                i -= 1
+                self._lists[i].append(key)
+                self._maxes[i] = key
+            else:
+                insort(self._lists[i], key)
+            if len(self._lists[i]) > self.load * 2:
+                sub = self._lists[i]
+                self._lists[i:i + 1] = [sub[:self.load], sub[self.load:]]
+                self._maxes[i:i + 1] = [sub[self.load - 1], sub[-1]]
+        self._len += 1
+
+    def remove(self, key) -> bool:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        sub = self._lists[i]
+        j = bisect_left(sub, key)
+        if j == len(sub) or sub[j] != key:
+            return False
+        del sub[j]
+        if not sub:
+            del self._lists[i]
+            del self._maxes[i]
+        else:
+            self._maxes[i] = sub[-1]
+        self._len -= 1
+        return True
+
+    # до limit ключей строго больше key (или с начала, если key не задан)
+    def after(self, key=None, limit: int = 20) -> list:
+        result = []
+        if key is None:
+            i, j = 0, 0
+        else:
+            i = bisect_right(self._maxes, key)
+            j = bisect_right(self._lists[i], key) if i < len(self._lists) else 0
+        while i < len(self._lists) and len(result) < limit:
+            sub = self._lists[i]
+            result.extend(sub[j:j + limit - len(result)])
+            i, j = i + 1, 0
+        return result
+
+    # до limit ключей строго меньше key (или с конца), по возрастанию
+    def before(self, key=None, limit: int = 20) -> list:
+        result = []
+        if key is None:
+            i = len(self._lists) - 1
+            j = len(self._lists[i]) if self._lists else 0
+        else:
+            i = bisect_left(self._maxes, key)
+            if i == len(self._lists):
+                i -= 1
+                j = len(self._lists[i]) if self._lists else 0
+            else:
+                j = bisect_left(self._lists[i], key)
+        while i >= 0 and len(result) < limit:
+            sub = self._lists[i]
+            start = max(0, j - (limit - len(result)))
+            result[:0] = sub[start:j]
+            i -= 1
+            if i >= 0:
+                j = len(self._lists[i])
+        return result
+
+    # страница по ключу курсора: (ключи, есть ли следующая, есть ли предыдущая)
+    def page(self, limit: int, after=None, before=None):
+        if before is not None:
+            keys = self.before(before, limit)
+        else:
+            keys = self.after(after, limit)
+        if not keys:
+            return keys, False, False
+        has_next = bool(self.after(keys[-1], 1))
+        has_prev = bool(self.before(keys[0], 1))
+        return keys, has_next, has_prev
+
+
+# Страница выборки по курсору
+class Page:
+    def __init__(self, items: list, next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Any, Dict, Iterator, TextIO, Tuple
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# сканер значений из стандартного декодера, без лишних проверок raw_decode
+_scan = json.JSONDecoder().scan_once
+
+
+# Потоковое чтение JSON-файла вида {"<items_key>": {"1": {...}, ...}, ...}.
+# Записи коллекции items_key отдаются по одной, по мере чтения файла,
+# поэтому в памяти никогда не лежит весь разобранный документ.
+# Остальные поля верхнего уровня (например, next_post_id) складываются
+# в словарь fields.
+def iter_members(f: TextIO, items_key: str, fields: Dict[str, Any],
+                 chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+    reader = _Reader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == items_key and reader.peek() == '{':
+            reader.expect('{')
+            if reader.peek() != '}':
+                while True:
+                    member = reader.value()
+                    reader.expect(':')
+                    yield member, reader.value()
+                    if reader.next_separator() == '}':
+                        break
+            else:
+                reader.expect('}')
+        else:
+            fields[key] = reader.value()
+        if reader.next_separator() == '}':
+            return
+
+
+class _Reader:
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        self._skip_whitespace()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f'Ожидался символ {char!r} в позиции {self.pos}')
+        self.pos += 1
+
+    # ',' или закрывающая скобка после значения
+    def next_separator(self) -> str:
+        char = self.peek()
+        if char not in (',', '}'):
+            raise ValueError(f'Неожиданный символ {char!r} в позиции {self.pos}')
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = _scan(self.buf, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                if self.eof:
+                    raise ValueError(f'Некорректный JSON в позиции {self.pos}')
+                self._fill()
+                continue
+            # число в конце буфера может быть обрезано - дочитываем
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def _skip_whitespace(self):
+        if self.pos < len(self.buf) and self.buf[self.pos] not in ' \t\n\r':
+            return
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return
+            self._fill()
+
+    # дочитать файл; размер порции растет вместе с буфером, чтобы длинная
+    # запись не разбиралась заново слишком много раз
+    def _fill(self):
+        size = max(self.chunk_size, len(self.buf) - self.pos)
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
@@ -1,10 +1,35 @@
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from typing import List, Optional
+from fastapi import FastAPI, Request, Form, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from models import storage
-from routers import users, posts
+from page_cache import PageCache
+from compression import CompressedCache, CompressionMiddleware
+from static_files import FingerprintedStaticFiles
+from events import EventBus
+from rendering import bytecode_cache, stream_template, warm_up
+from passwords import HasherBusy, hasher, is_hashed
+from voter_tokens import voter_tokens
+import metrics
+import serializers
+from http_utils import (
+    author_version, is_not_modified, make_etag, set_voter_cookie, validator_headers, voter_fingerprint, wants_json
+)
+from routers import users, posts, auth
+import asyncio
+import logging
+import os
+import time
+import uuid
 import uvicorn
 
+# уровень логирования задается переменной LOG_LEVEL (DEBUG, INFO, WARNING...)
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("blog")
+
 # Главное приложение
 app = FastAPI(
     title="Blog API",
@@ -12,22 +37,103 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# общие стили отдаются отдельным файлом с отпечатком в имени:
+# браузер кэширует его навсегда и не получает заново с каждой страницей
+static = FingerprintedStaticFiles(directory="static")
+app.mount("/static", static, name="static")
+
 # работа с HTML шаблонами
-templates = Jinja2Templates(directory="templates")
+# BLOG_TEMPLATE_CACHE - каталог кэша байткода шаблонов (пусто - без кэша),
+# BLOG_TEMPLATE_RELOAD=1 - проверять изменения файлов шаблонов на каждом
+# запросе (для разработки); по умолчанию шаблоны читаются один раз
+templates = Jinja2Templates(
+    directory="templates",
+    bytecode_cache=bytecode_cache(os.environ.get("BLOG_TEMPLATE_CACHE", ".template_cache")),
+    auto_reload=os.environ.get("BLOG_TEMPLATE_RELOAD", "0") == "1"
+)
+templates.env.globals["static_url"] = static.url
+metrics.instrument_templates(templates.env)
+
+# сжатие HTML и JSON; потоковые ответы идут без сжатия
+compressed_cache = CompressedCache(max_bytes=16 * 1024 * 1024)
+app.add_middleware(CompressionMiddleware, cache=compressed_cache)
+# число запросов и латентность по маршрутам (добавлен последним - снаружи,
+# поэтому учитывает и время сжатия)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# метка запуска процесса для ETag HTML-страниц
+BOOT_ID = uuid.uuid4().hex
+# BLOG_STREAM_PAGES=0 - отдавать страницы целиком, без потоковой отрисовки
+STREAM_PAGES = os.environ.get("BLOG_STREAM_PAGES", "1") == "1"
+
+# кэш отрисованных страниц, сбрасывается изменениями в хранилище
+page_cache = PageCache(maxsize=512)
+storage.add_listener(page_cache.on_change)
+storage.add_listener(serializers.on_change)
+
+# живые обновления страниц: голоса и новые посты (/api/events)
+events = EventBus(storage)
+storage.add_listener(events.on_change)
+
+# метрики, которые считаются при чтении /metrics
+metrics.Gauge(
+    "blog_records", "Число записей в хранилище",
+    lambda: [(("users",), storage.count_users()), (("posts",), storage.count_posts())],
+    labels=("collection",)
+)
+
+# кэш текстов постов есть только у JSON-хранилища в ленивом режиме
+contents = getattr(storage, "contents", None)
 
-# Подключаем API для пользователей и постов
+def _cache_samples(field: str):
+    encoded = {"posts": serializers.posts_cache.stats(), "users": serializers.users_cache.stats()}
+    samples = [(("pages",), page_cache.stats()[field])]
+    samples.extend(((f"encoded_{name}",), stats[field]) for name, stats in encoded.items())
+    samples.append((("compressed",), compressed_cache.stats()[field]))
+    if contents is not None:
+        samples.append((("content",), contents.cache.stats()[field]))
+    return samples
+
+metrics.Gauge("cache_hits_total", "Попадания в кэши", lambda: _cache_samples("hits"),
+              labels=("cache",), kind="counter")
+metrics.Gauge("cache_misses_total", "Промахи кэшей", lambda: _cache_samples("misses"),
+              labels=("cache",), kind="counter")
+metrics.Gauge("cache_entries", "Число записей в кэшах", lambda: _cache_samples("size"),
+              labels=("cache",))
+metrics.Gauge("page_cache_bytes", "Размер кэша страниц в байтах",
+              lambda: [((), page_cache.stats()["bytes"])])
+metrics.Gauge("sse_subscribers", "Клиенты, подключенные к /api/events",
+              lambda: [((), events.stats()["subscribers"])])
+metrics.Gauge("sse_events_total", "События /api/events: опубликованные, отправленные "
+              "клиентам, схлопнутые в очереди и сброшенные при переполнении",
+              lambda: [((name,), value) for name, value in events.stats().items() if name != "subscribers"],
+              labels=("result",), kind="counter")
+
+# Подключаем API для пользователей, постов и входа
 app.include_router(users.router)
 app.include_router(posts.router)
+app.include_router(auth.router)
+
+# очередь пула хешей паролей полна - клиенту лучше повторить позже,
+# чем ждать в растущей очереди
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    return JSONResponse({"detail": "Сервер занят, повторите позже"}, status_code=503,
+                        headers={"Retry-After": "1"})
 
-def create_test_user():
+async def create_test_user():
     # Создает тестового пользователя при первом запуске
     users = storage.get_all_users()
     if not users:
-        user = storage.create_user("test@mail.ru", "testuser", "123456")
-        print(f"✅ Создан тестовый пользователь: ID {user.id}")
+        try:
+            user = storage.create_user("test@mail.ru", "testuser", await hasher.hash("123456"))
+        except ValueError:
+            # при нескольких воркерах его мог успеть создать соседний процесс
+            user = storage.get_user_by_login("testuser")
+        logger.info("Создан тестовый пользователь: id=%s", user.id)
         return user.id
     else:
-        print(f"✅ Пользователи уже есть. ID первого: {users[0].id}")
+        logger.info("Пользователи уже есть, id первого=%s", users[0].id)
         return users[0].id
 
 # Запускается при старте приложения
@@ -36,20 +142,132 @@ async def startup_event():
     # Загружаем данные из файлов
     storage.load_users_from_file()
     storage.load_posts_from_file()
-    user_id = create_test_user()
-    print("✅ Данные загружены из файлов")
-    print(f"🎯 Тестовый пользователь ID: {user_id}")
-    print("✅ Сервер запущен: http://localhost:8000")
-    print("✅ Документация API: http://localhost:8000/docs")
+    started = time.perf_counter()
+    count = warm_up(templates.env)
+    logger.info("Шаблоны загружены: %s за %.1f мс", count, (time.perf_counter() - started) * 1000)
+    user_id = await create_test_user()
+    logger.info("Данные загружены: пользователей=%s, постов=%s",
+                storage.count_users(), storage.count_posts())
+    logger.info("Тестовый пользователь: id=%s", user_id)
+    global rehash_task
+    rehash_task = asyncio.create_task(rehash_plain_passwords())
+
+# Пароли, сохраненные до появления хешей, заменяются хешами в фоне, по
+# одному: пул при этом остается доступен для входа. Кто войдет раньше,
+# получит хеш при входе (auth.login).
+rehash_task = None
+
+async def rehash_plain_passwords():
+    plain = [(user.id, user.password) for chunk in storage.iter_users()
+             for user in chunk if not is_hashed(user.password)]
+    if plain:
+        logger.info("Паролей без хеша: %s, пересчитываем в фоне", len(plain))
+    done = 0
+    for user_id, password in plain:
+        while True:
+            try:
+                new = await hasher.hash(password)
+                break
+            except HasherBusy:
+                await asyncio.sleep(1)
+        if storage.replace_password(user_id, password, new):
+            done += 1
+    if plain:
+        logger.info("Пароли пересчитаны: %s", done)
+
+# Запускается при остановке приложения
+@app.on_event("shutdown")
+async def shutdown_event():
+    # завершаем потоки событий, чтобы клиенты переподключились к новому процессу
+    events.close()
+    if rehash_task is not None:
+        rehash_task.cancel()
+    hasher.close()
+    # Сбрасываем журналы изменений на диск и сворачиваем их в снапшот,
+    # чтобы следующий старт читал только его
+    storage.close()
+
+# Сколько постов показывать на одной странице
+POSTS_PER_PAGE = 20
+
+# Отрисовка страницы через кэш: key должен включать версии показанных
+# записей, tags - записи, изменение которых делает страницу устаревшей
+def render_cached(request: Request, key, tags, name: str, context: dict):
+    # ETag страницы выводится из того же ключа, поэтому 304 отдается
+    # без отрисовки; BOOT_ID сбрасывает ETag после перезапуска (новые шаблоны)
+    headers = validator_headers(make_etag(BOOT_ID, key))
+    headers["Cache-Control"] = "no-cache"
+    if is_not_modified(request, headers["ETag"], None):
+        response = Response(status_code=304, headers=headers)
+    else:
+        body = page_cache.get(key)
+        if body is None and STREAM_PAGES:
+            # первая отрисовка уходит клиенту по кускам, тело - в кэш
+            chunks = stream_template(templates.get_template(name), {"request": request, **context},
+                                     lambda body: page_cache.put(key, body, tags))
+            response = StreamingResponse(chunks, media_type="text/html", headers=headers)
+        else:
+            if body is None:
+                html = templates.get_template(name).render({"request": request, **context})
+                body = html.encode("utf-8")
+                page_cache.put(key, body, tags)
+            response = HTMLResponse(body, headers=headers)
+    # метка для учета голосов: сама страница от нее не зависит
+    set_voter_cookie(request, response)
+    return response
+
+# Страница списка постов (главная)
+def render_index(request: Request, message: Optional[str] = None,
+                 after: Optional[str] = None, before: Optional[str] = None):
+    try:
+        page = storage.get_posts_page(POSTS_PER_PAGE, after=after, before=before)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    context = {
+        "request": request,
+        "posts": page.items,
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor
+    }
+    if message:
+        # страницы с сообщением не кэшируем
+        context["message"] = message
+        return templates.TemplateResponse("index.html", context)
+    # на странице показаны логины авторов - их версии тоже входят в ключ
+    key = (
+        "index",
+        tuple((post.id, post.version, author_version(post)) for post in page.items),
+        page.next_cursor,
+        page.prev_cursor
+    )
+    tags = [("post", post.id) for post in page.items]
+    tags.extend({("user", post.authorId) for post in page.items})
+    return render_cached(request, key, tags, "index.html", context)
 
 # Главная страница со списком постов
 @app.get("/", response_class=HTMLResponse)
-async def home_page(request: Request):
-    all_posts = storage.get_all_posts()
-    return templates.TemplateResponse("index.html", {
-        "request": request, 
-        "posts": all_posts
-    })
+async def home_page(request: Request, after: Optional[str] = None, before: Optional[str] = None):
+    return render_index(request, after=after, before=before)
+
+# Метрики в формате Prometheus
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Статистика кэша страниц
+@app.get("/api/stats/cache")
+async def cache_stats():
+    stats = page_cache.stats()
+    stats["encodedPosts"] = serializers.posts_cache.stats()
+    stats["encodedUsers"] = serializers.users_cache.stats()
+    stats["compressed"] = compressed_cache.stats()
+    stats["events"] = events.stats()
+    stats["sessions"] = auth.sessions.stats()
+    stats["hasher"] = hasher.stats()
+    stats["voterTokens"] = voter_tokens.stats()
+    if contents is not None:
+        stats["content"] = contents.cache.stats()
+    return stats
 
 # Страница создания пользователя
 @app.get("/users/create", response_class=HTMLResponse)
@@ -65,19 +283,14 @@ async def create_user_handler(
     password: str = Form(...)
 ):
     try:
-        print(f"🔧 Создаем пользователя: {email}, {login}")
-        user = storage.create_user(email, login, password)
-        print(f"✅ Пользователь создан: ID {user.id}")
+        logger.debug("Создание пользователя: email=%s, login=%s", email, login)
+        user = storage.create_user(email, login, await hasher.hash(password))
+        logger.info("Пользователь создан: id=%s", user.id)
         
-        all_posts = storage.get_all_posts()
-        return templates.TemplateResponse("index.html", {
-            "request": request, 
-            "posts": all_posts,
-            "message": f"Пользователь '{login}' успешно создан! ID: {user.id}"
-        })
+        return render_index(request, f"Пользователь '{login}' успешно создан! ID: {user.id}")
     except Exception as error:
         error_msg = f"Ошибка при создании пользователя: {str(error)}"
-        print(f"❌ {error_msg}")
+        logger.warning(error_msg)
         return templates.TemplateResponse("create_user.html", {
             "request": request,
             "error": error_msg
@@ -102,12 +315,12 @@ async def create_post_handler(
     content: str = Form(...)
 ):
     try:
-        print(f"🔧 Получены данные: authorId={authorId}, title='{title}'")
+        logger.debug("Создание поста: authorId=%s, title=%r", authorId, title)
 
         author = storage.get_user_by_id(authorId)
         if not author:
             error_msg = f"Автор с ID {authorId} не найден"
-            print(f"❌ {error_msg}")
+            logger.warning(error_msg)
             users = storage.get_all_users()
             return templates.TemplateResponse("create_post.html", {
                 "request": request,
@@ -117,17 +330,12 @@ async def create_post_handler(
         
         # Создаем пост
         post = storage.create_post(authorId, title, content)
-        print(f"✅ Пост создан: ID {post.id}")
+        logger.info("Пост создан: id=%s", post.id)
         
-        all_posts = storage.get_all_posts()
-        return templates.TemplateResponse("index.html", {
-            "request": request, 
-            "posts": all_posts,
-            "message": f"Пост '{title}' успешно создан!"
-        })
+        return render_index(request, f"Пост '{title}' успешно создан!")
     except Exception as error:
         error_msg = f"Ошибка при создании поста: {str(error)}"
-        print(f"❌ {error_msg}")
+        logger.warning(error_msg)
         users = storage.get_all_users()
         return templates.TemplateResponse("create_post.html", {
             "request": request,
@@ -142,10 +350,11 @@ async def view_post_page(request: Request, post_id: int):
     if not post:
         raise HTTPException(status_code=404, detail="Пост не найден")
     
-    return templates.TemplateResponse("post.html", {
-        "request": request, 
-        "post": post
-    })
+    return render_cached(
+        request, ("post", post.id, post.version, author_version(post)),
+        [("post", post.id), ("user", post.authorId)],
+        "post.html", {"post": post}
+    )
 
 # Страница редактирования поста
 @app.get("/posts/{post_id}/edit", response_class=HTMLResponse)
@@ -171,12 +380,7 @@ async def edit_post_handler(
     if not post:
         raise HTTPException(status_code=404, detail="Пост не найден")
     
-    all_posts = storage.get_all_posts()
-    return templates.TemplateResponse("index.html", {
-        "request": request, 
-        "posts": all_posts,
-        "message": "Пост успешно обновлен!"
-    })
+    return render_index(request, "Пост успешно обновлен!")
 
 # Удаление поста
 @app.post("/posts/{post_id}/delete")
@@ -188,23 +392,58 @@ async def delete_post_handler(post_id: int):
     # Возвращаем на главную страницу
     return RedirectResponse(url="/", status_code=303)
 
-# Лайк поста
-@app.post("/posts/{post_id}/like")
-async def like_post_handler(post_id: int):
-    success = storage.like_post(post_id)
+# Ответ на голос: форма без скриптов получает перенаправление на страницу
+# поста, скрипт страницы (Accept: application/json) - только новые счетчики,
+# без повторного запроса и отрисовки страницы. Повторный голос того же
+# клиента не засчитывается, ответ тот же - с текущими счетчиками.
+def vote_response(request: Request, post_id: int, success: bool):
     if not success:
         raise HTTPException(status_code=404, detail="Пост не найден")
+    if not wants_json(request):
+        return RedirectResponse(url=f"/posts/{post_id}", status_code=303)
+    post = storage.get_post_by_id(post_id)
+    if not post:
+        # удален сразу после голоса
+        raise HTTPException(status_code=404, detail="Пост не найден")
+    return Response(serializers.dumps(serializers.votes_to_dict(post)), media_type="application/json")
 
-    return RedirectResponse(url=f"/posts/{post_id}", status_code=303)
+# голосующий: вошедший пользователь, иначе метка из cookie или адрес
+def voter(request: Request) -> bytes:
+    user = auth.session_user(request)
+    return voter_fingerprint(request, user.id if user is not None else None)
+
+# Лайк поста
+@app.post("/posts/{post_id}/like")
+async def like_post_handler(request: Request, post_id: int):
+    return vote_response(request, post_id, storage.like_post(post_id, voter(request)))
 
 # Дизлайк поста
 @app.post("/posts/{post_id}/dislike")
-async def dislike_post_handler(post_id: int):
-    success = storage.dislike_post(post_id)
-    if not success:
-        raise HTTPException(status_code=404, detail="Пост не найден")
+async def dislike_post_handler(request: Request, post_id: int):
+    return vote_response(request, post_id, storage.dislike_post(post_id, voter(request)))
 
-    return RedirectResponse(url=f"/posts/{post_id}", status_code=303)
+# Сколько постов можно отслеживать одним подключением к /api/events
+MAX_EVENT_POSTS = 100
+
+# Поток событий (Server-Sent Events): vote - новые счетчики голосов поста,
+# post - новый пост (если new=true), reset - события потеряны, страницу
+# надо перечитать. post=ID (можно несколько) - голоса только этих постов;
+# без post и new - голоса всех постов.
+@app.get("/api/events")
+async def events_stream(post: Optional[List[int]] = Query(None), new: bool = False):
+    if post is not None and len(post) > MAX_EVENT_POSTS:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_EVENT_POSTS} постов")
+    if events.is_full():
+        raise HTTPException(status_code=503, detail="Слишком много подключений", headers={"Retry-After": "5"})
+    if post is not None:
+        post_ids = frozenset(post)
+    else:
+        post_ids = frozenset() if new else None
+    return StreamingResponse(
+        events.stream(post_ids, new), media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить поток в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Запуск сервера
 if __name__ == "__main__":
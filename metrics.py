@@ -0,0 +1,231 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Метрики в текстовом формате Prometheus.
+# Запись метрики - это захват блокировки и пара арифметических операций,
+# поэтому ее можно делать на каждом запросе; все форматирование происходит
+# только при чтении /metrics.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # значения меток -> [счетчики по корзинам (не накопительные), сумма, количество]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    # контекстный менеджер для замера блока кода
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for label_values, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+# Значения, которые дешевле посчитать при чтении метрик, чем поддерживать:
+# размеры данных, статистика кэшей. collect возвращает [(значения меток, число)].
+class Gauge:
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Iterable[Tuple[tuple, float]]],
+                 labels: Sequence[str] = (), kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.kind = kind
+        self.collect = collect
+        registry.register(self)
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self.collect():
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+REQUESTS = Counter('http_requests_total', 'Число HTTP-запросов', ('method', 'route', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки HTTP-запроса', ('method', 'route'))
+STORAGE_LATENCY = Histogram('storage_operation_duration_seconds', 'Время операций хранилища', ('operation',))
+SNAPSHOT_LATENCY = Histogram('storage_snapshot_duration_seconds', 'Время записи снапшота', ('file',))
+SNAPSHOT_BYTES = Counter('storage_snapshot_bytes_total', 'Записано байт в снапшоты', ('file',))
+WAL_BYTES = Counter('storage_wal_bytes_total', 'Записано байт в журналы изменений', ('file',))
+WAL_FSYNC_LATENCY = Histogram('storage_wal_fsync_duration_seconds', 'Время fsync пачки журнала', ('file',))
+TEMPLATE_LATENCY = Histogram('template_render_duration_seconds', 'Время отрисовки шаблонов', ('template',))
+DUPLICATE_VOTES = Counter('duplicate_votes_total', 'Отклоненные повторные голоса')
+
+
+# Обернуть методы объекта замером времени (для хранилища - в create_storage)
+def instrument(obj, methods: Iterable[str], histogram: Histogram = STORAGE_LATENCY):
+    for name in methods:
+        setattr(obj, name, timed(histogram, name)(getattr(obj, name)))
+    return obj
+
+
+def timed(histogram: Histogram, *label_values):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *label_values)
+        return wrapper
+    return decorator
+
+
+# Замер отрисовки всех шаблонов окружения Jinja. Класс шаблона подменяется
+# до загрузки шаблонов, поэтому под замер попадает и TemplateResponse.
+def instrument_templates(env):
+    base = env.template_class
+
+    class TimedTemplate(base):
+        def render(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                TEMPLATE_LATENCY.observe(time.perf_counter() - started, self.name or '<string>')
+
+    env.template_class = TimedTemplate
+
+
+# ASGI-middleware: число запросов и латентность по шаблону маршрута
+# (/api/posts/{post_id}), а не по фактическому пути, чтобы не плодить метки.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            method = scope['method']
+            REQUEST_LATENCY.observe(time.perf_counter() - started, method, path)
+            REQUESTS.inc(method, path, str(status))
+
+
+def render() -> str:
+    return registry.render()
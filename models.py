@@ -1,192 +1,1193 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
+import asyncio
+import itertools
 import json
 import os
+import threading
+from content import ContentFile, ContentStore
+from counters import VoteCounters
+from indexes import Page, SortedIndex
+from jsonstream import iter_members
+from metrics import DUPLICATE_VOTES, SNAPSHOT_BYTES, SNAPSHOT_LATENCY, instrument
+from ranking import key_id, top_key, trending_key
+from search import SearchIndex
+from snapshot import (
+    POSTS_MAGIC, USERS_MAGIC, Snapshot, read_voters, write_posts, write_users, write_voter_pages, write_voters
+)
+from voters import DEFAULT_SLOTS, FIELDS, NONE, PAGE_SIZE, VOTES, VoterSlots
+from wal import WriteAheadLog, fsync_dir
+
+# форматы снапшотов: двоичный (snapshot.py) читается при старте в разы
+# быстрее, JSON остается для импорта и выгрузки
+SNAPSHOT_FORMATS = ('binary', 'json')
 
 # Класс пользователя
 class User:
-    def __init__(self, id: int, email: str, login: str, password: str):
+    __slots__ = ('id', 'email', 'login', 'password', 'createdAt', 'updatedAt', 'version')
+
+    def __init__(self, id: int, email: str, login: str, password: str,
+                 createdAt: Optional[datetime] = None, updatedAt: Optional[datetime] = None,
+                 version: int = 0):
         self.id = id
         self.email = email
         self.login = login
         self.password = password
-        self.createdAt = datetime.now()
-        self.updatedAt = datetime.now()
+        # при загрузке даты передаются готовыми, новые - берем текущее время
+        if createdAt is None:
+            createdAt = datetime.now()
+        self.createdAt = createdAt
+        self.updatedAt = updatedAt if updatedAt is not None else createdAt
+        # номер версии записи, растет при каждом изменении
+        self.version = version
+
+# длина превью поста в списке
+PREVIEW_LENGTH = 200
+# формат дат на страницах
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+def make_preview(content: str) -> str:
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + '...'
+    return content
 
-# Класс поста
+# Класс поста.
+# Кроме данных пост держит производные поля для списков: превью, даты в
+# формате страниц и ссылку на автора, чтобы страница из N постов не
+# делала N поисков автора. Превью и автора поддерживает хранилище, даты
+# форматируются один раз при первом показе.
 class Post:
-    def __init__(self, id: int, authorId: int, title: str, content: str):
+    __slots__ = (
+        'id', 'authorId', 'title', '_content', '_ref', '_preview', 'createdAt', 'updatedAt',
+        'likes', 'dislikes', 'version', 'author', '_created_text', '_updated_text'
+    )
+
+    def __init__(self, id: int, authorId: int, title: str, content: Optional[str],
+                 createdAt: Optional[datetime] = None, updatedAt: Optional[datetime] = None,
+                 likes: int = 0, dislikes: int = 0, version: int = 0,
+                 ref: Optional[tuple] = None, preview: Optional[str] = None):
         self.id = id
         self.authorId = authorId
         self.title = title
-        self.content = content
-        self.createdAt = datetime.now()
-        self.updatedAt = datetime.now()
-        self.likes = 0
-        self.dislikes = 0
-
-# Главное хранилище данных
-class Storage:
+        # текст лежит либо в памяти (_content), либо в файле текстов:
+        # _ref = (ContentFile, смещение, длина), см. content.py
+        self._content = content
+        self._ref = ref
+        self._preview = preview
+        if createdAt is None:
+            createdAt = datetime.now()
+        self.createdAt = createdAt
+        self.updatedAt = updatedAt if updatedAt is not None else createdAt
+        self.likes = likes
+        self.dislikes = dislikes
+        # номер версии записи, растет при каждом изменении (в том числе голосах)
+        self.version = version
+        self.author: Optional[User] = None
+        self._created_text: Optional[str] = None
+        # (updatedAt, текст): дата сверяется по объекту, поэтому
+        # одновременное изменение не оставит устаревший текст
+        self._updated_text: Optional[tuple] = None
+
+    @property
+    def content(self) -> str:
+        content = self._content
+        if content is None:
+            file, offset, length = self._ref
+            content = file.read(offset, length)
+        return content
+
+    @content.setter
+    def content(self, value: str):
+        # превью ставится раньше текста: читатель не увидит новый текст со старым превью
+        self._preview = make_preview(value)
+        self._content = value
+        self._ref = None
+
+    # начало текста для списка постов; у выгруженных в файл постов
+    # не требует читать текст. Готовое превью ставит хранилище (при
+    # записи текста или при первом показе в списке), пока его нет -
+    # считается на месте
+    @property
+    def preview(self) -> str:
+        preview = self._preview
+        if preview is None:
+            preview = make_preview(self.content)
+        return preview
+
+    @property
+    def createdText(self) -> str:
+        text = self._created_text
+        if text is None:
+            text = self._created_text = self.createdAt.strftime(DATE_FORMAT)
+        return text
+
+    @property
+    def updatedText(self) -> str:
+        updated, cached = self.updatedAt, self._updated_text
+        if cached is not None and cached[0] is updated:
+            return cached[1]
+        text = updated.strftime(DATE_FORMAT)
+        self._updated_text = (updated, text)
+        return text
+
+    @property
+    def authorLogin(self) -> Optional[str]:
+        author = self.author
+        return author.login if author is not None else None
+
+# Интерфейс хранилища: все реализации (JSON в памяти, SQLite)
+# предоставляют одинаковый набор методов
+class StorageBackend(ABC):
     def __init__(self):
+        self._listeners: List[Callable[[str, str, int], None]] = []
+
+    # подписка на изменения: callback(kind, action, id), где kind - 'user'
+    # или 'post', action - 'create', 'update', 'delete' или 'vote'
+    def add_listener(self, callback: Callable[[str, str, int], None]):
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, action: str, obj_id: int):
+        for callback in self._listeners:
+            callback(kind, action, obj_id)
+
+    @abstractmethod
+    def create_user(self, email: str, login: str, password: str) -> User: ...
+
+    @abstractmethod
+    def get_all_users(self) -> List[User]: ...
+
+    @abstractmethod
+    def get_users_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None) -> Page: ...
+
+    # Обход всех пользователей порциями по возрастанию id (для экспорта).
+    # Каждая порция выбирается заново по ключу, поэтому параллельные
+    # изменения не ломают обход, а созданные после его начала записи
+    # в него не попадают.
+    @abstractmethod
+    def iter_users(self, chunk_size: int = 500) -> Iterator[List[User]]: ...
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: int) -> Optional[User]: ...
+
+    # размеры коллекций (для метрик)
+    @abstractmethod
+    def count_users(self) -> int: ...
+
+    @abstractmethod
+    def count_posts(self) -> int: ...
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[User]: ...
+
+    @abstractmethod
+    def get_user_by_login(self, login: str) -> Optional[User]: ...
+
+    # password в create_user / update_user - уже хеш (passwords.py)
+    @abstractmethod
+    def update_user(self, user_id: int, email: str, login: str, password: str) -> Optional[User]: ...
+
+    # замена хеша пароля (пересчет при входе): только если пароль все еще
+    # old - иначе его успели сменить и новый хеш устарел
+    @abstractmethod
+    def replace_password(self, user_id: int, old: str, new: str) -> bool: ...
+
+    @abstractmethod
+    def delete_user(self, user_id: int) -> bool: ...
+
+    @abstractmethod
+    def create_post(self, authorId: int, title: str, content: str) -> Post: ...
+
+    @abstractmethod
+    def get_all_posts(self) -> List[Post]: ...
+
+    @abstractmethod
+    def get_posts_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None, order: str = 'id') -> Page: ...
+
+    @abstractmethod
+    def get_post_by_id(self, post_id: int) -> Optional[Post]: ...
+
+    @abstractmethod
+    def get_posts_by_author(self, authorId: int) -> List[Post]: ...
+
+    # то же для постов, с фильтрами по автору и дате создания
+    @abstractmethod
+    def iter_posts(self, author_id: Optional[int] = None, created_after: Optional[datetime] = None,
+                   chunk_size: int = 500) -> Iterator[List[Post]]: ...
+
+    @abstractmethod
+    def update_post(self, post_id: int, title: str, content: str) -> Optional[Post]: ...
+
+    # полнотекстовый поиск: (всего найдено, [(пост, релевантность)])
+    @abstractmethod
+    def search_posts(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[Post, float]]]: ...
+
+    # лучшие посты по рейтингу и "горячие" (см. ranking.py)
+    @abstractmethod
+    def get_top_posts(self, limit: int) -> List[Post]: ...
+
+    @abstractmethod
+    def get_trending_posts(self, limit: int) -> List[Post]: ...
+
+    @abstractmethod
+    def delete_post(self, post_id: int) -> bool: ...
+
+    # voter - отпечаток голосующего: повторный такой же голос не
+    # засчитывается, противоположный переносит голос; без voter голоса
+    # не проверяются. False - поста нет.
+    @abstractmethod
+    def like_post(self, post_id: int, voter: Optional[bytes] = None) -> bool: ...
+
+    @abstractmethod
+    def dislike_post(self, post_id: int, voter: Optional[bytes] = None) -> bool: ...
+
+    # загрузка данных при старте
+    def load_users_from_file(self):
+        pass
+
+    def load_posts_from_file(self):
+        pass
+
+    # группа изменений, которая сохраняется разом (для пакетных запросов).
+    # Внутри блока нельзя отдавать управление циклу событий: блок
+    # привязан к текущему потоку.
+    def batch(self):
+        return nullcontext()
+
+    # дождаться, пока все изменения окажутся на диске
+    def flush(self):
+        pass
+
+    # то же самое, но не блокируя цикл событий
+    async def flush_async(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    # закрыть хранилище при остановке приложения
+    def close(self):
+        pass
+
+    # курсор - id последнего элемента страницы, для сортировки по дате
+    # к нему добавляется дата создания
+    def _post_cursor(self, post: Post, order: str) -> str:
+        if order == 'createdAt':
+            return f'{post.createdAt.isoformat()}_{post.id}'
+        return str(post.id)
+
+    def _parse_id_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        if cursor is None:
+            return None
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError(f'Некорректный курсор: {cursor}')
+
+    def _parse_created_cursor(self, cursor: Optional[str]):
+        if cursor is None:
+            return None
+        created, _, pid = cursor.rpartition('_')
+        try:
+            return (datetime.fromisoformat(created), int(pid))
+        except ValueError:
+            raise ValueError(f'Некорректный курсор: {cursor}')
+
+# Главное хранилище данных.
+# Обработчики, фоновые потоки журналов и счетчиков обращаются к нему
+# одновременно, поэтому у каждой коллекции своя блокировка: она защищает
+# словарь, его индексы и счетчик id. Если нужны обе, сначала берется
+# блокировка пользователей, потом постов. Подписчики (_notify) вызываются
+# уже после снятия блокировки, а снапшот держит ее только на время
+# копирования списка объектов.
+# Снапшоты лежат в users_data.bin / posts_data.bin или в одноименных .json.
+# Двоичный снапшот, если он есть, главнее JSON: в двоичном режиме JSON не
+# удаляется и остается источником для первого импорта, а в режиме json
+# после записи JSON двоичный файл удаляется.
+class Storage(StorageBackend):
+    def __init__(self, votes_flush_interval: float = 1.0, contents: Optional[ContentStore] = None,
+                 snapshot_format: str = 'binary', snapshot_interval: Optional[float] = None,
+                 vote_slots: int = DEFAULT_SLOTS):
+        super().__init__()
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f'Неизвестный формат снапшотов: {snapshot_format}')
+        self.snapshot_format = snapshot_format
+        self._users_lock = threading.RLock()
+        self._posts_lock = threading.RLock()
         self.users: Dict[int, User] = {}
         self.posts: Dict[int, Post] = {}
         self.next_user_id = 1
         self.next_post_id = 1
+        # отсортированные индексы для постраничной выдачи
+        self.users_by_id = SortedIndex()
+        self.posts_by_id = SortedIndex()
+        self.posts_by_created = SortedIndex()
+        # вторичные индексы: автор -> id постов, email/логин -> id пользователя
+        self.posts_by_author: Dict[int, SortedIndex] = {}
+        # рейтинги: ключи ranking.top_key / trending_key, голос переставляет
+        # пост за O(log n), выборка первых K - O(K)
+        self.posts_by_score = SortedIndex()
+        self.posts_by_hot = SortedIndex()
+        self.users_by_email: Dict[str, int] = {}
+        self.users_by_login: Dict[str, int] = {}
+        # полнотекстовый индекс по заголовкам и текстам постов
+        self.search_index = SearchIndex()
+        # журналы изменений; снапшоты пишутся только при компактизации -
+        # по числу записей, раз в snapshot_interval секунд и при остановке
+        self.users_log = WriteAheadLog('users_data.log', self._save_users_to_file,
+                                       interval=snapshot_interval)
+        self.posts_log = WriteAheadLog('posts_data.log', self._save_posts_to_file,
+                                       interval=snapshot_interval)
+        # голоса попадают в журнал пачками раз в votes_flush_interval секунд
+        self.votes = VoteCounters(self._log_votes, interval=votes_flush_interval)
+        # кто уже голосовал за какой пост (voters.py), под блокировкой постов;
+        # vote_slots=0 - без таблицы (хранилище только читается, как при
+        # переносе в SQLite), повторные голоса тогда не отсеиваются
+        self.voters = VoterSlots(vote_slots) if vote_slots else None
+        self._voter_batches = itertools.count()
+        # voters_data.bin совпадает с таблицей везде, кроме измененных
+        # страниц, - их можно записать на место, не переписывая файл
+        self._voters_on_disk = False
+        # файлы текстов постов в ленивом режиме, иначе тексты в памяти
+        self.contents = contents
     
     # создание пользователя
     def create_user(self, email: str, login: str, password: str) -> User:
-        user = User(self.next_user_id, email, login, password)
-        self.users[self.next_user_id] = user
-        self.next_user_id += 1
-        self._save_users_to_file()
+        with self._users_lock:
+            # проверка уникальности и выдача id - под одной блокировкой
+            self._check_unique(email, login)
+            user = User(self.next_user_id, email, login, password)
+            self.next_user_id += 1
+            self.users[user.id] = user
+            self._index_user(user)
+            self._log_user(user)
+        self._notify('user', 'create', user.id)
         return user
     
     # все пользователи
     def get_all_users(self) -> List[User]:
-        return list(self.users.values())
+        with self._users_lock:
+            return list(self.users.values())
     
+    # страница пользователей по возрастанию id
+    def get_users_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None) -> Page:
+        after_key = self._parse_id_cursor(after)
+        before_key = self._parse_id_cursor(before)
+        with self._users_lock:
+            keys, has_next, has_prev = self.users_by_id.page(limit, after_key, before_key)
+            users = [self.users[uid] for uid in keys]
+        return Page(
+            users,
+            str(users[-1].id) if has_next else None,
+            str(users[0].id) if has_prev else None
+        )
+
+    def iter_users(self, chunk_size: int = 500) -> Iterator[List[User]]:
+        until = self.next_user_id
+        last = None
+        while True:
+            # блокировка берется на порцию, а не на весь обход
+            with self._users_lock:
+                keys = self.users_by_id.after(last, chunk_size)
+                if not keys:
+                    return
+                last = keys[-1]
+                users = [self.users[uid] for uid in keys if uid < until and uid in self.users]
+            if users:
+                yield users
+            if last >= until:
+                return
+
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         return self.users.get(user_id)
 
+    def count_users(self) -> int:
+        return len(self.users)
+
+    def count_posts(self) -> int:
+        return len(self.posts)
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        with self._users_lock:
+            user_id = self.users_by_email.get(email.lower())
+            return self.users.get(user_id) if user_id is not None else None
+
+    def get_user_by_login(self, login: str) -> Optional[User]:
+        with self._users_lock:
+            user_id = self.users_by_login.get(login)
+            return self.users.get(user_id) if user_id is not None else None
+
     def update_user(self, user_id: int, email: str, login: str, password: str) -> Optional[User]:
-        if user_id not in self.users:
-            return None
-        user = self.users[user_id]
-        user.email = email
-        user.login = login
-        user.password = password
-        user.updatedAt = datetime.now()
-        self._save_users_to_file()
+        with self._users_lock:
+            user = self.users.get(user_id)
+            if user is None:
+                return None
+            self._check_unique(email, login, user_id)
+            self._unindex_user(user)
+            user.email = email
+            user.login = login
+            user.password = password
+            user.updatedAt = datetime.now()
+            user.version += 1
+            self._index_user(user)
+            self._log_user(user)
+        self._notify('user', 'update', user.id)
         return user
+
+    # updatedAt не меняется: для пользователя это тот же пароль
+    def replace_password(self, user_id: int, old: str, new: str) -> bool:
+        with self._users_lock:
+            user = self.users.get(user_id)
+            if user is None or user.password != old:
+                return False
+            user.password = new
+            user.version += 1
+            self._log_user(user)
+        self._notify('user', 'update', user_id)
+        return True
     
     # удаление пользователя
     def delete_user(self, user_id: int) -> bool:
-        if user_id in self.users:
-            del self.users[user_id]
-            self._save_users_to_file()
-            return True
-        return False
+        with self._users_lock:
+            user = self.users.pop(user_id, None)
+            if user is None:
+                return False
+            self._unindex_user(user)
+            self._link_author(user_id, None)
+            self.users_log.append(user_id, {'op': 'delete', 'id': user_id})
+        self._notify('user', 'delete', user_id)
+        return True
     
     # создание поста
     def create_post(self, authorId: int, title: str, content: str) -> Post:
-        post = Post(self.next_post_id, authorId, title, content)
-        self.posts[self.next_post_id] = post
-        self.next_post_id += 1
-        self._save_posts_to_file()
+        with self._posts_lock:
+            post = Post(self.next_post_id, authorId, title, content, preview=make_preview(content))
+            post.author = self.users.get(authorId)
+            self.next_post_id += 1
+            self.posts[post.id] = post
+            self._index_post(post)
+            self._log_post(post)
+        self._notify('post', 'create', post.id)
         return post
     
     def get_all_posts(self) -> List[Post]:
-        return list(self.posts.values())
+        with self._posts_lock:
+            return list(self.posts.values())
     
+    # страница постов по id или по дате создания
+    def get_posts_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None, order: str = 'id') -> Page:
+        if order == 'id':
+            index = self.posts_by_id
+            after_key = self._parse_id_cursor(after)
+            before_key = self._parse_id_cursor(before)
+        elif order == 'createdAt':
+            index = self.posts_by_created
+            after_key = self._parse_created_cursor(after)
+            before_key = self._parse_created_cursor(before)
+        else:
+            raise ValueError(f'Неизвестный порядок сортировки: {order}')
+        with self._posts_lock:
+            keys, has_next, has_prev = index.page(limit, after_key, before_key)
+            if order == 'id':
+                posts = [self.posts[pid] for pid in keys]
+            else:
+                posts = [self.posts[pid] for created, pid in keys]
+            # у загруженных с диска постов превью считается при первом
+            # показе, а не при старте: так не растет память под все посты
+            for post in posts:
+                if post._preview is None:
+                    post._preview = make_preview(post._content)
+        return Page(
+            posts,
+            self._post_cursor(posts[-1], order) if has_next else None,
+            self._post_cursor(posts[0], order) if has_prev else None
+        )
+
     def get_post_by_id(self, post_id: int) -> Optional[Post]:
         return self.posts.get(post_id)
     
     def get_posts_by_author(self, authorId: int) -> List[Post]:
-        return [post for post in self.posts.values() if post.authorId == authorId]
+        with self._posts_lock:
+            return [self.posts[pid] for pid in self.posts_by_author.get(authorId, ())]
+
+    def iter_posts(self, author_id: Optional[int] = None, created_after: Optional[datetime] = None,
+                   chunk_size: int = 500) -> Iterator[List[Post]]:
+        until = self.next_post_id
+        last = None
+        while True:
+            with self._posts_lock:
+                # индекс автора берем заново: он удаляется вместе с последним постом
+                if author_id is None:
+                    index = self.posts_by_id
+                else:
+                    index = self.posts_by_author.get(author_id)
+                    if index is None:
+                        return
+                keys = index.after(last, chunk_size)
+                if not keys:
+                    return
+                last = keys[-1]
+                posts = []
+                for pid in keys:
+                    post = self.posts.get(pid)
+                    if post is None or pid >= until:
+                        continue
+                    if created_after is not None and post.createdAt <= created_after:
+                        continue
+                    posts.append(post)
+            if posts:
+                yield posts
+            if last >= until:
+                return
     
     # обновление поста
     def update_post(self, post_id: int, title: str, content: str) -> Optional[Post]:
-        if post_id not in self.posts:
-            return None
-        post = self.posts[post_id]
-        post.title = title
-        post.content = content
-        post.updatedAt = datetime.now()
-        self._save_posts_to_file()
+        with self._posts_lock:
+            post = self.posts.get(post_id)
+            if post is None:
+                return None
+            post.title = title
+            post.content = content
+            post.updatedAt = datetime.now()
+            post.version += 1
+            self.search_index.add(post.id, post.title, post.content)
+            self._log_post(post)
+        self._notify('post', 'update', post.id)
         return post
     
+    def get_top_posts(self, limit: int) -> List[Post]:
+        with self._posts_lock:
+            return [self.posts[key_id(key)] for key in self.posts_by_score.after(None, limit)]
+
+    def get_trending_posts(self, limit: int) -> List[Post]:
+        with self._posts_lock:
+            return [self.posts[key_id(key)] for key in self.posts_by_hot.after(None, limit)]
+
+    def search_posts(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[Post, float]]]:
+        total, found = self.search_index.search(query, limit, offset)
+        # пост могли удалить между поиском и выборкой
+        with self._posts_lock:
+            return total, [(self.posts[pid], score) for pid, score in found if pid in self.posts]
+
     # удаление поста
     def delete_post(self, post_id: int) -> bool:
-        if post_id in self.posts:
-            del self.posts[post_id]
-            self._save_posts_to_file()
-            return True
-        return False
+        with self._posts_lock:
+            post = self.posts.pop(post_id, None)
+            if post is None:
+                return False
+            self._unindex_post(post)
+            self.posts_log.append(post_id, {'op': 'delete', 'id': post_id})
+        self._notify('post', 'delete', post_id)
+        return True
     
     # лайк поста
-    def like_post(self, post_id: int) -> bool:
-        if post_id in self.posts:
-            self.posts[post_id].likes += 1
-            self._save_posts_to_file()
-            return True
-        return False
+    def like_post(self, post_id: int, voter: Optional[bytes] = None) -> bool:
+        return self._vote(post_id, 'likes', voter)
     
     # дизлайк поста
-    def dislike_post(self, post_id: int) -> bool:
-        if post_id in self.posts:
-            self.posts[post_id].dislikes += 1
-            self._save_posts_to_file()
-            return True
-        return False
-    
-    def _save_users_to_file(self):
-        data = {
-            'users': {
-                str(uid): {
-                    'id': user.id,
-                    'email': user.email,
-                    'login': user.login,
-                    'password': user.password,
-                    'createdAt': user.createdAt.isoformat(),
-                    'updatedAt': user.updatedAt.isoformat()
-                } for uid, user in self.users.items()
-            },
-            'next_user_id': self.next_user_id
-        }
-        with open('users_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def dislike_post(self, post_id: int, voter: Optional[bytes] = None) -> bool:
+        return self._vote(post_id, 'dislikes', voter)
+
+    # голос меняет версию поста, поэтому идет под той же блокировкой,
+    # что и обновление: иначе одновременные version += 1 теряются.
+    # Повторный голос отклоняется сразу: ни счетчиков, ни журнала.
+    def _vote(self, post_id: int, field: str, voter: Optional[bytes] = None) -> bool:
+        with self._posts_lock:
+            post = self.posts.get(post_id)
+            if post is None:
+                return False
+            undo = slot = None
+            if voter is not None and self.voters is not None:
+                index, tag = self.voters.locate(post_id, voter)
+                previous = self.voters.get(index, tag)
+                if previous == VOTES[field]:
+                    DUPLICATE_VOTES.inc()
+                    return True
+                if previous != NONE:
+                    undo = FIELDS[previous]
+                slot = (index, self.voters.pack(tag, VOTES[field]))
+                self.voters.set(index, slot[1])
+            self._unrank_post(post)
+            self.votes.increment(post, field, undo, slot)
+            self._rank_post(post)
+        self._notify('post', 'vote', post_id)
+        return True
     
-    def _save_posts_to_file(self):
-        data = {
-            'posts': {
-                str(pid): {
+    # email и логин должны быть уникальны
+    def _check_unique(self, email: str, login: str, user_id: Optional[int] = None):
+        owner = self.users_by_email.get(email.lower())
+        if owner is not None and owner != user_id:
+            raise ValueError(f'Пользователь с email {email} уже существует')
+        owner = self.users_by_login.get(login)
+        if owner is not None and owner != user_id:
+            raise ValueError(f'Пользователь с логином {login} уже существует')
+
+    def _index_user(self, user: User):
+        self.users_by_id.add(user.id)
+        self.users_by_email[user.email.lower()] = user.id
+        self.users_by_login[user.login] = user.id
+
+    def _unindex_user(self, user: User):
+        self.users_by_id.remove(user.id)
+        # в старых данных могут быть дубликаты - чужую запись не трогаем
+        if self.users_by_email.get(user.email.lower()) == user.id:
+            del self.users_by_email[user.email.lower()]
+        if self.users_by_login.get(user.login) == user.id:
+            del self.users_by_login[user.login]
+
+    # Посты держат ссылку на объект автора, поэтому изменения в
+    # update_user видны в них сразу. Перепривязка нужна, только когда
+    # объект автора меняется целиком: удаление, загрузка из журнала
+    def _link_author(self, user_id: int, user: Optional[User]):
+        with self._posts_lock:
+            for pid in self.posts_by_author.get(user_id, ()):
+                self.posts[pid].author = user
+
+    def _index_post(self, post: Post):
+        self.posts_by_id.add(post.id)
+        self.posts_by_created.add((post.createdAt, post.id))
+        self.posts_by_author.setdefault(post.authorId, SortedIndex()).add(post.id)
+        self._rank_post(post)
+        self.search_index.add(post.id, post.title, post.content)
+
+    def _unindex_post(self, post: Post):
+        self.posts_by_id.remove(post.id)
+        self.posts_by_created.remove((post.createdAt, post.id))
+        self._unrank_post(post)
+        author_posts = self.posts_by_author.get(post.authorId)
+        if author_posts is not None:
+            author_posts.remove(post.id)
+            if not author_posts:
+                del self.posts_by_author[post.authorId]
+        self.search_index.remove(post.id)
+
+    # ключи рейтингов считаются из голосов и даты создания, поэтому
+    # убирать пост нужно до изменения голосов, а добавлять - после
+    def _rank_post(self, post: Post):
+        self.posts_by_score.add(top_key(post))
+        self.posts_by_hot.add(trending_key(post))
+
+    def _unrank_post(self, post: Post):
+        self.posts_by_score.remove(top_key(post))
+        self.posts_by_hot.remove(trending_key(post))
+
+    # запись в журнал строится уже в потоке-писателе
+    def _log_user(self, user: User):
+        self.users_log.append(user.id, lambda: {'op': 'put', 'user': self._user_to_dict(user)})
+
+    def _log_post(self, post: Post):
+        self.posts_log.append(post.id, lambda: {'op': 'put', 'post': self._post_to_dict(post)})
+
+    # в журнал пишутся итоговые значения счетчиков и ячеек, а не
+    # приращения, поэтому повторное применение записи безопасно
+    def _log_votes(self, post_ids, slots: Dict[int, int]):
+        if slots:
+            # размер таблицы - чтобы не применить ячейки к таблице другого размера
+            self.posts_log.append(('voters', next(self._voter_batches)), {
+                'op': 'voters',
+                'size': self.voters.size,
+                'slots': [[index, value] for index, value in slots.items()]
+            })
+        for post_id in post_ids:
+            post = self.posts.get(post_id)
+            if post is not None:
+                self.posts_log.append(('votes', post_id), lambda post=post: {
+                    'op': 'votes',
                     'id': post.id,
-                    'authorId': post.authorId,
-                    'title': post.title,
-                    'content': post.content,
-                    'createdAt': post.createdAt.isoformat(),
-                    'updatedAt': post.updatedAt.isoformat(),
                     'likes': post.likes,
-                    'dislikes': post.dislikes
-                } for pid, post in self.posts.items()
-            },
-            'next_post_id': self.next_post_id
+                    'dislikes': post.dislikes,
+                    'version': post.version
+                })
+
+    def _user_to_dict(self, user: User) -> dict:
+        return {
+            'id': user.id,
+            'email': user.email,
+            'login': user.login,
+            'password': user.password,
+            'createdAt': user.createdAt.isoformat(),
+            'updatedAt': user.updatedAt.isoformat(),
+            'version': user.version
         }
-        with open('posts_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    
+
+    def _post_to_dict(self, post: Post, content: bool = True) -> dict:
+        data = {
+            'id': post.id,
+            'authorId': post.authorId,
+            'title': post.title,
+            'createdAt': post.createdAt.isoformat(),
+            'updatedAt': post.updatedAt.isoformat(),
+            'likes': post.likes,
+            'dislikes': post.dislikes,
+            'version': post.version
+        }
+        if content:
+            data['content'] = post.content
+        return data
+
+    # снапшоты пишутся из фонового потока журнала, поэтому сначала
+    # копируем список объектов, а файл заменяем атомарно.
+    # Возвращается число записей - по нему журнал выбирает порог компактизации
+    def _save_users_to_file(self) -> int:
+        with self._users_lock:
+            next_user_id = self.next_user_id
+            users = list(self.users.values())
+        if self.snapshot_format == 'binary':
+            self._write_snapshot('users_data', lambda f: write_users(f, users, next_user_id))
+        else:
+            self._write_snapshot('users_data', lambda f: self._write_json(
+                f, 'users', (self._user_to_dict(user) for user in users),
+                {'next_user_id': next_user_id}
+            ))
+        return len(users)
+
+    def _save_posts_to_file(self) -> int:
+        with self._posts_lock:
+            next_post_id = self.next_post_id
+            posts = list(self.posts.values())
+            voters = self.voters
+            dirty = voters.take_dirty() if voters is not None else []
+            if not dirty:
+                voter_data = None
+            elif self._voters_on_disk:
+                voter_data = [(page, voters.page(page)) for page in dirty]
+            else:
+                voter_data = bytes(voters.slots)
+        # Страницы таблицы голосующих пишутся только после снапшота постов:
+        # голоса из них уже учтены в счетчиках, которые читаются позже
+        # копирования списка. Сбой между двумя записями оставит голос без
+        # ячейки (голосующий сможет проголосовать еще раз), но не ячейку
+        # без голоса - такой голосующий не смог бы проголосовать никогда.
+        try:
+            count = self._write_posts_snapshot(posts, next_post_id)
+        except BaseException:
+            if dirty:
+                with self._posts_lock:
+                    voters.mark_dirty(dirty)
+            raise
+        if dirty:
+            self._save_voters(dirty, voter_data)
+        return count
+
+    def _write_posts_snapshot(self, posts: List[Post], next_post_id: int) -> int:
+        if self.contents is None:
+            if self.snapshot_format == 'binary':
+                self._write_snapshot('posts_data', lambda f: write_posts(
+                    f, [(post, None) for post in posts], next_post_id
+                ))
+            else:
+                self._write_snapshot('posts_data', lambda f: self._write_json(
+                    f, 'posts', (self._post_to_dict(post) for post in posts),
+                    {'next_post_id': next_post_id}
+                ))
+            return len(posts)
+        previous = self.contents.current
+        written = self._store_contents(posts)
+        content_file = self.contents.current.path
+        if self.snapshot_format == 'binary':
+            self._write_snapshot('posts_data', lambda f: write_posts(
+                f, [(post, self._snapshot_ref(post, written)) for post in posts],
+                next_post_id, content_file
+            ))
+        else:
+            self._write_snapshot('posts_data', lambda f: self._write_json(
+                f, 'posts', (self._post_snapshot_dict(post, written) for post in posts),
+                {'next_post_id': next_post_id, 'content_file': content_file}
+            ))
+        self._release_contents(written)
+        if previous is not None and previous is not self.contents.current:
+            previous.retire()
+        return len(posts)
+
+    # Таблица голосующих - всегда двоичный файл, в JSON ей не место.
+    # Впервые (и после неудачной записи) она пишется целиком, как остальные
+    # снапшоты, дальше - только измененные страницы поверх файла.
+    def _save_voters(self, dirty: List[int], data):
+        try:
+            if isinstance(data, bytes):
+                self._write_snapshot('voters_data', lambda f: write_voters(f, data), binary=True)
+                self._voters_on_disk = True
+            else:
+                with SNAPSHOT_LATENCY.time('voters_data.bin'):
+                    write_voter_pages('voters_data.bin', self.voters.size, data, PAGE_SIZE)
+                SNAPSHOT_BYTES.inc('voters_data.bin', amount=len(data) * PAGE_SIZE)
+        except BaseException:
+            with self._posts_lock:
+                self.voters.mark_dirty(dirty)
+                self._voters_on_disk = False
+            raise
+
+    # Тексты, которых еще нет в текущем файле текстов, дописываются в него.
+    # Возвращает id поста -> (пост, текст, старая ссылка, новая ссылка)
+    def _store_contents(self, posts: List[Post]) -> Dict[int, tuple]:
+        contents = self.contents
+        current = contents.current
+        pending = []
+        live = 0
+        for post in posts:
+            resident, ref = post._content, post._ref
+            if resident is None and ref[0] is current:
+                live += ref[2]
+            else:
+                pending.append((post, resident, ref))
+        if current is None or current.size - live > max(live, contents.rewrite_min):
+            # мусора больше, чем живых текстов - переписываем все в новый файл
+            current = contents.new_file()
+            pending = [(post, post._content, post._ref) for post in posts]
+        texts = [resident if resident is not None else ref[0].read(ref[1], ref[2], cache=False)
+                 for post, resident, ref in pending]
+        refs = current.append(texts)
+        return {
+            post.id: (post, resident, old_ref, new_ref)
+            for (post, resident, old_ref), new_ref in zip(pending, refs)
+        }
+
+    # Записанные в файл тексты больше не держим в памяти - если пост не
+    # изменился, пока шел снапшот
+    def _release_contents(self, written: Dict[int, tuple]):
+        with self._posts_lock:
+            for post, resident, old_ref, new_ref in written.values():
+                if post._content is resident and post._ref is old_ref:
+                    if post._preview is None:
+                        post._preview = make_preview(post.content)
+                    post._ref = new_ref
+                    post._content = None
+
+    # Ссылка (смещение, длина) на текст поста в текущем файле текстов или
+    # None, если пост изменили во время снапшота - тогда текст пишется целиком
+    def _snapshot_ref(self, post: Post, written: Dict[int, tuple]) -> Optional[tuple]:
+        entry = written.get(post.id)
+        ref = entry[3] if entry is not None else post._ref
+        if ref is None or ref[0] is not self.contents.current:
+            return None
+        return ref[1], ref[2]
+
+    # в снапшоте вместо текста - ссылка на него в файле текстов и превью
+    def _post_snapshot_dict(self, post: Post, written: Dict[int, tuple]) -> dict:
+        ref = self._snapshot_ref(post, written)
+        if ref is None:
+            return self._post_to_dict(post)
+        data = self._post_to_dict(post, content=False)
+        data['contentRef'] = list(ref)
+        data['preview'] = post.preview
+        return data
+
+    # Снапшот name.bin или name.json (по snapshot_format). Файл пишется
+    # рядом под временным именем, сбрасывается на диск и только потом
+    # подменяет старый: при сбое на диске остается либо старый снапшот,
+    # либо новый целиком
+    def _write_snapshot(self, name: str, write: Callable, binary: Optional[bool] = None):
+        if binary is None:
+            binary = self.snapshot_format == 'binary'
+        path = name + ('.bin' if binary else '.json')
+        tmp_path = path + '.tmp'
+        with SNAPSHOT_LATENCY.time(path):
+            if binary:
+                f = open(tmp_path, 'wb')
+            else:
+                f = open(tmp_path, 'w', encoding='utf-8')
+            with f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        SNAPSHOT_BYTES.inc(path, amount=os.path.getsize(tmp_path))
+        os.replace(tmp_path, path)
+        if not binary and os.path.exists(name + '.bin'):
+            # иначе при следующем старте прочитается старый двоичный снапшот
+            os.remove(name + '.bin')
+        # сама замена - запись в каталоге, ее тоже нужно сбросить
+        fsync_dir(path)
+
+    # JSON-снапшот по одной записи на строку, без построения
+    # всего документа в памяти
+    def _write_json(self, f, items_key: str, records, fields: dict):
+        # поля идут перед записями: загрузчику они могут понадобиться
+        # уже при чтении записей
+        f.write('{\n')
+        for key, value in fields.items():
+            f.write(json.dumps(key) + ': ' + json.dumps(value) + ',\n')
+        f.write(json.dumps(items_key) + ': {')
+        separator = '\n'
+        for record in records:
+            f.write(separator + json.dumps(str(record['id'])) + ': ')
+            f.write(json.dumps(record, ensure_ascii=False))
+            separator = ',\n'
+        f.write('\n}\n}\n')
+
+    # снапшот читается потоково, по одной записи
     def load_users_from_file(self):
-        if os.path.exists('users_data.json'):
-            with open('users_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.next_user_id = data['next_user_id']
-                for uid, user_data in data['users'].items():
-                    user = User(
-                        user_data['id'],
-                        user_data['email'],
-                        user_data['login'],
-                        user_data['password']
-                    )
-                    user.createdAt = datetime.fromisoformat(user_data['createdAt'])
-                    user.updatedAt = datetime.fromisoformat(user_data['updatedAt'])
-                    self.users[user_data['id']] = user
-    
+        with self._users_lock:
+            self._load_users()
+        # снапшот импортирован из JSON - сразу пишем двоичный, чтобы
+        # следующий старт был быстрым
+        if self._needs_binary_snapshot('users_data') and self.users:
+            self.users_log.compact()
+
     def load_posts_from_file(self):
-        if os.path.exists('posts_data.json'):
+        with self._posts_lock:
+            self._load_posts()
+        # снапшот без файла текстов (ленивый режим только что включили) -
+        # сразу переносим тексты в файл, а не ждем компактизации
+        if self.contents is not None and self.contents.current is None and self.posts:
+            self.posts_log.compact()
+        elif self._needs_binary_snapshot('posts_data') and self.posts:
+            self.posts_log.compact()
+
+    def _needs_binary_snapshot(self, name: str) -> bool:
+        return self.snapshot_format == 'binary' and not os.path.exists(name + '.bin')
+
+    def _load_users(self):
+        if os.path.exists('users_data.bin'):
+            with Snapshot('users_data.bin', USERS_MAGIC) as snapshot:
+                users = self.users
+                for record in snapshot.users():
+                    users[record[0]] = User(*record)
+                self.next_user_id = max(self.next_user_id, snapshot.next_id)
+        elif os.path.exists('users_data.json'):
+            with open('users_data.json', 'r', encoding='utf-8') as f:
+                fields = {}
+                for uid, user_data in iter_members(f, 'users', fields):
+                    self._put_user(user_data, index=False)
+                self.next_user_id = max(self.next_user_id, fields.get('next_user_id', 1))
+        self._rebuild_user_indexes()
+        # доигрываем журнал поверх снапшота
+        for record in self.users_log.replay():
+            if record['op'] == 'put':
+                self._put_user(record['user'])
+            elif record['op'] == 'delete':
+                user = self.users.pop(record['id'], None)
+                if user is not None:
+                    self._unindex_user(user)
+
+    def _load_posts(self):
+        content_file = None
+        if os.path.exists('posts_data.bin'):
+            with Snapshot('posts_data.bin', POSTS_MAGIC) as snapshot:
+                if snapshot.content_file is not None:
+                    content_file = self._open_content_file(snapshot.content_file)
+                self._load_binary_posts(snapshot, content_file)
+                self.next_post_id = max(self.next_post_id, snapshot.next_id)
+        elif os.path.exists('posts_data.json'):
             with open('posts_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.next_post_id = data['next_post_id']
-                for pid, post_data in data['posts'].items():
-                    post = Post(
-                        post_data['id'],
-                        post_data['authorId'],
-                        post_data['title'],
-                        post_data['content']
-                    )
-                    post.createdAt = datetime.fromisoformat(post_data['createdAt'])
-                    post.updatedAt = datetime.fromisoformat(post_data['updatedAt'])
-                    post.likes = post_data.get('likes', 0)
-                    post.dislikes = post_data.get('dislikes', 0)
-                    self.posts[post_data['id']] = post
-
-storage = Storage()
\ No newline at end of file
+                fields = {}
+                # имя файла текстов записано в снапшоте раньше самих постов
+                for pid, post_data in iter_members(f, 'posts', fields):
+                    if content_file is None and 'contentRef' in post_data:
+                        content_file = self._open_content_file(fields['content_file'])
+                    self._put_post(post_data, index=False, content_file=content_file)
+                self.next_post_id = max(self.next_post_id, fields.get('next_post_id', 1))
+        if content_file is not None and self.contents is None:
+            # тексты уже прочитаны в память
+            content_file.close()
+        if self.contents is not None:
+            self.contents.remove_unused()
+        # размер таблицы берется из файла: ячейки нельзя разложить заново,
+        # поэтому BLOG_VOTE_SLOTS действует только на новую таблицу
+        if self.voters is not None and os.path.exists('voters_data.bin'):
+            self.voters = VoterSlots(slots=read_voters('voters_data.bin'))
+            self._voters_on_disk = True
+        self._rebuild_post_indexes()
+        for record in self.posts_log.replay():
+            if record['op'] == 'put':
+                self._put_post(record['post'])
+            elif record['op'] == 'delete':
+                post = self.posts.pop(record['id'], None)
+                if post is not None:
+                    self._unindex_post(post)
+            elif record['op'] == 'votes':
+                post = self.posts.get(record['id'])
+                if post is not None:
+                    self._unrank_post(post)
+                    post.likes = record['likes']
+                    post.dislikes = record['dislikes']
+                    post.version = record.get('version', post.version)
+                    self._rank_post(post)
+            elif record['op'] == 'voters':
+                voters = self.voters
+                if voters is not None and record['size'] == voters.size:
+                    # set отмечает страницы измененными: иначе следующий
+                    # снапшот их не запишет, а журнал уже удалится
+                    for index, value in record['slots']:
+                        voters.set(index, value)
+
+    # горячий цикл загрузки: посты строятся прямо из кортежей снапшота,
+    # без промежуточных словарей и индексов (они строятся потом разом)
+    def _load_binary_posts(self, snapshot: Snapshot, content_file: Optional[ContentFile]):
+        posts = self.posts
+        users = self.users
+        lazy = self.contents is not None
+        for pid, author_id, title, text, created, updated, likes, dislikes, version, ref in snapshot.posts():
+            if ref is None:
+                post = Post(pid, author_id, title, text, created, updated, likes, dislikes, version)
+            elif lazy:
+                # вместо текста в снапшоте превью
+                post = Post(pid, author_id, title, None, created, updated, likes, dislikes, version,
+                            (content_file, ref[0], ref[1]), text)
+            else:
+                content = content_file.read(ref[0], ref[1], cache=False)
+                post = Post(pid, author_id, title, content, created, updated, likes, dislikes, version,
+                            preview=text)
+            post.author = users.get(author_id)
+            posts[pid] = post
+
+    # все записи пакета уходят в журнал одной пачкой
+    @contextmanager
+    def batch(self):
+        with self.users_log.hold(), self.posts_log.hold():
+            yield
+
+    # дождаться, пока все изменения окажутся на диске
+    def flush(self):
+        self.votes.flush()
+        self.users_log.flush()
+        self.posts_log.flush()
+
+    # закрыть журналы при остановке приложения; несвернутые журналы
+    # сворачиваются в снапшот, чтобы следующий старт их не доигрывал
+    # snapshot=False - только остановить фоновые потоки, ничего не записывая
+    # (хранилище открыто для чтения, как при переносе в SQLite)
+    def close(self, snapshot: bool = True):
+        self.search_index.close()
+        self.votes.close()
+        self.users_log.close(snapshot=snapshot)
+        self.posts_log.close(snapshot=snapshot)
+        if self.contents is not None:
+            self.contents.close()
+
+    # снапшот, записанный в ленивом режиме, можно прочитать и без него -
+    # тогда тексты сразу читаются в память
+    def _open_content_file(self, path: str) -> ContentFile:
+        if self.contents is not None:
+            return self.contents.open(path)
+        return ContentFile(path)
+
+    # индексы после чтения снапшота строятся разом, а не по одной записи
+    def _rebuild_user_indexes(self):
+        self.users_by_id.rebuild(self.users.keys())
+        self.users_by_email = {user.email.lower(): user.id for user in self.users.values()}
+        self.users_by_login = {user.login: user.id for user in self.users.values()}
+
+    def _rebuild_post_indexes(self):
+        self.posts_by_id.rebuild(self.posts.keys())
+        self.posts_by_created.rebuild((post.createdAt, post.id) for post in self.posts.values())
+        by_author: Dict[int, List[int]] = {}
+        for post in self.posts.values():
+            by_author.setdefault(post.authorId, []).append(post.id)
+        self.posts_by_author = {}
+        for author_id, post_ids in by_author.items():
+            self.posts_by_author[author_id] = SortedIndex()
+            self.posts_by_author[author_id].rebuild(post_ids)
+        self.posts_by_score.rebuild(top_key(post) for post in self.posts.values())
+        self.posts_by_hot.rebuild(trending_key(post) for post in self.posts.values())
+        # поисковый индекс строится в фоне, см. SearchIndex.build_async
+        self.search_index = SearchIndex()
+        self.search_index.build_async(list(self.posts), self._search_document)
+
+    def _search_document(self, post_id: int):
+        post = self.posts.get(post_id)
+        if post is None:
+            return None
+        # построение индекса читает все тексты - мимо кэша, чтобы не вытеснять горячие
+        content, ref = post._content, post._ref
+        if content is None:
+            content = ref[0].read(ref[1], ref[2], cache=False)
+        return post.title, content
+
+    def _put_user(self, user_data: dict, index: bool = True):
+        user = User(
+            user_data['id'],
+            user_data['email'],
+            user_data['login'],
+            user_data['password'],
+            datetime.fromisoformat(user_data['createdAt']),
+            datetime.fromisoformat(user_data['updatedAt']),
+            user_data.get('version', 0)
+        )
+        if not index:
+            self.users[user.id] = user
+        else:
+            old = self.users.get(user.id)
+            if old is not None:
+                self._unindex_user(old)
+            self.users[user.id] = user
+            self._index_user(user)
+            self._link_author(user.id, user)
+        self.next_user_id = max(self.next_user_id, user.id + 1)
+
+    def _put_post(self, post_data: dict, index: bool = True,
+                  content_file: Optional[ContentFile] = None):
+        content = post_data.get('content')
+        ref = None
+        if content is None:
+            offset, length = post_data['contentRef']
+            if self.contents is not None:
+                ref = (content_file, offset, length)
+            else:
+                content = content_file.read(offset, length, cache=False)
+        post = Post(
+            post_data['id'],
+            post_data['authorId'],
+            post_data['title'],
+            content,
+            datetime.fromisoformat(post_data['createdAt']),
+            datetime.fromisoformat(post_data['updatedAt']),
+            post_data.get('likes', 0),
+            post_data.get('dislikes', 0),
+            post_data.get('version', 0),
+            ref,
+            post_data.get('preview') if ref is not None else None
+        )
+        post.author = self.users.get(post.authorId)
+        if not index:
+            self.posts[post.id] = post
+        else:
+            old = self.posts.get(post.id)
+            if old is not None:
+                self._unindex_post(old)
+            self.posts[post.id] = post
+            self._index_post(post)
+        self.next_post_id = max(self.next_post_id, post.id + 1)
+
+# операции хранилища, время которых попадает в метрики
+TIMED_OPERATIONS = (
+    'create_user', 'get_all_users', 'get_users_page', 'get_user_by_id', 'get_user_by_email',
+    'get_user_by_login', 'update_user', 'delete_user', 'create_post', 'get_all_posts',
+    'get_posts_page', 'get_post_by_id', 'get_posts_by_author', 'update_post', 'search_posts',
+    'get_top_posts', 'get_trending_posts', 'replace_password',
+    'delete_post', 'like_post', 'dislike_post', 'load_users_from_file', 'load_posts_from_file', 'flush'
+)
+
+# Хранилище выбирается переменной окружения BLOG_STORAGE:
+# json (по умолчанию) - данные в памяти и JSON-файлах, один процесс;
+# sqlite - общая база, можно запускать несколько воркеров uvicorn
+def create_storage() -> StorageBackend:
+    backend = os.environ.get('BLOG_STORAGE', 'json')
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        result = SQLiteStorage(os.environ.get('BLOG_SQLITE_PATH', 'blog.db'))
+    elif backend == 'json':
+        contents = None
+        # BLOG_LAZY_CONTENT=1 - тексты постов в файле, в памяти только превью
+        # и последние прочитанные (до BLOG_CONTENT_CACHE_MB мегабайт текста)
+        if os.environ.get('BLOG_LAZY_CONTENT', '0') == '1':
+            contents = ContentStore(
+                cache_chars=int(os.environ.get('BLOG_CONTENT_CACHE_MB', '32')) * 1024 * 1024
+            )
+        # BLOG_SNAPSHOT_FORMAT=json - писать снапшоты в JSON (для выгрузки
+        # или отката), BLOG_SNAPSHOT_INTERVAL - как часто (в секундах)
+        # сворачивать журнал, даже если он невелик
+        result = Storage(
+            votes_flush_interval=float(os.environ.get('BLOG_VOTES_FLUSH_INTERVAL', '1.0')),
+            contents=contents,
+            snapshot_format=os.environ.get('BLOG_SNAPSHOT_FORMAT', 'binary'),
+            snapshot_interval=float(os.environ.get('BLOG_SNAPSHOT_INTERVAL', '300')),
+            # BLOG_VOTE_SLOTS - ячеек (байт) в таблице голосующих
+            vote_slots=int(os.environ.get('BLOG_VOTE_SLOTS', str(DEFAULT_SLOTS)))
+        )
+    else:
+        raise ValueError(f'Неизвестное хранилище: {backend}')
+    return instrument(result, TIMED_OPERATIONS)
+
+storage = create_storage()
\ No newline at end of file
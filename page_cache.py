@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Set
+
+
+# LRU-кэш готовых HTML-страниц.
+# Ключ страницы включает версии показанных на ней записей, поэтому
+# устаревшую страницу нельзя достать даже если об изменении не сообщили
+# (например, его сделал другой воркер с общей базой). Кроме того, каждая
+# страница помечена тегами записей, и изменение записи сразу выкидывает
+# только страницы с ее тегом - лайк одного поста не трогает остальные.
+class PageCache:
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._pages: OrderedDict = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, body: bytes, tags: Iterable[Hashable]):
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._pages:
+                self._remove(key)
+            self._pages[key] = (body, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._pages) > self.maxsize:
+                self._remove(next(iter(self._pages)))
+                self.evictions += 1
+
+    # выкинуть все страницы с тегом
+    def invalidate(self, tag: Hashable):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._tags.clear()
+
+    # подписчик на изменения хранилища
+    def on_change(self, kind: str, action: str, obj_id: int):
+        self.invalidate((kind, obj_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._pages),
+                'maxsize': self.maxsize,
+                'bytes': sum(len(body) for body, tags in self._pages.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+    def _remove(self, key: Hashable):
+        body, tags = self._pages.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
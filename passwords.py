@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+# Хеши паролей: PBKDF2-SHA256 с солью, в записи пользователя строка
+#   pbkdf2_sha256$<итерации>$<соль base64>$<хеш base64>
+# Число итераций хранится в самой строке, поэтому его можно поднимать:
+# старые хеши проверяются как есть и пересчитываются при входе.
+# Пароли, сохраненные до появления хешей, лежат открытым текстом - они
+# тоже проверяются и заменяются хешем (см. needs_rehash).
+#
+# Один хеш - десятки миллисекунд процессора. В цикле событий это
+# останавливало бы все запросы, поэтому async-код считает хеши через
+# PasswordHasher - в пуле потоков. hashlib.pbkdf2_hmac (OpenSSL) отпускает
+# GIL на время расчета, так что потоки считают хеши параллельно на всех
+# ядрах и не мешают циклу событий.
+
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = 200_000
+SALT_BYTES = 16
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_password(password: str, iterations: int = ITERATIONS) -> str:
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f'{ALGORITHM}${iterations}${_b64(salt)}${_b64(digest)}'
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(ALGORITHM + '$')
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    try:
+        _, iterations, salt, digest = stored.split('$')
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        iterations = int(iterations)
+    except ValueError:
+        return False
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return hmac.compare_digest(candidate, digest)
+
+
+# открытый текст или хеш с меньшим числом итераций
+def needs_rehash(stored: str, iterations: int = ITERATIONS) -> bool:
+    if not is_hashed(stored):
+        return True
+    try:
+        return int(stored.split('$')[1]) < iterations
+    except (IndexError, ValueError):
+        return True
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# Пул потоков для хешей. Очередь ограничена: при max_pending
+# незавершенных задачах новые отклоняются (HasherBusy), а не копятся -
+# иначе поток попыток входа растягивает ожидание всем.
+# Потоки, а не процессы: процессу пула пришлось бы заново импортировать
+# __main__ (при python main.py - все приложение с хранилищем).
+class PasswordHasher:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 iterations: int = ITERATIONS):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or max(16, self.workers * 8)
+        self.iterations = iterations
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+        return self._executor
+
+    async def _run(self, function, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), function, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.iterations)
+
+    async def verify(self, password: str, stored: str) -> bool:
+        if not is_hashed(stored):
+            # открытый текст сравнивается без пула
+            return verify_password(password, stored)
+        return await self._run(verify_password, password, stored)
+
+    # для пакетов: хеши считаются во всех потоках сразу, очередь
+    # не ограничивается - пакет и так ждет целиком
+    async def hash_many(self, passwords: Iterable[str]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(pool, hash_password, password, self.iterations) for password in passwords
+        )))
+
+    def needs_rehash(self, stored: str) -> bool:
+        return needs_rehash(stored, self.iterations)
+
+    def stats(self) -> dict:
+        return {'workers': self.workers, 'pending': self._pending, 'rejected': self.rejected}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+# BLOG_HASH_WORKERS - потоков для хешей (по умолчанию по числу ядер),
+# BLOG_PBKDF2_ITERATIONS - итераций для новых хешей
+hasher = PasswordHasher(
+    workers=int(os.environ.get('BLOG_HASH_WORKERS', '0')) or None,
+    iterations=int(os.environ.get('BLOG_PBKDF2_ITERATIONS', str(ITERATIONS)))
+)
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel, validator
 from models import storage
+from http_utils import check_conditional, items_etag, post_etag, posts_etag, set_page_headers
+from bulk import delete_items, item_result, run_bulk, validate
+from export import export_response
+from serializers import (
+    dumps, encode_array, encode_post, encode_post_with_author, json_response,
+    post_export_dict, post_to_dict, post_with_author_dict
+)
 
 router = APIRouter(prefix="/api/posts", tags=["posts"])
 
+# ?include=author - добавить в посты их авторов (поле "author")
+INCLUDE_PATTERN = "^author$"
+
 class CreatePostRequest(BaseModel):
     authorId: int
     title: str
@@ -27,6 +39,9 @@ class UpdatePostRequest(BaseModel):
     title: str
     content: str
 
+class BulkUpdatePostRequest(UpdatePostRequest):
+    id: int
+
 @router.post("/")
 async def create_new_post(post_data: CreatePostRequest):
     try:
@@ -40,70 +55,192 @@ async def create_new_post(post_data: CreatePostRequest):
             content=post_data.content
         )
         
-        return {
-            "id": post.id,
-            "authorId": post.authorId,
-            "title": post.title,
-            "content": post.content,
-            "createdAt": post.createdAt.isoformat(),
-            "updatedAt": post.updatedAt.isoformat()
-        }
+        return json_response(encode_post(post))
     except Exception as error:
         raise HTTPException(status_code=400, detail=str(error))
 
+# Пакетные операции. Тело - JSON-массив или NDJSON (application/x-ndjson),
+# в ответе результат по каждому элементу: index, status, id, error.
+# Маршруты объявлены раньше /{post_id}, иначе "bulk" примется за id.
+def _create_posts(chunk):
+    results = []
+    valid = []
+    for index, item in chunk:
+        post_data, error = validate(CreatePostRequest, item)
+        if error is not None:
+            results.append(item_result(index, 422, error=error))
+        else:
+            valid.append((index, post_data))
+    
+    # каждый автор проверяется один раз на порцию
+    author_ids = {post_data.authorId for index, post_data in valid}
+    authors = {author_id: storage.get_user_by_id(author_id) is not None for author_id in author_ids}
+    
+    for index, post_data in valid:
+        if not authors[post_data.authorId]:
+            results.append(item_result(index, 404, error="Автор не найден"))
+            continue
+        post = storage.create_post(
+            authorId=post_data.authorId,
+            title=post_data.title,
+            content=post_data.content
+        )
+        results.append(item_result(index, 201, post.id))
+    return results
+
+def _update_posts(chunk):
+    results = []
+    for index, item in chunk:
+        post_data, error = validate(BulkUpdatePostRequest, item)
+        if error is not None:
+            results.append(item_result(index, 422, error=error))
+            continue
+        post = storage.update_post(post_data.id, title=post_data.title, content=post_data.content)
+        if post is None:
+            results.append(item_result(index, 404, post_data.id, "Пост не найден"))
+        else:
+            results.append(item_result(index, 200, post.id))
+    return results
+
+@router.post("/bulk")
+async def bulk_create_posts(request: Request):
+    return await run_bulk(request, _create_posts)
+
+@router.put("/bulk")
+async def bulk_update_posts(request: Request):
+    return await run_bulk(request, _update_posts)
+
+@router.delete("/bulk")
+async def bulk_delete_posts(request: Request):
+    return await run_bulk(request, lambda chunk: delete_items(chunk, storage.delete_post, "Пост не найден"))
+
 @router.get("/")
-async def get_all_posts():
-    posts = storage.get_all_posts()
+async def get_all_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    order: str = Query("id", pattern="^(id|createdAt)$"),
+    include: Optional[str] = Query(None, pattern=INCLUDE_PATTERN)
+):
+    try:
+        page = storage.get_posts_page(limit, after=after, before=before, order=order)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    set_page_headers(request, response, page)
+    with_author = include == "author"
+    etag = posts_etag("posts", page.items, with_author, page.next_cursor, page.prev_cursor)
+    not_modified = check_conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+    
+    encode = encode_post_with_author if with_author else encode_post
+    return json_response(encode_array(encode(post) for post in page.items), response)
+
+# Выгрузка всех постов потоком: NDJSON (по посту на строку) или JSON-массив
+@router.get("/export")
+async def export_posts(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    authorId: Optional[int] = None,
+    createdAfter: Optional[datetime] = None
+):
+    # даты в хранилище локальные и без часового пояса
+    if createdAfter is not None and createdAfter.tzinfo is not None:
+        createdAfter = createdAfter.astimezone().replace(tzinfo=None)
+    chunks = storage.iter_posts(author_id=authorId, created_after=createdAfter)
+    return export_response(chunks, post_export_dict, format, "posts")
+
+@router.get("/search")
+async def search_posts(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    include: Optional[str] = Query(None, pattern=INCLUDE_PATTERN)
+):
+    total, found = storage.search_posts(q, limit, offset)
+    response.headers["X-Total-Count"] = str(total)
+    if offset + len(found) < total:
+        next_url = request.url.include_query_params(offset=offset + limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
     
+    # релевантность зависит от запроса, поэтому эти ответы не кэшируются
+    to_dict = post_with_author_dict if include == "author" else post_to_dict
     posts_list = []
-    for post in posts:
-        posts_list.append({
-            "id": post.id,
-            "authorId": post.authorId,
-            "title": post.title,
-            "content": post.content,
-            "createdAt": post.createdAt.isoformat(),
-            "updatedAt": post.updatedAt.isoformat()
-        })
+    for post, score in found:
+        post_dict = to_dict(post)
+        post_dict["score"] = round(score, 4)
+        posts_list.append(post_dict)
     
-    return posts_list
+    return json_response(dumps(posts_list), response)
+
+# Список постов рейтинга: ETag из id и версий постов (голос меняет версию),
+# так что ответ устаревает и при голосе, и при смене состава списка
+def ranked_response(request: Request, response: Response, kind: str, posts, include: Optional[str]):
+    with_author = include == "author"
+    not_modified = check_conditional(request, response, posts_etag(kind, posts, with_author))
+    if not_modified:
+        return not_modified
+    encode = encode_post_with_author if with_author else encode_post
+    return json_response(encode_array(encode(post) for post in posts), response)
+
+# Лучшие посты: по разнице лайков и дизлайков
+@router.get("/top")
+async def get_top_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    include: Optional[str] = Query(None, pattern=INCLUDE_PATTERN)
+):
+    return ranked_response(request, response, "top", storage.get_top_posts(limit), include)
+
+# "Горячие" посты: рейтинг с поправкой на новизну (см. ranking.py)
+@router.get("/trending")
+async def get_trending_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    include: Optional[str] = Query(None, pattern=INCLUDE_PATTERN)
+):
+    return ranked_response(request, response, "trending", storage.get_trending_posts(limit), include)
 
 @router.get("/{post_id}")
-async def get_post_by_id(post_id: int):
+async def get_post_by_id(
+    post_id: int,
+    request: Request,
+    response: Response,
+    include: Optional[str] = Query(None, pattern=INCLUDE_PATTERN)
+):
     post = storage.get_post_by_id(post_id)
     
     if post is None:
         raise HTTPException(status_code=404, detail="Пост не найден")
     
-    return {
-        "id": post.id,
-        "authorId": post.authorId,
-        "title": post.title,
-        "content": post.content,
-        "createdAt": post.createdAt.isoformat(),
-        "updatedAt": post.updatedAt.isoformat()
-    }
+    with_author = include == "author"
+    last_modified = post.updatedAt
+    if with_author and post.author is not None:
+        last_modified = max(last_modified, post.author.updatedAt)
+    not_modified = check_conditional(request, response, post_etag(post, with_author), last_modified)
+    if not_modified:
+        return not_modified
+    
+    body = encode_post_with_author(post) if with_author else encode_post(post)
+    return json_response(body, response)
 
 @router.get("/author/{author_id}")
-async def get_posts_by_author(author_id: int):
+async def get_posts_by_author(author_id: int, request: Request, response: Response):
     author = storage.get_user_by_id(author_id)
     if author is None:
         raise HTTPException(status_code=404, detail="Автор не найден")
     
     posts = storage.get_posts_by_author(author_id)
+    not_modified = check_conditional(request, response, items_etag("author-posts", posts))
+    if not_modified:
+        return not_modified
     
-    posts_list = []
-    for post in posts:
-        posts_list.append({
-            "id": post.id,
-            "authorId": post.authorId,
-            "title": post.title,
-            "content": post.content,
-            "createdAt": post.createdAt.isoformat(),
-            "updatedAt": post.updatedAt.isoformat()
-        })
-    
-    return posts_list
+    return json_response(encode_array(encode_post(post) for post in posts), response)
 
 @router.put("/{post_id}")
 async def update_post_data(post_id: int, post_data: UpdatePostRequest):
@@ -116,14 +253,7 @@ async def update_post_data(post_id: int, post_data: UpdatePostRequest):
     if post is None:
         raise HTTPException(status_code=404, detail="Пост не найден")
     
-    return {
-        "id": post.id,
-        "authorId": post.authorId,
-        "title": post.title,
-        "content": post.content,
-        "createdAt": post.createdAt.isoformat(),
-        "updatedAt": post.updatedAt.isoformat()
-    }
+    return json_response(encode_post(post))
 
 @router.delete("/{post_id}")
 async def delete_post_by_id(post_id: int):
@@ -0,0 +1,75 @@
+import os
+import time
+from typing import Callable, Optional
+
+from jinja2 import FileSystemBytecodeCache
+
+import metrics
+
+# Отрисовка HTML-страниц по кускам: Template.generate() отдает текст по
+# мере отрисовки, куски копятся до CHUNK_SIZE символов и уходят клиенту.
+# Первый кусок (начало base.html со ссылкой на стили) отправляется раньше,
+# при FIRST_CHUNK символах, - браузер начинает грузить стили, пока
+# отрисовывается остальное.
+#
+# Потоковые ответы идут без сжатия (см. compression.py). Поэтому по кускам
+# отдается только первая отрисовка страницы: готовое тело кладется в кэш
+# страниц, и следующие запросы получают его целиком и сжатым.
+
+FIRST_CHUNK = 2 * 1024
+CHUNK_SIZE = 16 * 1024
+
+
+# Кэш байткода шаблонов на диске: после перезапуска шаблоны не
+# компилируются заново. Запись кэша сверяется с исходником шаблона по
+# контрольной сумме, так что измененный шаблон скомпилируется снова.
+def bytecode_cache(directory: Optional[str]) -> Optional[FileSystemBytecodeCache]:
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+# Загрузка всех шаблонов при старте, чтобы первый запрос к каждой странице
+# не платил за чтение и компиляцию. Возвращает число шаблонов.
+def warm_up(env) -> int:
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+# Асинхронный генератор кусков страницы для StreamingResponse. on_complete
+# получает все тело, если страница отрисована до конца (клиент не ушел
+# раньше и шаблон не упал).
+async def stream_template(template, context: dict, on_complete: Optional[Callable[[bytes], None]] = None):
+    body = [] if on_complete is not None else None
+    chunk = []
+    size = 0
+    limit = FIRST_CHUNK
+    # в метрику идет только время отрисовки, без ожидания отправки
+    elapsed = 0.0
+    started = time.perf_counter()
+    for piece in template.generate(context):
+        chunk.append(piece)
+        size += len(piece)
+        if size < limit:
+            continue
+        data = ''.join(chunk).encode('utf-8')
+        chunk.clear()
+        size = 0
+        limit = CHUNK_SIZE
+        if body is not None:
+            body.append(data)
+        elapsed += time.perf_counter() - started
+        yield data
+        started = time.perf_counter()
+    data = ''.join(chunk).encode('utf-8')
+    elapsed += time.perf_counter() - started
+    metrics.TEMPLATE_LATENCY.observe(elapsed, template.name or '<string>')
+    if data:
+        if body is not None:
+            body.append(data)
+        yield data
+    if body is not None:
+        on_complete(b''.join(body))
@@ -0,0 +1,263 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+_WORD = re.compile(r'\w+')
+_CYRILLIC = re.compile(r'[а-я]')
+
+STOP_WORDS = frozenset(
+    'и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по '
+    'только ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если '
+    'уже или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей '
+    'может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего раз '
+    'тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом '
+    'один почти мой тем чтобы нее были куда зачем всех никогда можно при наконец два об '
+    'другой хоть после над больше тот через эти нас про всего них какая много разве три '
+    'эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой им более '
+    'всегда конечно всю между '
+    'a an and are as at be by for from has he in is it its of on that the to was were will with'
+    .split()
+)
+
+
+# Упрощенный стеммер для русского языка по мотивам алгоритма Snowball:
+# отрезаем самое длинное подходящее окончание в области RV (после первой
+# гласной). Для поиска по блогу этого достаточно: "посты", "постов" и
+# "постами" сводятся к одной основе.
+_VOWELS = 'аеиоуыэюя'
+_PERFECTIVE_GERUND = (('ившись', 'ывшись', 'ив', 'ыв'), ('вшись', 'вши', 'в'))
+_REFLEXIVE = (('ся', 'сь'), ())
+_ADJECTIVE = ((
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый',
+    'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'
+), ())
+_PARTICIPLE = (('ивш', 'ывш', 'ующ'), ('ем', 'нн', 'вш', 'ющ', 'щ'))
+_VERB = ((
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им',
+    'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть',
+    'ишь', 'ую', 'ю'
+), ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'))
+_NOUN = ((
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'е', 'ям',
+    'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'я', 'а', 'ии', 'ей', 'ой', 'ий',
+    'й', 'и', 'ы', 'ь', 'ю', 'у', 'о'
+), ())
+_ENGLISH_SUFFIXES = ('ing', 'ed', 'es', 's', 'ly')
+
+
+# Группа окончаний -> список (окончание, нужно ли "а"/"я" перед ним) от самых
+# длинных к коротким: первое подошедшее окончание и есть самое длинное
+def _ordered(groups):
+    plain, after_a = groups
+    endings = [(ending, False) for ending in plain] + [(ending, True) for ending in after_a]
+    return sorted(endings, key=lambda item: -len(item[0]))
+
+
+_PERFECTIVE_GERUND = _ordered(_PERFECTIVE_GERUND)
+_REFLEXIVE = _ordered(_REFLEXIVE)
+_ADJECTIVE = _ordered(_ADJECTIVE)
+_PARTICIPLE = _ordered(_PARTICIPLE)
+_VERB = _ordered(_VERB)
+_NOUN = _ordered(_NOUN)
+
+
+def _strip(word: str, rv: int, endings) -> Optional[str]:
+    for ending, after_a in endings:
+        if not word.endswith(ending):
+            continue
+        cut = len(word) - len(ending)
+        if cut < rv:
+            continue
+        # во второй группе окончание должно идти после "а" или "я"
+        if after_a and (cut == 0 or word[cut - 1] not in 'ая'):
+            continue
+        return word[:cut]
+    return None
+
+
+def stem_russian(word: str) -> str:
+    rv = next((i + 1 for i, char in enumerate(word) if char in _VOWELS), len(word))
+    stripped = _strip(word, rv, _PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        stripped = _strip(word, rv, _ADJECTIVE)
+        if stripped is not None:
+            word = _strip(stripped, rv, _PARTICIPLE) or stripped
+        else:
+            word = _strip(word, rv, _VERB) or _strip(word, rv, _NOUN) or word
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    if word.endswith('ость') and len(word) - 4 >= rv + 2:
+        word = word[:-4]
+    if word.endswith('ейше'):
+        word = word[:-4]
+    elif word.endswith('ейш'):
+        word = word[:-3]
+    if word.endswith('нн'):
+        word = word[:-1]
+    elif word.endswith('ь'):
+        word = word[:-1]
+    return word
+
+
+def stem(word: str) -> str:
+    if _CYRILLIC.search(word):
+        return stem_russian(word)
+    if word.isdigit():
+        return word
+    for suffix in _ENGLISH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+# слово -> терм (None для стоп-слов); слова в текстах повторяются,
+# поэтому результат запоминается
+@lru_cache(maxsize=1 << 16)
+def _term(word: str) -> Optional[str]:
+    if word in STOP_WORDS or len(word) < 2:
+        return None
+    return stem(word)
+
+
+# Текст -> список нормализованных термов
+def analyze(text: str) -> List[str]:
+    return [term for term in map(_term, _WORD.findall(text.lower().replace('ё', 'е'))) if term is not None]
+
+
+# Инвертированный индекс по заголовкам и текстам постов с ранжированием BM25.
+# Обновляется по одному документу, пересборка на запрос не нужна.
+# При старте уже загруженные документы индексируются фоновым потоком
+# (build_async), чтобы разбор текстов не задерживал запуск; пока он
+# работает, поиск находит только уже проиндексированные документы.
+class SearchIndex:
+    TITLE_WEIGHT = 2.0
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        # терм -> {id документа: частота}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # id документа -> его термы (нужно для удаления); частоты лежат
+        # в _postings, здесь хватает кортежа
+        self._documents: Dict[int, Tuple[str, ...]] = {}
+        self._lengths: Dict[int, float] = {}
+        self._total_length = 0.0
+        self._lock = threading.Lock()
+        # документы, которые еще ждут фоновой индексации
+        self._unindexed: set = set()
+        self.ready = threading.Event()
+        self.ready.set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: int, title: str, content: str):
+        frequencies = self._frequencies(title, content)
+        with self._lock:
+            self._unindexed.discard(doc_id)
+            self._remove(doc_id)
+            self._insert(doc_id, frequencies)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._unindexed.discard(doc_id)
+            self._remove(doc_id)
+
+    # Проиндексировать документы фоновым потоком. fetch(id) возвращает
+    # актуальные (заголовок, текст) или None, если документа уже нет.
+    # Документ, который успели изменить или удалить через add/remove,
+    # фоновый поток пропускает.
+    def build_async(self, doc_ids: Iterable[int], fetch: Callable[[int], Optional[Tuple[str, str]]]):
+        doc_ids = list(doc_ids)
+        with self._lock:
+            self._unindexed.update(doc_ids)
+            self.ready.clear()
+        self._thread = threading.Thread(
+            target=self._build, args=(doc_ids, fetch), name='search-index', daemon=True
+        )
+        self._thread.start()
+
+    # прервать фоновую индексацию (при остановке хранилища: fetch может
+    # читать из уже закрытых файлов)
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _build(self, doc_ids: List[int], fetch):
+        try:
+            for doc_id in doc_ids:
+                if self._stop.is_set():
+                    break
+                if doc_id not in self._unindexed:
+                    continue
+                document = fetch(doc_id)
+                if document is None:
+                    continue
+                frequencies = self._frequencies(*document)
+                with self._lock:
+                    if doc_id in self._unindexed:
+                        self._unindexed.discard(doc_id)
+                        self._insert(doc_id, frequencies)
+        finally:
+            with self._lock:
+                self._unindexed.clear()
+                self.ready.set()
+
+    def _frequencies(self, title: str, content: str) -> Dict[str, float]:
+        frequencies: Dict[str, float] = Counter(analyze(content))
+        for term in analyze(title):
+            frequencies[term] = frequencies.get(term, 0) + self.TITLE_WEIGHT
+        return frequencies
+
+    def _insert(self, doc_id: int, frequencies: Dict[str, float]):
+        length = sum(frequencies.values())
+        self._documents[doc_id] = tuple(frequencies)
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def _remove(self, doc_id: int):
+        terms = self._documents.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    # (всего найдено, [(id, релевантность)]) для страницы offset..offset+limit
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[int, float]]]:
+        terms = set(analyze(query))
+        with self._lock:
+            return self._search(terms, limit, offset)
+
+    def _search(self, terms, limit: int, offset: int) -> Tuple[int, List[Tuple[int, float]]]:
+        count = len(self._documents)
+        if not count:
+            return 0, []
+        average_length = self._total_length / count or 1.0
+        scores: Dict[int, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), top[offset:]
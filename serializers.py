@@ -0,0 +1,143 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+from fastapi import Response
+
+# orjson заметно быстрее стандартного json, но необязателен
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# Представления записей в ответах API
+def post_to_dict(post) -> dict:
+    return {
+        "id": post.id,
+        "authorId": post.authorId,
+        "title": post.title,
+        "content": post.content,
+        "createdAt": post.createdAt.isoformat(),
+        "updatedAt": post.updatedAt.isoformat()
+    }
+
+
+def user_to_dict(user) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "login": user.login,
+        "createdAt": user.createdAt.isoformat(),
+        "updatedAt": user.updatedAt.isoformat()
+    }
+
+
+# в выгрузке у постов есть еще и голоса
+def post_export_dict(post) -> dict:
+    data = post_to_dict(post)
+    data["likes"] = post.likes
+    data["dislikes"] = post.dislikes
+    return data
+
+
+# счетчики голосов: ответ на голос в JSON и событие vote в /api/events;
+# по версии клиент отбрасывает устаревшие счетчики
+def votes_to_dict(post) -> dict:
+    return {"id": post.id, "likes": post.likes, "dislikes": post.dislikes, "version": post.version}
+
+
+# Кэш закодированных записей.
+# Любое изменение записи увеличивает ее версию, поэтому байты, закодированные
+# для (id, версия), остаются верными, пока версия та же. На каждый id
+# хранится только последняя версия, старые вытесняются по LRU.
+class EncodedCache:
+    def __init__(self, to_dict, maxsize: int = 10000):
+        self.to_dict = to_dict
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, record) -> bytes:
+        with self._lock:
+            entry = self._items.get(record.id)
+            if entry is not None and entry[0] == record.version:
+                self._items.move_to_end(record.id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        body = dumps(self.to_dict(record))
+        with self._lock:
+            self._items[record.id] = (record.version, body)
+            self._items.move_to_end(record.id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return body
+
+    def discard(self, record_id: int):
+        with self._lock:
+            self._items.pop(record_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+
+posts_cache = EncodedCache(post_to_dict)
+users_cache = EncodedCache(user_to_dict)
+
+
+# подписчик на изменения хранилища: удаленные записи сразу убираем
+def on_change(kind: str, action: str, obj_id: int):
+    if action != 'delete':
+        return
+    if kind == 'post':
+        posts_cache.discard(obj_id)
+    elif kind == 'user':
+        users_cache.discard(obj_id)
+
+
+def encode_post(post) -> bytes:
+    return posts_cache.encode(post)
+
+
+def encode_user(user) -> bytes:
+    return users_cache.encode(user)
+
+
+# пост с полем "author" (пользователь или null), склеенный из уже
+# закодированных байтов поста и автора
+def encode_post_with_author(post) -> bytes:
+    author = encode_user(post.author) if post.author is not None else b'null'
+    return encode_post(post)[:-1] + b',"author":' + author + b'}'
+
+
+def post_with_author_dict(post) -> dict:
+    data = post_to_dict(post)
+    data["author"] = user_to_dict(post.author) if post.author is not None else None
+    return data
+
+
+# JSON-массив из уже закодированных элементов
+def encode_array(items: Iterable[bytes]) -> bytes:
+    return b'[' + b','.join(items) + b']'
+
+
+# Готовый ответ из байтов, минуя jsonable_encoder.
+# Заголовки, выставленные обработчиком в response (ETag, Link и т.п.),
+# переносятся в ответ.
+def json_response(body: bytes, response: Optional[Response] = None, status_code: int = 200) -> Response:
+    result = Response(content=body, status_code=status_code, media_type="application/json")
+    if response is not None:
+        result.raw_headers.extend(response.raw_headers)
+    return result
@@ -0,0 +1,79 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Сессии после входа: токен -> пользователь. Запрос с токеном проверяется
+# словарем, пароль заново не хешируется. Сессии живут только в памяти
+# процесса: после перезапуска (и в соседнем воркере) нужно войти заново.
+#
+# Срок жизни отсчитывается от входа и у всех одинаковый, поэтому порядок
+# вставки совпадает с порядком истечения: просроченные снимаются с начала
+# очереди, без обхода всех сессий. Сессия помнит хеш пароля на момент
+# входа - после смены пароля старые сессии перестают действовать.
+
+DEFAULT_TTL = 3600.0
+MAX_SESSIONS = 100_000
+
+
+class Session:
+    __slots__ = ('token', 'user_id', 'password', 'expires')
+
+    def __init__(self, token: str, user_id: int, password: str, expires: float):
+        self.token = token
+        self.user_id = user_id
+        self.password = password
+        self.expires = expires
+
+
+class SessionCache:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def create(self, user_id: int, password: str) -> Session:
+        now = time.monotonic()
+        session = Session(secrets.token_urlsafe(32), user_id, password, now + self.ttl)
+        with self._lock:
+            self._expire(now)
+            self._sessions[session.token] = session
+            # сверх лимита вытесняются самые старые
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return session
+
+    def get(self, token: str) -> Optional[Session]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(token)
+            if session is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return session
+
+    def drop(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _expire(self, now: float):
+        sessions = self._sessions
+        while sessions:
+            token, session = next(iter(sessions.items()))
+            if session.expires > now:
+                break
+            del sessions[token]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._sessions), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,248 @@
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Двоичный формат снапшотов (users_data.bin, posts_data.bin).
+# JSON-снапшот при старте приходится разбирать по записи, и разбор JSON
+# занимает большую часть времени загрузки. Здесь запись - это
+# фиксированная структура с числами (даты - микросекунды от 1970-01-01)
+# и строки UTF-8 с длиной в этой структуре; файл читается через mmap
+# одним проходом struct.unpack_from без промежуточных словарей.
+#
+#   заголовок   сигнатура (8 байт), число записей, следующий id,
+#               длина имени файла текстов и само имя (только у постов)
+#   записи      структура USER / POST, за ней строки подряд
+#   конец       END - по нему видно, что файл дописан до конца
+#
+# Все числа little-endian. Даты хранятся без часового пояса - как
+# datetime.now(), которым они создаются.
+
+USERS_MAGIC = b'BLOGUSR1'
+POSTS_MAGIC = b'BLOGPST1'
+VOTERS_MAGIC = b'BLOGVOT1'
+END = b'SNAPEND!'
+
+HEADER = struct.Struct('<8sIqI')
+# id, createdAt, updatedAt, version, длины email, логина и пароля
+USER = struct.Struct('<qqqqIII')
+# id, authorId, createdAt, updatedAt, likes, dislikes, version,
+# смещение и длина текста в файле текстов (-1, если текст в снапшоте),
+# длины заголовка и текста (или превью, если текст в файле текстов)
+POST = struct.Struct('<qqqqqqqqqII')
+# voters_data.bin: сигнатура и число ячеек, за ними ячейки voters.VoterSlots
+VOTERS_HEADER = struct.Struct('<8sQ')
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# записи копятся в памяти и пишутся кусками примерно такого размера
+WRITE_CHUNK = 1024 * 1024
+# Прочитанные страницы отображения отпускаются кусками такого размера:
+# иначе к концу загрузки весь файл числится в памяти процесса вдобавок к
+# построенным объектам. Данные остаются в кэше ФС.
+RELEASE_CHUNK = 32 * 1024 * 1024
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def to_micros(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // MICROSECOND
+
+
+def _write_header(f, magic: bytes, count: int, next_id: int, content_file: Optional[str]):
+    name = (content_file or '').encode('utf-8')
+    f.write(HEADER.pack(magic, count, next_id, len(name)))
+    f.write(name)
+
+
+def _write_chunks(f, records: Iterable[bytes]):
+    parts = []
+    size = 0
+    for record in records:
+        parts.append(record)
+        size += len(record)
+        if size >= WRITE_CHUNK:
+            f.write(b''.join(parts))
+            parts = []
+            size = 0
+    f.write(b''.join(parts))
+    f.write(END)
+
+
+# users - объекты User
+def write_users(f, users: list, next_id: int):
+    _write_header(f, USERS_MAGIC, len(users), next_id, None)
+
+    def records():
+        for user in users:
+            email = user.email.encode('utf-8')
+            login = user.login.encode('utf-8')
+            password = user.password.encode('utf-8')
+            yield USER.pack(
+                user.id, to_micros(user.createdAt), to_micros(user.updatedAt), user.version,
+                len(email), len(login), len(password)
+            ) + email + login + password
+
+    _write_chunks(f, records())
+
+
+# records - кортежи (пост, ссылка): ссылка - (смещение, длина) текста
+# в файле текстов content_file, тогда вместо текста пишется превью;
+# None - текст пишется в снапшот
+def write_posts(f, records: list, next_id: int, content_file: Optional[str] = None):
+    _write_header(f, POSTS_MAGIC, len(records), next_id, content_file)
+
+    def packed():
+        for post, ref in records:
+            title = post.title.encode('utf-8')
+            if ref is None:
+                offset, length = -1, 0
+                text = post.content.encode('utf-8')
+            else:
+                offset, length = ref
+                text = post.preview.encode('utf-8')
+            created = to_micros(post.createdAt)
+            updated = created if post.updatedAt is post.createdAt else to_micros(post.updatedAt)
+            yield POST.pack(
+                post.id, post.authorId, created, updated, post.likes, post.dislikes, post.version,
+                offset, length, len(title), len(text)
+            ) + title + text
+
+    _write_chunks(f, packed())
+
+
+# Открытый снапшот: поля заголовка и обход записей. Отображение файла
+# закрывается вместе с ним, строки и даты записей от него не зависят.
+class Snapshot:
+    def __init__(self, path: str, magic: bytes):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size + len(END):
+                raise SnapshotError(f'{path}: файл обрезан')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            data.madvise(mmap.MADV_SEQUENTIAL)
+        self._released = 0
+        found, self.count, self.next_id, name_length = HEADER.unpack_from(data, 0)
+        if found != magic:
+            self.close()
+            raise SnapshotError(f'{path}: неизвестный формат {found!r}')
+        if data[size - len(END):] != END:
+            self.close()
+            raise SnapshotError(f'{path}: файл обрезан')
+        self._start = HEADER.size + name_length
+        self.content_file = data[HEADER.size:self._start].decode('utf-8') or None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # отпустить страницы, которые целиком лежат до position
+    def _release(self, position: int):
+        end = position - position % mmap.PAGESIZE
+        if hasattr(mmap, 'MADV_DONTNEED') and end > self._released:
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+
+    # (id, email, login, password, createdAt, updatedAt, version)
+    def users(self) -> Iterator[tuple]:
+        data = self._map
+        unpack = USER.unpack_from
+        size = USER.size
+        delta = timedelta
+        position = self._start
+        release_at = RELEASE_CHUNK
+        for _ in range(self.count):
+            if position >= release_at:
+                self._release(position)
+                release_at = position + RELEASE_CHUNK
+            uid, created, updated, version, email_length, login_length, password_length = unpack(data, position)
+            position += size
+            email = data[position:position + email_length].decode('utf-8')
+            position += email_length
+            login = data[position:position + login_length].decode('utf-8')
+            position += login_length
+            password = data[position:position + password_length].decode('utf-8')
+            position += password_length
+            created_at = EPOCH + delta(0, 0, created)
+            updated_at = created_at if updated == created else EPOCH + delta(0, 0, updated)
+            yield uid, email, login, password, created_at, updated_at, version
+
+    # (id, authorId, title, текст или превью, createdAt, updatedAt, likes,
+    # dislikes, version, ссылка (смещение, длина) или None)
+    def posts(self) -> Iterator[Tuple]:
+        data = self._map
+        unpack = POST.unpack_from
+        size = POST.size
+        delta = timedelta
+        position = self._start
+        release_at = RELEASE_CHUNK
+        for _ in range(self.count):
+            if position >= release_at:
+                self._release(position)
+                release_at = position + RELEASE_CHUNK
+            (pid, author_id, created, updated, likes, dislikes, version,
+             offset, length, title_length, text_length) = unpack(data, position)
+            position += size
+            title = data[position:position + title_length].decode('utf-8')
+            position += title_length
+            text = data[position:position + text_length].decode('utf-8')
+            position += text_length
+            created_at = EPOCH + delta(0, 0, created)
+            # у неизменявшихся постов обе даты - один объект, как у новых
+            updated_at = created_at if updated == created else EPOCH + delta(0, 0, updated)
+            ref = (offset, length) if offset >= 0 else None
+            yield pid, author_id, title, text, created_at, updated_at, likes, dislikes, version, ref
+
+
+def write_voters(f, slots: bytes):
+    f.write(VOTERS_HEADER.pack(VOTERS_MAGIC, len(slots)))
+    f.write(slots)
+    f.write(END)
+
+
+# Измененные страницы таблицы поверх уже записанного voters_data.bin.
+# Запись на месте не атомарна, но после сбоя посреди нее ячейки - смесь
+# старых и новых значений, а все изменения с прошлой записи еще лежат в
+# журнале постов (он удаляется только после снапшота) и доигрываются
+# при загрузке.
+def write_voter_pages(path: str, size: int, pages: List[Tuple[int, bytes]], page_size: int):
+    with open(path, 'r+b') as f:
+        header = f.read(VOTERS_HEADER.size)
+        if len(header) < VOTERS_HEADER.size:
+            raise SnapshotError(f'{path}: файл обрезан')
+        found, stored = VOTERS_HEADER.unpack(header)
+        if found != VOTERS_MAGIC or stored != size:
+            raise SnapshotError(f'{path}: таблица другого формата или размера')
+        for page, data in pages:
+            f.seek(VOTERS_HEADER.size + page * page_size)
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# таблица ячеек голосов целиком, в изменяемом буфере
+def read_voters(path: str) -> bytearray:
+    with open(path, 'rb') as f:
+        header = f.read(VOTERS_HEADER.size)
+        if len(header) < VOTERS_HEADER.size:
+            raise SnapshotError(f'{path}: файл обрезан')
+        found, size = VOTERS_HEADER.unpack(header)
+        if found != VOTERS_MAGIC:
+            raise SnapshotError(f'{path}: неизвестный формат {found!r}')
+        slots = bytearray(size)
+        if f.readinto(slots) != size or f.read() != END:
+            raise SnapshotError(f'{path}: файл обрезан')
+    return slots
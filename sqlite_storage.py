@@ -0,0 +1,675 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from indexes import Page
+from metrics import DUPLICATE_VOTES
+from models import Post, Storage, StorageBackend, User
+from ranking import trending_score
+from search import analyze
+from voters import VOTES
+
+
+# Схема - обычный SQL, без функций Python: в базу могут писать и другие
+# клиенты (sqlite3, скрипты резервного копирования и миграций). Термы для
+# поиска (search.analyze) и оценку trending (ranking.trending_score)
+# приложение считает само и пишет в posts_fts и колонку hot. Посты,
+# добавленные в обход приложения, попадут в поиск и trending при его
+# следующем запуске (_index_posts); голоса, измененные в обход, сдвинут
+# пост в trending только при следующем голосе через приложение.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL COLLATE NOCASE UNIQUE,
+    login TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    createdAt TEXT NOT NULL,
+    updatedAt TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    authorId INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    createdAt TEXT NOT NULL,
+    updatedAt TEXT NOT NULL,
+    likes INTEGER NOT NULL DEFAULT 0,
+    dislikes INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    hot INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (authorId, id);
+CREATE INDEX IF NOT EXISTS posts_created ON posts (createdAt, id);
+-- рейтинги для /api/posts/top и /trending (ranking.py): выборка первых K
+-- идет по индексу, голос обновляет его вместе со строкой
+CREATE INDEX IF NOT EXISTS posts_score ON posts ((likes - dislikes) DESC, id);
+CREATE INDEX IF NOT EXISTS posts_trending ON posts (hot DESC, id);
+-- полнотекстовый индекс хранит уже нормализованные термы (search.analyze),
+-- поэтому поиск понимает русские словоформы так же, как JSON-хранилище
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, content);
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+    DELETE FROM posts_fts WHERE rowid = old.id;
+END;
+-- кто как голосовал (voter - отпечаток голосующего, vote - voters.LIKE или
+-- DISLIKE); счетчики поста меняют триггеры в том же запросе, что и голос
+CREATE TABLE IF NOT EXISTS votes (
+    postId INTEGER NOT NULL,
+    voter BLOB NOT NULL,
+    vote INTEGER NOT NULL,
+    PRIMARY KEY (postId, voter)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS votes_insert AFTER INSERT ON votes BEGIN
+    UPDATE posts SET likes = likes + (new.vote = 1), dislikes = dislikes + (new.vote = 2),
+        version = version + 1
+    WHERE id = new.postId;
+END;
+CREATE TRIGGER IF NOT EXISTS votes_update AFTER UPDATE OF vote ON votes BEGIN
+    UPDATE posts SET likes = max(likes + (new.vote = 1) - (old.vote = 1), 0),
+        dislikes = max(dislikes + (new.vote = 2) - (old.vote = 2), 0),
+        version = version + 1
+    WHERE id = new.postId;
+END;
+CREATE TRIGGER IF NOT EXISTS posts_votes_delete AFTER DELETE ON posts BEGIN
+    DELETE FROM votes WHERE postId = old.id;
+END;
+"""
+
+USER_COLUMNS = 'id, email, login, password, createdAt, updatedAt, version'
+POST_COLUMNS = 'id, authorId, title, content, createdAt, updatedAt, likes, dislikes, version'
+# те же колонки для запросов с JOIN
+POSTS_TABLE_COLUMNS = ', '.join(f'posts.{column}' for column in POST_COLUMNS.split(', '))
+
+
+def _search_terms(text: str) -> str:
+    return ' '.join(analyze(text or ''))
+
+
+def _trending_score(likes: int, dislikes: int, created: str) -> int:
+    return trending_score(likes, dislikes, datetime.fromisoformat(created))
+
+
+# колонка hot появилась вместе с рейтингами; в базе, созданной раньше,
+# ее нужно добавить до индекса по ней
+def _migrate(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(posts)')}
+    if columns and 'hot' not in columns:
+        with conn:
+            conn.execute('ALTER TABLE posts ADD COLUMN hot INTEGER NOT NULL DEFAULT 0')
+
+
+# Соединение пакета: отдельные методы хранилища выполняют на нем свои
+# запросы, но не фиксируют транзакцию (with conn: ничего не делает).
+# Транзакцию целиком фиксирует ConnectionPool.batch().
+class _BatchConnection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# Пул соединений с базой.
+# Соединения создаются по мере надобности (не больше size) и переиспользуются,
+# вместе с ними переиспользуется и кэш подготовленных выражений sqlite3.
+class ConnectionPool:
+    def __init__(self, path: str, size: int = 8):
+        self.path = path
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # соединение открытого в этом потоке пакета
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            yield batch
+            return
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    # все запросы потока внутри блока идут в одной транзакции
+    @contextmanager
+    def batch(self):
+        if getattr(self._local, 'batch', None) is not None:
+            yield
+            return
+        with self.connection() as conn:
+            self._local.batch = _BatchConnection(conn)
+            try:
+                with conn:
+                    yield
+            finally:
+                self._local.batch = None
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            return self._connect()
+        return self._idle.get()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, cached_statements=256
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+
+# Хранилище в SQLite.
+# Данные живут в базе, а не в памяти процесса, поэтому несколько воркеров
+# uvicorn видят одно и то же состояние. Счетчики голосов меняются одним
+# UPDATE ... SET likes = likes + 1, что атомарно и между процессами.
+class SQLiteStorage(StorageBackend):
+    def __init__(self, path: str = 'blog.db', pool_size: int = 8):
+        super().__init__()
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            _migrate(conn)
+            conn.executescript(SCHEMA)
+            self._index_posts(conn)
+
+    def create_user(self, email: str, login: str, password: str) -> User:
+        now = datetime.now().isoformat()
+        with self.pool.connection() as conn:
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        'INSERT INTO users (email, login, password, createdAt, updatedAt) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (email, login, password, now, now)
+                    )
+            except sqlite3.IntegrityError:
+                self._raise_duplicate(conn, email, login)
+        self._notify('user', 'create', cursor.lastrowid)
+        return self.get_user_by_id(cursor.lastrowid)
+
+    def get_all_users(self) -> List[User]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'SELECT {USER_COLUMNS} FROM users ORDER BY id').fetchall()
+        return [self._user(row) for row in rows]
+
+    def get_users_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None) -> Page:
+        after_id = self._parse_id_cursor(after)
+        before_id = self._parse_id_cursor(before)
+        with self.pool.connection() as conn:
+            if before_id is not None:
+                rows = conn.execute(
+                    f'SELECT {USER_COLUMNS} FROM users WHERE id < ? ORDER BY id DESC LIMIT ?',
+                    (before_id, limit)
+                ).fetchall()[::-1]
+            else:
+                rows = conn.execute(
+                    f'SELECT {USER_COLUMNS} FROM users WHERE id > ? ORDER BY id LIMIT ?',
+                    (after_id or 0, limit)
+                ).fetchall()
+            if not rows:
+                return Page([], None, None)
+            has_next = self._exists(conn, 'SELECT 1 FROM users WHERE id > ? LIMIT 1', (rows[-1]['id'],))
+            has_prev = self._exists(conn, 'SELECT 1 FROM users WHERE id < ? LIMIT 1', (rows[0]['id'],))
+        users = [self._user(row) for row in rows]
+        return Page(
+            users,
+            str(users[-1].id) if has_next else None,
+            str(users[0].id) if has_prev else None
+        )
+
+    # каждая порция - отдельный короткий запрос, чтобы долгий экспорт
+    # не держал открытой транзакцию чтения
+    def iter_users(self, chunk_size: int = 500) -> Iterator[List[User]]:
+        with self.pool.connection() as conn:
+            until = conn.execute('SELECT coalesce(max(id), 0) FROM users').fetchone()[0]
+        last = 0
+        while last < until:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    f'SELECT {USER_COLUMNS} FROM users WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                    (last, until, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1]['id']
+            yield [self._user(row) for row in rows]
+
+    def get_user_by_id(self, user_id: int) -> Optional[User]:
+        return self._fetch_user('id = ?', user_id)
+
+    def count_users(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT count(*) FROM users').fetchone()[0]
+
+    def count_posts(self) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT count(*) FROM posts').fetchone()[0]
+
+    def get_user_by_email(self, email: str) -> Optional[User]:
+        return self._fetch_user('email = ?', email)
+
+    def get_user_by_login(self, login: str) -> Optional[User]:
+        return self._fetch_user('login = ?', login)
+
+    def update_user(self, user_id: int, email: str, login: str, password: str) -> Optional[User]:
+        with self.pool.connection() as conn:
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        'UPDATE users SET email = ?, login = ?, password = ?, updatedAt = ?, '
+                        'version = version + 1 WHERE id = ?',
+                        (email, login, password, datetime.now().isoformat(), user_id)
+                    )
+            except sqlite3.IntegrityError:
+                self._raise_duplicate(conn, email, login, user_id)
+        if cursor.rowcount == 0:
+            return None
+        self._notify('user', 'update', user_id)
+        return self.get_user_by_id(user_id)
+
+    def replace_password(self, user_id: int, old: str, new: str) -> bool:
+        return self._change(
+            'user', 'update', user_id,
+            'UPDATE users SET password = ?, version = version + 1 WHERE id = ? AND password = ?',
+            (new, user_id, old)
+        )
+
+    def delete_user(self, user_id: int) -> bool:
+        return self._change('user', 'delete', user_id, 'DELETE FROM users WHERE id = ?', (user_id,))
+
+    def create_post(self, authorId: int, title: str, content: str) -> Post:
+        created = datetime.now()
+        now = created.isoformat()
+        with self.pool.connection() as conn:
+            with conn:
+                cursor = conn.execute(
+                    'INSERT INTO posts (authorId, title, content, createdAt, updatedAt, hot) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (authorId, title, content, now, now, trending_score(0, 0, created))
+                )
+                conn.execute(
+                    'INSERT INTO posts_fts (rowid, title, content) VALUES (?, ?, ?)',
+                    (cursor.lastrowid, _search_terms(title), _search_terms(content))
+                )
+        self._notify('post', 'create', cursor.lastrowid)
+        return self.get_post_by_id(cursor.lastrowid)
+
+    def get_all_posts(self) -> List[Post]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'SELECT {POST_COLUMNS} FROM posts ORDER BY id').fetchall()
+            return self._posts(conn, rows)
+
+    def get_posts_page(self, limit: int, after: Optional[str] = None,
+                       before: Optional[str] = None, order: str = 'id') -> Page:
+        if order == 'id':
+            key_sql = 'id'
+            after_key = self._parse_id_cursor(after)
+            before_key = self._parse_id_cursor(before)
+        elif order == 'createdAt':
+            key_sql = '(createdAt, id)'
+            after_key = self._created_key(self._parse_created_cursor(after))
+            before_key = self._created_key(self._parse_created_cursor(before))
+        else:
+            raise ValueError(f'Неизвестный порядок сортировки: {order}')
+        order_sql = 'createdAt, id' if order == 'createdAt' else 'id'
+        desc_sql = 'createdAt DESC, id DESC' if order == 'createdAt' else 'id DESC'
+        placeholder = '(?, ?)' if order == 'createdAt' else '?'
+
+        with self.pool.connection() as conn:
+            if before_key is not None:
+                rows = conn.execute(
+                    f'SELECT {POST_COLUMNS} FROM posts WHERE {key_sql} < {placeholder} '
+                    f'ORDER BY {desc_sql} LIMIT ?',
+                    (*self._as_tuple(before_key), limit)
+                ).fetchall()[::-1]
+            elif after_key is not None:
+                rows = conn.execute(
+                    f'SELECT {POST_COLUMNS} FROM posts WHERE {key_sql} > {placeholder} '
+                    f'ORDER BY {order_sql} LIMIT ?',
+                    (*self._as_tuple(after_key), limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f'SELECT {POST_COLUMNS} FROM posts ORDER BY {order_sql} LIMIT ?', (limit,)
+                ).fetchall()
+            if not rows:
+                return Page([], None, None)
+            first, last = rows[0], rows[-1]
+            if order == 'createdAt':
+                first_key, last_key = (first['createdAt'], first['id']), (last['createdAt'], last['id'])
+            else:
+                first_key, last_key = (first['id'],), (last['id'],)
+            has_next = self._exists(
+                conn, f'SELECT 1 FROM posts WHERE {key_sql} > {placeholder} LIMIT 1', last_key
+            )
+            has_prev = self._exists(
+                conn, f'SELECT 1 FROM posts WHERE {key_sql} < {placeholder} LIMIT 1', first_key
+            )
+            posts = self._posts(conn, rows)
+        return Page(
+            posts,
+            self._post_cursor(posts[-1], order) if has_next else None,
+            self._post_cursor(posts[0], order) if has_prev else None
+        )
+
+    def get_post_by_id(self, post_id: int) -> Optional[Post]:
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT {POST_COLUMNS} FROM posts WHERE id = ?', (post_id,)).fetchone()
+            return self._posts(conn, [row])[0] if row is not None else None
+
+    def get_posts_by_author(self, authorId: int) -> List[Post]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {POST_COLUMNS} FROM posts WHERE authorId = ? ORDER BY id', (authorId,)
+            ).fetchall()
+            return self._posts(conn, rows)
+
+    def iter_posts(self, author_id: Optional[int] = None, created_after: Optional[datetime] = None,
+                   chunk_size: int = 500) -> Iterator[List[Post]]:
+        where = 'id > ? AND id <= ?'
+        params = ()
+        if author_id is not None:
+            where += ' AND authorId = ?'
+            params += (author_id,)
+        if created_after is not None:
+            where += ' AND createdAt > ?'
+            params += (created_after.isoformat(),)
+        with self.pool.connection() as conn:
+            until = conn.execute('SELECT coalesce(max(id), 0) FROM posts').fetchone()[0]
+        last = 0
+        while last < until:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    f'SELECT {POST_COLUMNS} FROM posts WHERE {where} ORDER BY id LIMIT ?',
+                    (last, until, *params, chunk_size)
+                ).fetchall()
+                posts = self._posts(conn, rows)
+            if not posts:
+                return
+            last = posts[-1].id
+            yield posts
+
+    def update_post(self, post_id: int, title: str, content: str) -> Optional[Post]:
+        with self.pool.connection() as conn:
+            with conn:
+                updated = conn.execute(
+                    'UPDATE posts SET title = ?, content = ?, updatedAt = ?, version = version + 1 '
+                    'WHERE id = ?',
+                    (title, content, datetime.now().isoformat(), post_id)
+                ).rowcount > 0
+                if updated:
+                    conn.execute(
+                        'UPDATE posts_fts SET title = ?, content = ? WHERE rowid = ?',
+                        (_search_terms(title), _search_terms(content), post_id)
+                    )
+        if not updated:
+            return None
+        self._notify('post', 'update', post_id)
+        return self.get_post_by_id(post_id)
+
+    def search_posts(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[Post, float]]]:
+        terms = set(analyze(query))
+        if not terms:
+            return 0, []
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        with self.pool.connection() as conn:
+            total = conn.execute(
+                'SELECT count(*) FROM posts_fts WHERE posts_fts MATCH ?', (match,)
+            ).fetchone()[0]
+            # bm25() тем меньше, чем документ релевантнее; заголовок весит вдвое больше
+            rows = conn.execute(
+                f'SELECT {POSTS_TABLE_COLUMNS}, -bm25(posts_fts, 2.0, 1.0) AS score '
+                'FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid '
+                'WHERE posts_fts MATCH ? ORDER BY score DESC, posts.id LIMIT ? OFFSET ?',
+                (match, limit, offset)
+            ).fetchall()
+            posts = self._posts(conn, rows)
+        return total, [(post, row['score']) for post, row in zip(posts, rows)]
+
+    def get_top_posts(self, limit: int) -> List[Post]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {POST_COLUMNS} FROM posts ORDER BY likes - dislikes DESC, id LIMIT ?', (limit,)
+            ).fetchall()
+            return self._posts(conn, rows)
+
+    def get_trending_posts(self, limit: int) -> List[Post]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {POST_COLUMNS} FROM posts '
+                'ORDER BY hot DESC, id LIMIT ?', (limit,)
+            ).fetchall()
+            return self._posts(conn, rows)
+
+    def delete_post(self, post_id: int) -> bool:
+        return self._change('post', 'delete', post_id, 'DELETE FROM posts WHERE id = ?', (post_id,))
+
+    def like_post(self, post_id: int, voter: Optional[bytes] = None) -> bool:
+        if voter is not None:
+            return self._vote(post_id, 'likes', voter)
+        return self._count_vote(post_id, 'likes')
+
+    def dislike_post(self, post_id: int, voter: Optional[bytes] = None) -> bool:
+        if voter is not None:
+            return self._vote(post_id, 'dislikes', voter)
+        return self._count_vote(post_id, 'dislikes')
+
+    # голос без голосующего: счетчик и оценка trending - в одной транзакции,
+    # блокировка на запись не дает другому процессу вклиниться между ними
+    def _count_vote(self, post_id: int, field: str) -> bool:
+        with self.pool.connection() as conn:
+            with conn:
+                row = conn.execute(
+                    f'UPDATE posts SET {field} = {field} + 1, version = version + 1 WHERE id = ? '
+                    'RETURNING likes, dislikes, createdAt', (post_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                self._update_hot(conn, post_id, row)
+        self._notify('post', 'vote', post_id)
+        return True
+
+    # Повторный голос отсеивается чтением, без блокировки на запись.
+    # Новый или другой голос - одна вставка: счетчики меняют триггеры votes_*,
+    # а одновременный такой же голос ничего не изменит (WHERE в ON CONFLICT).
+    def _vote(self, post_id: int, field: str, voter: bytes) -> bool:
+        vote = VOTES[field]
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT vote FROM votes WHERE postId = ? AND voter = ?', (post_id, voter)
+            ).fetchone()
+            if row is not None and row[0] == vote:
+                DUPLICATE_VOTES.inc()
+                return True
+            with conn:
+                changed = conn.execute(
+                    'INSERT INTO votes (postId, voter, vote) SELECT ?, ?, ? '
+                    'WHERE EXISTS (SELECT 1 FROM posts WHERE id = ?) '
+                    'ON CONFLICT (postId, voter) DO UPDATE SET vote = excluded.vote '
+                    'WHERE vote != excluded.vote',
+                    (post_id, voter, vote, post_id)
+                ).rowcount
+                if changed:
+                    row = conn.execute(
+                        'SELECT likes, dislikes, createdAt FROM posts WHERE id = ?', (post_id,)
+                    ).fetchone()
+                    self._update_hot(conn, post_id, row)
+            if not changed:
+                if not self._exists(conn, 'SELECT 1 FROM posts WHERE id = ?', (post_id,)):
+                    return False
+                DUPLICATE_VOTES.inc()
+                return True
+        self._notify('post', 'vote', post_id)
+        return True
+
+    # при первом запуске переносим данные из JSON-хранилища (его снапшоты
+    # только читаются: в формате json хранилище не пишет их при загрузке,
+    # а закрывается оно без снапшота)
+    @contextmanager
+    def _json_source(self):
+        # таблица голосующих в SQLite не переносится (см. таблицу votes)
+        source = Storage(snapshot_format='json', vote_slots=0)
+        try:
+            yield source
+        finally:
+            source.close(snapshot=False)
+
+    def load_users_from_file(self):
+        with self.pool.connection() as conn:
+            if self._exists(conn, 'SELECT 1 FROM users LIMIT 1', ()):
+                return
+            with self._json_source() as source:
+                source.load_users_from_file()
+                with conn:
+                    conn.executemany(
+                        f'INSERT INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        [(u.id, u.email, u.login, u.password, u.createdAt.isoformat(),
+                          u.updatedAt.isoformat(), u.version) for u in source.get_all_users()]
+                    )
+
+    def load_posts_from_file(self):
+        with self.pool.connection() as conn:
+            if self._exists(conn, 'SELECT 1 FROM posts LIMIT 1', ()):
+                return
+            with self._json_source() as source:
+                source.load_posts_from_file()
+                with conn:
+                    conn.executemany(
+                        f'INSERT INTO posts ({POST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [(p.id, p.authorId, p.title, p.content, p.createdAt.isoformat(),
+                          p.updatedAt.isoformat(), p.likes, p.dislikes, p.version)
+                         for p in source.get_all_posts()]
+                    )
+                    self._index_posts(conn)
+
+    # пакет - одна транзакция; ошибка ограничения в отдельном запросе
+    # откатывает только этот запрос, а не весь пакет
+    def batch(self):
+        return self.pool.batch()
+
+    def close(self):
+        self.pool.close()
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self.pool.connection() as conn:
+            with conn:
+                return conn.execute(sql, params).rowcount
+
+    # изменение одной записи с уведомлением подписчиков
+    def _change(self, kind: str, action: str, obj_id: int, sql: str, params: tuple) -> bool:
+        changed = self._execute(sql, params) > 0
+        if changed:
+            self._notify(kind, action, obj_id)
+        return changed
+
+    def _update_hot(self, conn: sqlite3.Connection, post_id: int, row: sqlite3.Row):
+        conn.execute(
+            'UPDATE posts SET hot = ? WHERE id = ?',
+            (_trending_score(row['likes'], row['dislikes'], row['createdAt']), post_id)
+        )
+
+    # Посты без записи в поиске и без оценки trending: добавленные в обход
+    # приложения, перенесенные из JSON или из базы, созданной до поиска.
+    # id растут, поэтому новые посты - те, что дальше последней записи
+    # posts_fts; оценка trending никогда не равна 0 (в ней дата создания).
+    def _index_posts(self, conn: sqlite3.Connection):
+        last = conn.execute('SELECT max(rowid) FROM posts_fts').fetchone()[0] or 0
+        rows = conn.execute('SELECT id, title, content FROM posts WHERE id > ?', (last,)).fetchall()
+        scores = conn.execute('SELECT id, likes, dislikes, createdAt FROM posts WHERE hot = 0').fetchall()
+        with conn:
+            conn.executemany(
+                'INSERT INTO posts_fts (rowid, title, content) VALUES (?, ?, ?)',
+                [(row['id'], _search_terms(row['title']), _search_terms(row['content'])) for row in rows]
+            )
+            conn.executemany(
+                'UPDATE posts SET hot = ? WHERE id = ?',
+                [(_trending_score(row['likes'], row['dislikes'], row['createdAt']), row['id'])
+                 for row in scores]
+            )
+
+    def _exists(self, conn: sqlite3.Connection, sql: str, params: tuple) -> bool:
+        return conn.execute(sql, params).fetchone() is not None
+
+    def _fetch_user(self, where: str, value) -> Optional[User]:
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT {USER_COLUMNS} FROM users WHERE {where}', (value,)).fetchone()
+        return self._user(row) if row is not None else None
+
+    # понятное сообщение вместо ошибки ограничения UNIQUE
+    def _raise_duplicate(self, conn: sqlite3.Connection, email: str, login: str, user_id: int = 0):
+        if self._exists(conn, 'SELECT 1 FROM users WHERE email = ? AND id != ?', (email, user_id)):
+            raise ValueError(f'Пользователь с email {email} уже существует')
+        raise ValueError(f'Пользователь с логином {login} уже существует')
+
+    def _created_key(self, key):
+        if key is None:
+            return None
+        created, post_id = key
+        return (created.isoformat(), post_id)
+
+    def _as_tuple(self, key) -> tuple:
+        return key if isinstance(key, tuple) else (key,)
+
+    def _user(self, row: sqlite3.Row) -> User:
+        return User(
+            row['id'], row['email'], row['login'], row['password'],
+            datetime.fromisoformat(row['createdAt']),
+            datetime.fromisoformat(row['updatedAt']),
+            row['version']
+        )
+
+    def _post(self, row: sqlite3.Row) -> Post:
+        return Post(
+            row['id'], row['authorId'], row['title'], row['content'],
+            datetime.fromisoformat(row['createdAt']),
+            datetime.fromisoformat(row['updatedAt']),
+            row['likes'], row['dislikes'], row['version']
+        )
+
+    # посты вместе с авторами: авторы всей выборки читаются одним запросом
+    def _posts(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> List[Post]:
+        posts = [self._post(row) for row in rows]
+        author_ids = list({post.authorId for post in posts})
+        if not author_ids:
+            return posts
+        authors = {}
+        # не больше 500 параметров в запросе - ограничение старых версий SQLite
+        for i in range(0, len(author_ids), 500):
+            chunk = author_ids[i:i + 500]
+            for row in conn.execute(
+                f'SELECT {USER_COLUMNS} FROM users WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+            ):
+                authors[row['id']] = self._user(row)
+        for post in posts:
+            post.author = authors.get(post.authorId)
+        return posts
@@ -0,0 +1,68 @@
+// Живые обновления страниц: счетчики голосов и новые посты приходят из
+// /api/events (Server-Sent Events), голос отправляется без перезагрузки.
+// Без скриптов страницы работают как раньше: форма голоса отправляется
+// обычным POST с переходом на страницу поста.
+(function () {
+    var posts = {};
+    document.querySelectorAll('[data-post-id]').forEach(function (element) {
+        posts[element.dataset.postId] = {element: element, version: Number(element.dataset.version)};
+    });
+    var banner = document.getElementById('new-posts');
+    var fresh = 0;
+
+    // события и ответы могут прийти не по порядку - старые версии пропускаем
+    function applyVotes(data) {
+        var post = posts[data.id];
+        if (!post || data.version <= post.version) {
+            return;
+        }
+        post.version = data.version;
+        post.element.querySelectorAll('[data-likes]').forEach(function (node) {
+            node.textContent = data.likes;
+        });
+        post.element.querySelectorAll('[data-dislikes]').forEach(function (node) {
+            node.textContent = data.dislikes;
+        });
+    }
+
+    document.querySelectorAll('form[data-vote]').forEach(function (form) {
+        form.addEventListener('submit', function (event) {
+            event.preventDefault();
+            fetch(form.action, {method: 'POST', headers: {Accept: 'application/json'}})
+                .then(function (response) {
+                    if (!response.ok) {
+                        throw new Error(response.status);
+                    }
+                    return response.json();
+                })
+                .then(applyVotes)
+                .catch(function () {
+                    // пост удален или сервер недоступен - покажет страница
+                    location.reload();
+                });
+        });
+    });
+
+    var ids = Object.keys(posts);
+    if (!ids.length && !banner) {
+        return;
+    }
+    var query = ids.map(function (id) { return 'post=' + id; });
+    if (banner) {
+        query.push('new=true');
+    }
+    var source = new EventSource('/api/events?' + query.join('&'));
+    source.addEventListener('vote', function (event) {
+        applyVotes(JSON.parse(event.data));
+    });
+    if (banner) {
+        source.addEventListener('post', function () {
+            fresh += 1;
+            banner.querySelector('[data-count]').textContent = fresh;
+            banner.hidden = false;
+        });
+        source.addEventListener('reset', function () {
+            banner.hidden = false;
+        });
+    }
+})();
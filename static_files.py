@@ -0,0 +1,72 @@
+import hashlib
+import os
+from typing import Dict, Optional
+from starlette.staticfiles import StaticFiles
+
+# Статика (стили) с отпечатком содержимого в имени: style.css отдается
+# как /static/style.<хеш>.css. Такой адрес меняется вместе с файлом, поэтому
+# браузер может кэшировать его навсегда (immutable) и не перепроверять.
+# Файл без отпечатка тоже отдается, но с обязательной перепроверкой.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    def __init__(self, directory: str, prefix: str = '/static'):
+        super().__init__(directory=directory)
+        self.prefix = prefix
+        # имя файла -> хеш содержимого; файлы читаются один раз при первом
+        # обращении, после изменения файла нужен перезапуск
+        self._hashes: Dict[str, str] = {}
+
+    # хеш содержимого файла или None, если файла нет; путь проверяется
+    # так же, как при отдаче, поэтому выйти за пределы каталога нельзя
+    def fingerprint(self, name: str) -> Optional[str]:
+        digest = self._hashes.get(name)
+        if digest is None:
+            full_path, stat_result = self.lookup_path(name)
+            if stat_result is None:
+                return None
+            with open(full_path, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+            self._hashes[name] = digest
+        return digest
+
+    # адрес файла для шаблонов: {{ static_url('style.css') }}
+    def url(self, name: str) -> str:
+        digest = self.fingerprint(name)
+        if digest is None:
+            raise FileNotFoundError(os.path.join(self.directory, name))
+        base, ext = os.path.splitext(name)
+        return f'{self.prefix}/{base}.{digest}{ext}'
+
+    # style.<хеш>.css -> style.css, если хеш совпадает с текущим; с чужим
+    # хешем (старая версия файла) путь не найдется и будет 404
+    def _strip_fingerprint(self, path: str):
+        base, ext = os.path.splitext(path)
+        name, dot, digest = base.rpartition('.')
+        if dot and name and self.fingerprint(name + ext) == digest:
+            return name + ext
+        return None
+
+    # сжатие ответа делает ETag слабым (W/"..."), а StaticFiles сравнивает
+    # If-None-Match строго; здесь годится любая из форм
+    def is_not_modified(self, response_headers, request_headers) -> bool:
+        if_none_match = request_headers.get('if-none-match')
+        etag = response_headers.get('etag')
+        if if_none_match is not None and etag is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        return super().is_not_modified(response_headers, request_headers)
+
+    async def get_response(self, path: str, scope):
+        original = self._strip_fingerprint(path)
+        if original is None:
+            response = await super().get_response(path, scope)
+            if response.status_code == 200:
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        response = await super().get_response(original, scope)
+        if response.status_code in (200, 304):
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
@@ -0,0 +1,42 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Приложение запускается во временном каталоге: хранилище пишет файлы
+# данных и журналы в текущий каталог, а не в каталог проекта. Шаблоны
+# и статика копируются туда же, пути к ним относительные.
+@pytest.fixture(scope='session')
+def client(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('app')
+    for name in ('templates', 'static'):
+        if os.path.isdir(os.path.join(ROOT, name)):
+            shutil.copytree(os.path.join(ROOT, name), workdir / name)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from fastapi.testclient import TestClient
+        import main
+        with TestClient(main.app) as client:
+            yield client
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def author(client):
+    user = client.get('/api/users/?limit=1').json()[0]
+    return user['id']
+
+
+def create_post(client, author_id: int, title: str = 'Тестовый пост') -> dict:
+    response = client.post('/api/posts/', json={
+        'authorId': author_id, 'title': title, 'content': 'Текст тестового поста'
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,44 @@
+from conftest import create_post
+
+
+def test_post_list_304_keeps_handler_headers(client, author):
+    for number in range(3):
+        create_post(client, author, f'Пост для страницы {number}')
+    response = client.get('/api/posts/?limit=2')
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == 'no-cache'
+    assert 'x-next-cursor' in response.headers
+
+    not_modified = client.get('/api/posts/?limit=2', headers={'If-None-Match': response.headers['etag']})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b''
+    for name in ('etag', 'cache-control', 'x-next-cursor', 'link'):
+        assert not_modified.headers[name] == response.headers[name]
+    assert 'content-type' not in not_modified.headers
+
+
+def test_post_304_keeps_last_modified(client, author):
+    post = create_post(client, author)
+    response = client.get(f'/api/posts/{post["id"]}')
+    not_modified = client.get(f'/api/posts/{post["id"]}', headers={
+        'If-Modified-Since': response.headers['last-modified']
+    })
+    assert not_modified.status_code == 304
+    assert not_modified.headers['etag'] == response.headers['etag']
+    assert not_modified.headers['cache-control'] == 'no-cache'
+
+
+def test_post_list_304_keeps_vary(client, author):
+    for number in range(3):
+        create_post(client, author, f'Пост для сжатия {number}')
+    headers = {'Accept-Encoding': 'gzip'}
+    response = client.get('/api/posts/?limit=50', headers=headers)
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+
+    headers['If-None-Match'] = response.headers['etag']
+    not_modified = client.get('/api/posts/?limit=50', headers=headers)
+    assert not_modified.status_code == 304
+    assert not_modified.headers['vary'] == 'Accept-Encoding'
+    assert not_modified.headers['cache-control'] == 'no-cache'
+    assert 'content-encoding' not in not_modified.headers
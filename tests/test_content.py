@@ -0,0 +1,59 @@
+import copy
+import os
+
+from content import ContentStore
+from models import Storage
+
+
+def lazy_storage() -> Storage:
+    storage = Storage(contents=ContentStore(cache_chars=0, rewrite_min=0))
+    storage.load_users_from_file()
+    storage.load_posts_from_file()
+    return storage
+
+
+def test_read_held_post_after_compaction(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = lazy_storage()
+    try:
+        first = storage.create_post(1, 'Первый пост', 'Текст первого поста. ' * 20)
+        second = storage.create_post(1, 'Второй пост', 'Текст второго поста. ' * 20)
+        storage.posts_log.compact()
+        # чтение отображает файл текстов, каким он был до следующего снапшота
+        assert first.content == 'Текст первого поста. ' * 20
+        third = storage.create_post(1, 'Третий пост', 'Текст третьего поста. ' * 20)
+        # запись журнала кодируется в фоне и читает текст; пусть прочитает
+        # его из памяти, до снапшота
+        storage.flush()
+        storage.posts_log.compact()
+
+        # читатель взял пост, текст которого дописан в файл после отображения
+        held = copy.copy(storage.get_post_by_id(third.id))
+        old_file = held._ref[0]
+        # мусора больше, чем живых текстов: снапшот переписывает тексты
+        # в новый файл и удаляет прежний
+        storage.update_post(third.id, 'Третий пост', 'Новый текст третьего поста')
+        storage.delete_post(second.id)
+        storage.posts_log.compact()
+        assert storage.contents.current is not old_file
+        assert not os.path.exists(old_file.path)
+
+        assert held.content == 'Текст третьего поста. ' * 20
+        assert storage.get_post_by_id(first.id).content == 'Текст первого поста. ' * 20
+    finally:
+        storage.close()
+
+
+def test_reload_reads_bodies_from_content_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = lazy_storage()
+    post = storage.create_post(1, 'Пост', 'Текст, который уйдет в файл текстов')
+    storage.close()
+
+    storage = lazy_storage()
+    try:
+        loaded = storage.get_post_by_id(post.id)
+        assert loaded._content is None
+        assert loaded.content == 'Текст, который уйдет в файл текстов'
+    finally:
+        storage.close()
@@ -0,0 +1,112 @@
+import secrets
+
+import pytest
+
+from conftest import create_post
+from models import Storage
+from voter_tokens import voter_tokens
+from voters import PAGE_SIZE
+
+JSON = {'Accept': 'application/json'}
+
+
+def like(client, post_id: int) -> int:
+    response = client.post(f'/posts/{post_id}/like', headers=JSON)
+    assert response.status_code == 200, response.text
+    return response.json()['likes']
+
+
+def test_rotating_voter_cookie_does_not_add_votes(client, author):
+    post = create_post(client, author)
+    client.cookies.clear()
+    assert like(client, post['id']) == 1
+    for _ in range(5):
+        # cookie, придуманные клиентом: без подписи и с чужой подписью
+        client.cookies.set('voter', secrets.token_urlsafe(16))
+        assert like(client, post['id']) == 1
+        client.cookies.set('voter', f'{secrets.token_urlsafe(16)}.{secrets.token_urlsafe(16)}')
+        assert like(client, post['id']) == 1
+    client.cookies.clear()
+
+
+def test_signed_voter_cookie_votes_once(client, author):
+    post = create_post(client, author)
+    client.cookies.clear()
+    page = client.get(f'/posts/{post["id"]}')
+    assert 'voter' in page.cookies
+    assert like(client, post['id']) == 1
+    assert like(client, post['id']) == 1
+    # без метки голос считается по адресу - это другой голосующий
+    client.cookies.clear()
+    assert like(client, post['id']) == 2
+    assert like(client, post['id']) == 2
+
+
+def test_logged_in_user_votes_once(client, author):
+    post = create_post(client, author)
+    client.cookies.clear()
+    response = client.post('/api/auth/login', json={'login': 'testuser', 'password': '123456'})
+    assert response.status_code == 200, response.text
+    for _ in range(3):
+        client.cookies.set('voter', secrets.token_urlsafe(16))
+        assert like(client, post['id']) == 1
+    client.cookies.clear()
+
+
+def test_voter_tokens_are_rate_limited(client, author):
+    post = create_post(client, author)
+    issued = 0
+    for _ in range(voter_tokens.limit + 3):
+        client.cookies.clear()
+        if 'voter' in client.get(f'/posts/{post["id"]}').cookies:
+            issued += 1
+    client.cookies.clear()
+    assert 0 < issued <= voter_tokens.limit
+
+
+def small_storage() -> Storage:
+    # голоса попадают в журнал только по flush()
+    storage = Storage(votes_flush_interval=3600, vote_slots=4 * PAGE_SIZE)
+    storage.load_users_from_file()
+    storage.load_posts_from_file()
+    return storage
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_failed_posts_snapshot_keeps_voter_free(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = small_storage()
+    post = storage.create_post(1, 'Пост', 'Текст поста')
+    storage.flush()
+    # голос есть только в памяти, и снапшот, который его сохранит, падает
+    assert storage.like_post(post.id, b'voter')
+    write_snapshot = storage._write_snapshot
+
+    def failing_write(name, write, binary=None):
+        if name == 'posts_data':
+            raise OSError('Нет места на диске')
+        return write_snapshot(name, write, binary)
+
+    monkeypatch.setattr(storage, '_write_snapshot', failing_write)
+    storage.posts_log.compact()
+    storage.votes.close()
+
+    # перезапуск с тем, что успело попасть на диск
+    restarted = small_storage()
+    try:
+        assert restarted.get_post_by_id(post.id).likes == 0
+        assert restarted.like_post(post.id, b'voter')
+        assert restarted.get_post_by_id(post.id).likes == 1
+        restarted.flush()
+        restarted.posts_log.compact()
+    finally:
+        restarted.close()
+
+    # после удачного снапшота голос и ячейка на диске вместе
+    reloaded = small_storage()
+    try:
+        assert reloaded.get_post_by_id(post.id).likes == 1
+        assert reloaded.like_post(post.id, b'voter')
+        assert reloaded.get_post_by_id(post.id).likes == 1
+    finally:
+        reloaded.close(snapshot=False)
@@ -1,6 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel, validator
 from models import storage
+from http_utils import check_conditional, items_etag, record_etag, set_page_headers
+from bulk import delete_items, item_result, run_bulk, validate
+from export import export_response
+from serializers import encode_array, encode_user, json_response, user_to_dict
+from passwords import hasher
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -32,75 +38,146 @@ class UpdateUserRequest(BaseModel):
     login: str
     password: str
 
+class BulkUpdateUserRequest(UpdateUserRequest):
+    id: int
+
+# пароли хранятся хешами (passwords.py), хеш считается в пуле потоков
 @router.post("/")
 async def create_new_user(user_data: CreateUserRequest):
+    password = await hasher.hash(user_data.password)
     try:
         user = storage.create_user(
             email=user_data.email,
             login=user_data.login,
-            password=user_data.password
+            password=password
         )
         
-        return {
-            "id": user.id,
-            "email": user.email,
-            "login": user.login,
-            "createdAt": user.createdAt.isoformat(),
-            "updatedAt": user.updatedAt.isoformat()
-        }
+        return json_response(encode_user(user))
     except Exception as error:
         raise HTTPException(status_code=400, detail=str(error))
 
+# Пакетные операции, формат тот же, что у /api/posts/bulk.
+# Маршруты объявлены раньше /{user_id}.
+
+# пароли порции заменяются хешами до транзакции, все разом в пуле;
+# элементы с ошибками остаются как есть - их отклонит проверка в apply
+def _hash_passwords(model):
+    async def prepare(chunk):
+        items = [item for index, item in chunk if validate(model, item)[1] is None]
+        hashes = await hasher.hash_many(item['password'] for item in items)
+        for item, password in zip(items, hashes):
+            item['password'] = password
+    return prepare
+
+def _create_users(chunk):
+    results = []
+    for index, item in chunk:
+        user_data, error = validate(CreateUserRequest, item)
+        if error is not None:
+            results.append(item_result(index, 422, error=error))
+            continue
+        try:
+            user = storage.create_user(
+                email=user_data.email,
+                login=user_data.login,
+                password=user_data.password
+            )
+        except ValueError as error:
+            results.append(item_result(index, 400, error=str(error)))
+            continue
+        results.append(item_result(index, 201, user.id))
+    return results
+
+def _update_users(chunk):
+    results = []
+    for index, item in chunk:
+        user_data, error = validate(BulkUpdateUserRequest, item)
+        if error is not None:
+            results.append(item_result(index, 422, error=error))
+            continue
+        try:
+            user = storage.update_user(
+                user_data.id,
+                email=user_data.email,
+                login=user_data.login,
+                password=user_data.password
+            )
+        except ValueError as error:
+            results.append(item_result(index, 400, user_data.id, str(error)))
+            continue
+        if user is None:
+            results.append(item_result(index, 404, user_data.id, "Пользователь не найден"))
+        else:
+            results.append(item_result(index, 200, user.id))
+    return results
+
+@router.post("/bulk")
+async def bulk_create_users(request: Request):
+    return await run_bulk(request, _create_users, _hash_passwords(CreateUserRequest))
+
+@router.put("/bulk")
+async def bulk_update_users(request: Request):
+    return await run_bulk(request, _update_users, _hash_passwords(BulkUpdateUserRequest))
+
+@router.delete("/bulk")
+async def bulk_delete_users(request: Request):
+    return await run_bulk(request, lambda chunk: delete_items(chunk, storage.delete_user, "Пользователь не найден"))
+
 @router.get("/")
-async def get_all_users():
-    users = storage.get_all_users()
-    
-    users_list = []
-    for user in users:
-        users_list.append({
-            "id": user.id,
-            "email": user.email,
-            "login": user.login,
-            "createdAt": user.createdAt.isoformat(),
-            "updatedAt": user.updatedAt.isoformat()
-        })
+async def get_all_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    before: Optional[str] = None
+):
+    try:
+        page = storage.get_users_page(limit, after=after, before=before)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    set_page_headers(request, response, page)
+    etag = items_etag("users", page.items, page.next_cursor, page.prev_cursor)
+    not_modified = check_conditional(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    return users_list
+    return json_response(encode_array(encode_user(user) for user in page.items), response)
+
+# Выгрузка всех пользователей потоком, без паролей
+@router.get("/export")
+async def export_users(format: str = Query("ndjson", pattern="^(ndjson|json)$")):
+    return export_response(storage.iter_users(), user_to_dict, format, "users")
 
 @router.get("/{user_id}")
-async def get_user_by_id(user_id: int):
+async def get_user_by_id(user_id: int, request: Request, response: Response):
     user = storage.get_user_by_id(user_id)
     
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    return {
-        "id": user.id,
-        "email": user.email,
-        "login": user.login,
-        "createdAt": user.createdAt.isoformat(),
-        "updatedAt": user.updatedAt.isoformat()
-    }
+    not_modified = check_conditional(request, response, record_etag("user", user), user.updatedAt)
+    if not_modified:
+        return not_modified
+    
+    return json_response(encode_user(user), response)
 
 @router.put("/{user_id}")
 async def update_user_data(user_id: int, user_data: UpdateUserRequest):
-    user = storage.update_user(
-        user_id=user_id,
-        email=user_data.email,
-        login=user_data.login,
-        password=user_data.password
-    )
+    password = await hasher.hash(user_data.password)
+    try:
+        user = storage.update_user(
+            user_id=user_id,
+            email=user_data.email,
+            login=user_data.login,
+            password=password
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
     
     if user is None:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
-    return {
-        "id": user.id,
-        "email": user.email,
-        "login": user.login,
-        "createdAt": user.createdAt.isoformat(),
-        "updatedAt": user.updatedAt.isoformat()
-    }
+    return json_response(encode_user(user))
 
 @router.delete("/{user_id}")
 async def delete_user_by_id(user_id: int):
@@ -0,0 +1,111 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Метки голосующих без входа: cookie вида <id>.<подпись>, подпись - HMAC
+# от id на секрете сервера. Голос с меткой считается по одному на пост
+# (см. http_utils.voter_fingerprint), поэтому придумать метку клиент не
+# может: без подписи или с чужой подписью она не действует, и голос
+# считается по адресу клиента.
+#
+# Новые метки выдаются не чаще limit раз за period секунд на адрес:
+# иначе клиент мог бы получать их пачками и голосовать каждой. Сверх
+# лимита страница отдается без метки. Счет выдач - в памяти процесса,
+# у каждого воркера свой.
+#
+# Секрет берется из BLOG_VOTER_SECRET, а без нее создается один раз и
+# хранится в файле рядом с данными: метки должны пережить перезапуск и
+# одинаково проверяться всеми воркерами.
+
+SECRET_FILE = 'voter_secret.key'
+SIGNATURE_BYTES = 16
+DEFAULT_LIMIT = 10
+DEFAULT_PERIOD = 3600.0
+MAX_CLIENTS = 100_000
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def load_secret(path: str = SECRET_FILE) -> bytes:
+    secret = os.environ.get('BLOG_VOTER_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # создан раньше или соседним воркером
+        with open(path, 'rb') as f:
+            return f.read()
+    secret = secrets.token_bytes(32)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secret)
+        f.flush()
+        os.fsync(f.fileno())
+    return secret
+
+
+class VoterTokens:
+    def __init__(self, limit: int = DEFAULT_LIMIT, period: float = DEFAULT_PERIOD,
+                 max_clients: int = MAX_CLIENTS):
+        self.limit = limit
+        self.period = period
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        # секрет читается при первой метке, а не при импорте
+        self._secret: Optional[bytes] = None
+        # адрес -> [начало окна, выдано меток в окне]
+        self._issued: Dict[str, List[float]] = {}
+        self.rejected = 0
+
+    # новая метка для клиента с адресом host или None сверх лимита
+    def issue(self, host: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            window = self._issued.get(host)
+            if window is None or now - window[0] >= self.period:
+                if len(self._issued) >= self.max_clients:
+                    self._expire(now)
+                window = self._issued[host] = [now, 0]
+            if window[1] >= self.limit:
+                self.rejected += 1
+                return None
+            window[1] += 1
+        token_id = secrets.token_urlsafe(16)
+        return f'{token_id}.{self._sign(token_id)}'
+
+    # id метки, если подпись верна, иначе None
+    def verify(self, token: str) -> Optional[str]:
+        token_id, _, signature = token.partition('.')
+        expected = self._sign(token_id).encode('ascii')
+        if not token_id or not hmac.compare_digest(signature.encode('utf-8'), expected):
+            return None
+        return token_id
+
+    def _sign(self, token_id: str) -> str:
+        if self._secret is None:
+            self._secret = load_secret()
+        digest = hmac.new(self._secret, token_id.encode('utf-8'), hashlib.sha256).digest()
+        return _b64(digest[:SIGNATURE_BYTES])
+
+    def _expire(self, now: float):
+        self._issued = {
+            host: window for host, window in self._issued.items() if now - window[0] < self.period
+        }
+        # все окна свежие - сбрасываем счет целиком, чтобы память не росла
+        if len(self._issued) >= self.max_clients:
+            self._issued.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'clients': len(self._issued), 'rejected': self.rejected}
+
+
+# BLOG_VOTER_TOKENS - сколько новых меток в час выдается одному адресу
+voter_tokens = VoterTokens(limit=int(os.environ.get('BLOG_VOTER_TOKENS', str(DEFAULT_LIMIT))))
@@ -0,0 +1,79 @@
+import hashlib
+from typing import Iterable, List, Tuple
+
+# Кто уже голосовал за пост (JSON-хранилище): таблица ячеек фиксированного
+# размера, по байту на ячейку. Ячейка выбирается хешем (id поста,
+# голосующий); в младших двух битах голос (NONE, LIKE, DISLIKE), в старших
+# шести - еще шесть бит того же хеша (метка), по ним различаются
+# голосующие, попавшие в одну ячейку.
+#
+# Память не зависит от числа голосующих: 16 млн ячеек - 16 МБ. Цена -
+# ошибки при заполненной таблице:
+#   - новый голос попал в занятую ячейку с другой меткой - ячейка переходит
+#     к нему, и прежний голосующий сможет проголосовать за свой пост снова;
+#   - совпала и метка (1/64 таких случаев) - голос примется за повторный
+#     или за смену голоса, поэтому счетчики не уменьшаются ниже нуля.
+# У удаленных постов ячейки не чистятся: id не переиспользуются, ячейки
+# просто займут новые голоса.
+#
+# В снапшот (voters_data.bin) переписываются только страницы по PAGE_SIZE
+# ячеек, измененные с прошлой записи, а не вся таблица, и только после
+# снапшота постов со счетчиками этих голосов (Storage._save_posts_to_file).
+
+NONE = 0
+LIKE = 1
+DISLIKE = 2
+# поле счетчика поста -> голос и обратно
+VOTES = {'likes': LIKE, 'dislikes': DISLIKE}
+FIELDS = {LIKE: 'likes', DISLIKE: 'dislikes'}
+
+DEFAULT_SLOTS = 1 << 24
+VOTE_MASK = 0b11
+TAG_SHIFT = 58
+PAGE_SIZE = 4096
+
+
+class VoterSlots:
+    def __init__(self, size: int = DEFAULT_SLOTS, slots: bytearray = None):
+        self.slots = slots if slots is not None else bytearray(size)
+        self.size = len(self.slots)
+        # номера страниц, измененных с последней записи в снапшот
+        self.dirty = set()
+
+    # (номер ячейки, метка) голоса voter за пост post_id
+    def locate(self, post_id: int, voter: bytes) -> Tuple[int, int]:
+        digest = hashlib.blake2b(post_id.to_bytes(8, 'little') + voter, digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        return value % self.size, (value >> TAG_SHIFT) << 2
+
+    # голос в ячейке, если она принадлежит этой метке
+    def get(self, index: int, tag: int) -> int:
+        value = self.slots[index]
+        if value & ~VOTE_MASK != tag:
+            return NONE
+        return value & VOTE_MASK
+
+    # значение ячейки для голоса; оно же пишется в журнал
+    @staticmethod
+    def pack(tag: int, vote: int) -> int:
+        return tag | vote
+
+    def set(self, index: int, value: int):
+        self.slots[index] = value
+        self.dirty.add(index // PAGE_SIZE)
+
+    # номера измененных страниц; после этого они больше не числятся
+    # измененными - при неудачной записи их нужно вернуть (mark_dirty)
+    def take_dirty(self) -> List[int]:
+        pages = sorted(self.dirty)
+        self.dirty.clear()
+        return pages
+
+    def page(self, number: int) -> bytes:
+        return bytes(self.slots[number * PAGE_SIZE:(number + 1) * PAGE_SIZE])
+
+    def mark_dirty(self, pages: Iterable[int]):
+        self.dirty.update(pages)
+
+    def used(self) -> int:
+        return self.size - self.slots.count(0)
@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+from metrics import WAL_BYTES, WAL_FSYNC_LATENCY
+
+
+# Сбросить на диск запись каталога, в котором лежит path: после
+# os.replace или создания файла новое имя иначе может не пережить сбой.
+# На Windows каталог так не открыть, там этим занимается сама ФС.
+def fsync_dir(path: str):
+    if os.name == 'nt':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Журнал изменений (write-ahead log).
+# Каждая мутация дописывается в конец файла одной компактной JSON-строкой.
+# Запросы только кладут запись в очередь в памяти, а отдельный поток-писатель
+# забирает всю накопившуюся пачку, кодирует ее в JSON, пишет одним вызовом
+# и делает один fsync на пачку. Он же периодически сворачивает журнал
+# в снапшот (обычный JSON-файл с данными).
+#
+# Записи журнала содержат полное состояние объекта ("put") или его удаление
+# ("delete"), поэтому повторное применение записи ничего не ломает.
+# Благодаря этому:
+#   - несколько записей про один объект в очереди схлопываются в последнюю;
+#   - снапшот можно снимать без остановки записи: если он захватит более
+#     свежее состояние, чем точка ротации журнала, последующие записи
+#     приведут данные к тому же итогу.
+#
+# Снапшот переписывает файл целиком, поэтому сворачивать журнал имеет смысл
+# не чаще, чем он дорастает до размера снапшота: иначе массовый импорт
+# превращается в квадратичную запись. Если задан interval, журнал с
+# записями сворачивается и по времени - не реже раза в interval секунд,
+# чтобы при перезапуске доигрывать пришлось немного.
+class WriteAheadLog:
+    def __init__(
+        self,
+        path: str,
+        snapshot: Callable[[], Optional[int]],
+        compact_every: int = 1000,
+        interval: Optional[float] = None,
+    ):
+        self.path = path
+        self.old_path = path + '.old'
+        self.snapshot = snapshot
+        self.compact_every = compact_every
+        self.interval = interval
+        self._last_snapshot = time.monotonic()
+        self._cond = threading.Condition()
+        # ключ -> запись (dict или функция, которая его построит)
+        self._pending: Dict[Hashable, Any] = {}
+        self._seq = 0
+        self._durable = 0
+        self._records = 0
+        # порог компактизации: не меньше compact_every и размера снапшота
+        self._threshold = compact_every
+        self._held = 0
+        self._compact_requested = False
+        self._compactions = 0
+        self._file = None
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    # поставить запись в очередь; запись про тот же ключ заменяет предыдущую
+    def append(self, key: Hashable, record):
+        with self._cond:
+            if self._thread is None:
+                self._start()
+            self._pending.pop(key, None)
+            self._pending[key] = record
+            self._seq += 1
+            self._cond.notify_all()
+
+    # придержать запись: пока блок выполняется, поток-писатель копит
+    # очередь, а после выхода пишет ее одной пачкой с одним fsync.
+    # Внутри блока нельзя вызывать flush - он будет ждать выхода из блока.
+    @contextmanager
+    def hold(self):
+        with self._cond:
+            self._held += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._held -= 1
+                self._cond.notify_all()
+
+    # дождаться, пока все поставленные записи окажутся на диске
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            target = self._seq
+            if self._thread is None:
+                return True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._durable >= target, timeout)
+
+    # прочитать записи журнала (сначала недосвернутые, потом текущие)
+    def replay(self) -> Iterator[dict]:
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # оборванная при сбое последняя строка
+                        break
+
+    # свернуть журнал в снапшот и дождаться окончания
+    def compact(self):
+        with self._cond:
+            if self._thread is None:
+                self._start()
+            done = self._compactions + 1
+            self._compact_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._compactions >= done)
+
+    # сбросить очередь на диск и остановить поток-писатель; со snapshot=True
+    # журнал перед этим сворачивается, если в нем что-то есть, и следующий
+    # запуск читает только снапшот
+    def close(self, snapshot: bool = False):
+        if snapshot:
+            self.flush()
+            if os.path.exists(self.path) or os.path.exists(self.old_path):
+                self.compact()
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stop = True
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join()
+        with self._cond:
+            self._thread = None
+            self._stop = False
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._writer, name=f'wal:{self.path}', daemon=True
+        )
+        self._thread.start()
+
+    # пора ли свернуть журнал по времени; внутри hold() не сворачиваем,
+    # чтобы не разрывать пачку
+    def _snapshot_due(self) -> bool:
+        return (self.interval is not None and self._records > 0 and not self._held
+                and time.monotonic() - self._last_snapshot >= self.interval)
+
+    # сколько ждать до свертки по времени (None - ждать только записей)
+    def _snapshot_wait(self) -> Optional[float]:
+        if self.interval is None or not self._records or self._held:
+            return None
+        return max(0.0, self.interval - (time.monotonic() - self._last_snapshot))
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (self._pending and not self._held)
+                    or self._compact_requested or self._stop or self._snapshot_due(),
+                    self._snapshot_wait()
+                )
+                due = self._snapshot_due()
+                if not self._pending and not self._compact_requested and not due:
+                    if self._stop:
+                        break
+                    continue
+                batch = self._pending
+                self._pending = {}
+                seq = self._seq
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._durable = seq
+                self._records += len(batch)
+                need_compact = self._compact_requested or self._records >= self._threshold or due
+                self._compact_requested = False
+                self._cond.notify_all()
+            if need_compact:
+                # файлом журнала владеет только этот поток
+                try:
+                    self._rotate()
+                    self._snapshot()
+                finally:
+                    with self._cond:
+                        self._compactions += 1
+                        self._cond.notify_all()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch: Dict[Hashable, Any]):
+        lines = []
+        for record in batch.values():
+            if callable(record):
+                record = record()
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        created = self._file is None and not os.path.exists(self.path)
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        self._file.write(data)
+        self._file.flush()
+        started = time.perf_counter()
+        os.fsync(self._file.fileno())
+        if created:
+            fsync_dir(self.path)
+        WAL_FSYNC_LATENCY.observe(time.perf_counter() - started, self.path)
+        WAL_BYTES.inc(self.path, amount=len(data))
+
+    # начать новый файл журнала; старый живет до записи снапшота
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            if os.path.exists(self.old_path):
+                # прошлая компактизация не завершилась - склеиваем
+                with open(self.path, 'r', encoding='utf-8') as src, \
+                        open(self.old_path, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            fsync_dir(self.path)
+        with self._cond:
+            self._records = 0
+
+    def _snapshot(self):
+        written = self.snapshot()
+        self._threshold = max(self.compact_every, written or 0)
+        self._last_snapshot = time.monotonic()
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)